@@ -0,0 +1,148 @@
+# analysis_cache.py
+"""Content-addressed cache for vision-model analyses.
+
+Entries are keyed on a hash of the decoded image bytes plus the model ID and
+prompt, so the same image sent to the same model with the same prompt is only
+analyzed once no matter which endpoint asks for it.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def image_content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def analysis_cache_key(model_id, prompt_text, *image_hashes):
+    digest = hashlib.sha256()
+    for part in (model_id, prompt_text, *image_hashes):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class InMemoryCache:
+    """Thread-safe LRU cache with a per-entry TTL, local to this process."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """On-disk cache shared by every worker process pointing at the same file."""
+
+    def __init__(self, path, max_entries=10000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS analysis_cache_last_access ON analysis_cache (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE analysis_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM analysis_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+            )
+            # Evict least recently used entries beyond the size limit
+            self._conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                " SELECT key FROM analysis_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis_cache")
+            self._conn.commit()
+
+
+def create_cache_from_env(default_dir):
+    """Build the cache backend selected by the ANALYSIS_CACHE_* environment variables."""
+    # SQLite by default: a file shared by every worker process, so an analysis
+    # computed by one gunicorn worker is a hit on all of them
+    backend = os.environ.get("ANALYSIS_CACHE_BACKEND", "sqlite").lower()
+    ttl_seconds = int(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    max_entries = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", 1024))
+
+    if backend == "memory":
+        return InMemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        path = os.environ.get(
+            "ANALYSIS_CACHE_PATH", os.path.join(default_dir, "analysis_cache.sqlite3")
+        )
+        return SQLiteCache(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    raise RuntimeError(
+        f"Unknown ANALYSIS_CACHE_BACKEND '{backend}'. Expected 'memory' or 'sqlite'."
+    )
@@ -1,70 +1,682 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, render_template, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from PIL import Image
-import io
-import base64
 import os
-from openai import OpenAI, APIError
+import json
+import queue
+import threading
+import time
+from functools import partial
+from openai import APIError, APIConnectionError, APIStatusError, BadRequestError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from analysis_cache import analysis_cache_key, create_cache_from_env, image_content_hash
+from image_processing import data_url_to_bytes, normalize_images
+from jobs import JOB_FAILED, JOB_SUCCEEDED, JobQueue, JobStore
+from blob_store import BlobStore, BlobNotFoundError, BlobTooLargeError
+from chat_context import ChatContextManager, render_transcript
+from batch_inspection import (
+    ManifestError, combine_decisions, decision_counts, extract_payment_decision, parse_manifest,
+    render_summary_csv, render_summary_jsonl, summary_row,
+)
+from task_verification import (
+    STATUS_LABELS, STATUS_NOT_COMPLETED, STATUS_UNVERIFIED, VERDICT_RESPONSE_FORMATS, TaskVerificationStore,
+    VerdictStreamParser, assemble_final_report, normalize_task,
+)
+from llm_client import LLMClient, LLMUnavailableError, parse_model_settings
+from resources import per_process
+from metrics import finish_trace, record_llm_call, render_gauge, render_metrics, span, start_trace, submit_in_context, trace
 
-app = Flask(__name__)
-CORS(app, origins=["http://localhost:5173", "https://cotterslist.com"])
+# Routes live on this blueprint; create_app() (at the end of this file) builds the app.
+# Clients, pools and stores below are created per process on first use (see
+# resources.py), so importing this module stays cheap and fork-safe.
+bp = Blueprint("garden", __name__)
 
 # --- API Configuration ---
+# Checked when the LLM client is first needed: without a key the app still starts,
+# /readyz reports not ready and model-backed endpoints answer 503.
 NRP_API_KEY = os.environ.get("NRP_API_KEY")
 
-if not NRP_API_KEY:
-    raise RuntimeError(
-        "API Key not found. Please set the NRP_API_KEY environment variable. "
-        "Example: export NRP_API_KEY='your_key_here'"
+# Override to point at another OpenAI-compatible server, e.g. bench/mock_llm_server.py
+BASE_URL = os.environ.get("NRP_BASE_URL", "https://llm.nrp-nautilus.io/v1")
+
+LLAVA_MODEL_ID = "llava-onevision"
+TEXT_LLM_MODEL_ID = "llama3" 
+
+# All completion calls share one pooled client with timeouts, retries with
+# jittered backoff, per-model concurrency/rate limits and circuit breaking.
+#   LLM_MODEL_CONCURRENCY="llava-onevision=4,llama3=8"  max in-flight calls per model
+#   LLM_RATE_LIMITS="llava-onevision=2:5"               requests/second[:burst] per model
+@per_process
+def get_llm_client():
+    if not NRP_API_KEY:
+        raise LLMUnavailableError(
+            "API Key not found. Please set the NRP_API_KEY environment variable. "
+            "Example: export NRP_API_KEY='your_key_here'"
+        )
+    llm_client = LLMClient(
+        api_key=NRP_API_KEY,
+        base_url=BASE_URL,
+        timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", 120)),
+        connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", 10)),
+        max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 32)),
+        max_keepalive_connections=int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 16)),
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+        concurrency_limits=parse_model_settings(
+            os.environ.get("LLM_MODEL_CONCURRENCY", f"{LLAVA_MODEL_ID}=4,{TEXT_LLM_MODEL_ID}=8")
+        ),
+        rate_limits=parse_model_settings(os.environ.get("LLM_RATE_LIMITS", "")),
+        rate_limit_timeout=float(os.environ.get("LLM_RATE_LIMIT_TIMEOUT_SECONDS", 30)),
+        circuit_failure_threshold=int(os.environ.get("LLM_CIRCUIT_FAILURE_THRESHOLD", 5)),
+        circuit_reset_seconds=float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", 30)),
     )
+    # Every call's latency, outcome and token counts feed /metrics and the request trace
+    llm_client.add_listener(record_llm_call)
+    return llm_client
+
+# --- Local Storage Configuration ---
+DATA_DIR = os.environ.get("GARDEN_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance"))
 
-BASE_URL = "https://llm.nrp-nautilus.io/v1"
-client = OpenAI(
-    api_key=NRP_API_KEY,
-    base_url=BASE_URL
+# Uploaded images are stored content-addressed on disk and referenced by ID
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+
+@per_process
+def get_blob_store():
+    return BlobStore(os.path.join(DATA_DIR, "images"), max_bytes=MAX_UPLOAD_BYTES)
+
+# Vision analyses are cached by image content, model and prompt so the same
+# 'before' image is only sent to LLaVA once per project.
+@per_process
+def get_analysis_cache():
+    return create_cache_from_env(DATA_DIR)
+
+# --- LLM Execution Configuration ---
+# Independent model calls within one request (e.g. 'before' analysis and 'after'
+# verification) are fanned out on this pool. Set CHAINED_VERIFICATION_CONTEXT=1
+# to run them one after the other and feed the generated 'before' description
+# into the verification prompt instead of sending both images. Endpoints that
+# accept only one image per request (e.g. vLLM's default limit_mm_per_prompt)
+# reject the two-image request with a 400; the request is then redone in chained
+# mode, and the process stays in chained mode from then on.
+LLM_WORKERS = int(os.environ.get("LLM_WORKERS", 8))
+CHAINED_VERIFICATION_CONTEXT = os.environ.get("CHAINED_VERIFICATION_CONTEXT", "0").lower() in ("1", "true", "yes")
+
+@per_process
+def get_llm_executor():
+    return ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-call")
+
+# 'After' photos are compared locally with the 'before' photo first (see
+# image_diff.py). With IMAGE_DIFF_PREFILTER on, a near-identical pair gets a
+# "no change" verification without calling LLaVA.
+IMAGE_DIFF_PREFILTER = os.environ.get("IMAGE_DIFF_PREFILTER", "1").lower() in ("1", "true", "yes")
+
+# --- Shared Prompts ---
+BEFORE_DESCRIPTION_PROMPT = (
+    "You are a professional landscape designer and inspector. "
+    "Analyze the 'before' image provided. Describe in detail the current state "
+    "of the lawn, garden beds, and any bare dirt areas. "
+    "Focus on: plant health, presence of weeds, soil condition (if visible), "
+    "existing landscaping features, and any visible signs of neglect or areas "
+    "that clearly need work. "
+    "Provide a bulleted list of potential landscaping projects that seem necessary or could enhance the space based on this image. "
+    "Maintain a neutral, professional tone."
 )
 
-LLAVA_MODEL_ID = "llava-onevision"
-TEXT_LLM_MODEL_ID = "llama3" 
+# --- Initial Report Sections (shared by the JSON and streaming endpoints) ---
+BEFORE_SECTION_HEADER = "\n### 1. Before Image Analysis (Current State)\n"
+TASKS_SECTION_HEADER = "\n### 2. Requested Tasks (from your list)\n"
+VERIFICATION_SECTION_HEADER = "\n### 3. Initial Task Verification (Based on After Image Provided)\n"
+NO_AFTER_IMAGE_SECTION_HEADER = "\n### 3. Initial Task Verification (After Image Not Provided Yet)\n"
+NO_AFTER_IMAGE_SECTION_TEXT = "Please upload 'After Image(s)' in Block 2 and generate the Final Report in Block 3 for task verification."
+
+def initial_report_title():
+    return (
+        "--- Initial Landscaping Project Report ---\n"
+        f"**Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S CDT')}**\n"
+    )
+
+def build_verification_prompt(requested_tasks_text, contractor_accomplishments_text, before_analysis=None):
+    """Prompt for the initial task verification.
+
+    With ``before_analysis`` the 'before' state is given as text and only the 'after'
+    image is attached; without it both images are attached, 'before' first.
+    """
+    if before_analysis is not None:
+        inputs_text = (
+            "I will provide an 'after' image (the current state) and descriptions of the "
+            "original 'before' state and the requested tasks. "
+        )
+        before_text = f"Here is a description of the 'before' (initial) state:\n{before_analysis}\n\n"
+        compare_text = "to the provided 'before' state description, the requested tasks, and the contractor's statement. "
+    else:
+        inputs_text = (
+            "I will provide two images: the first shows the original 'before' state and the second "
+            "is the 'after' image (the current state), along with the requested tasks. "
+        )
+        before_text = ""
+        compare_text = "to the first ('before') image, the requested tasks, and the contractor's statement. "
+
+    return (
+        "You are a meticulous landscape project manager focused on quality assurance. "
+        "You need to verify if landscaping tasks have been completed by a contractor. "
+        f"{inputs_text}"
+        "Also, the contractor has provided the following statement about their accomplishments: "
+        f"'{contractor_accomplishments_text}'\n\n"
+
+        f"{before_text}"
+        f"Here are the requested tasks:\n{requested_tasks_text}\n\n"
+
+        "Compare the *current image* (the 'after' image you are analyzing now) "
+        f"{compare_text}"
+        "For each task, clearly state its completion status based on the visual evidence "
+        "in the *current image*. "
+        "If a task is *not* completed, describe precisely what is still missing or what needs to be done. "
+        "If a task is completed, briefly describe the visual evidence confirming its completion. "
+        "Present your findings in a clear, concise, bulleted checklist format, one bullet point per task.\n\n"
+        "Example Format:\n"
+        "- Task: Install new rose garden\n  Status: Completed. New rose bushes are visible with fresh mulch in the designated area.\n"
+        "- Task: Lay sod in bare area\n  Status: Not completed. The bare dirt area still shows dirt and weeds; new sod has not been laid.\n"
+        "- Task: Trim bushes\n  Status: Partially completed. Some bushes appear trimmed, but the large hedge near the fence is still overgrown.\n\n"
+        "Now, analyze the *current 'after' image* and verify the tasks:"
+    )
+
+def build_final_verification_prompt(all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list, before_analysis=None):
+    """Prompt for the final verification and payment decision (see build_verification_prompt for ``before_analysis``)."""
+    # Convert contractor's selected tasks into a readable string
+    contractor_selected_tasks_str = "\n".join([f"- {task}" for task in contractor_selected_tasks_list]) if contractor_selected_tasks_list else "None specified by contractor."
+
+    if before_analysis is not None:
+        before_text = f"1. Description of the 'before' state: {before_analysis}\n"
+        image_text = "Based on the *current 'after' image* you are analyzing, "
+    else:
+        before_text = "1. The 'before' state: shown in the first image provided.\n"
+        image_text = "Based on the *current 'after' image* (the second image provided), "
+
+    return (
+        "You are a strict, but reasonable, landscaping project quality assurance auditor. "
+        "Your goal is to provide a final decision on whether a contractor's work meets requirements for payment validation. "
+        "You must consider the *spirit and intent* of the requested tasks, allowing for common and functionally equivalent material substitutions "
+        "unless the original request *explicitly* specified a unique or non-substitutable material. "
+        "If a material is substituted, note it, but only mark the task as 'Not Completed' if the substitution fundamentally alters the task's purpose, functionality, or significantly degrades quality/aesthetics in the context of general landscaping. "
+        "If there's a minor material substitution that achieves the same purpose (e.g., bricks instead of rocks for a border, unless specific rock type was crucial), consider it 'Completed' but note the substitution. "
+        "If the request was for 'rocks' and 'bricks' were used, acknowledge the substitution but if the border is functional and aesthetic, you might consider it 'Completed (with material substitution)' unless explicitly instructed otherwise or there's a clear negative impact."
+        "I will provide:\n"
+        f"{before_text}"
+        f"2. All originally requested tasks: {all_requested_tasks_text}\n"
+        f"3. Contractor's self-reported accomplishments: {contractor_accomplishments_text if contractor_accomplishments_text else 'N/A'}\n"
+        f"4. Specific tasks the contractor claims they completed: {contractor_selected_tasks_str}\n\n"
+        f"{image_text}and all the provided textual context, perform the following steps:\n"
+        "A. **VERIFY ALL REQUESTED TASKS:** Go through 'All originally requested tasks' one by one. For each task, visually inspect the 'after' image. State whether it is 'Completed', 'Partially Completed', or 'Not Completed'. "
+        "If there's a material substitution, indicate 'Completed (with material substitution)' or 'Partially Completed (with material substitution)' and specify the substitution. "
+        "Provide brief visual evidence for your assessment. Use a bulleted list for each task.\n"
+        "B. **COMPARE TO CONTRACTOR'S CLAIM:** Briefly comment on whether the contractor's self-reported accomplishments align with your visual verification, specifically noting any claimed tasks that appear incomplete or any unrequested work that was done.\n"
+        "C. **PAYMENT VALIDATION DECISION:** Based on your thorough verification of ALL originally requested tasks, and considering the flexibility for material substitution as described, provide a clear decision: 'Meets Requirements for Payment', 'Partially Meets Requirements - Further Action Needed', or 'Does Not Meet Requirements - Payment Withheld'. Justify your decision with specific reasons related to uncompleted, unsatisfactory, or fundamentally altered tasks.\n\n"
+        "Present your response clearly, with sections A, B, and C as described."
+    )
+
+def build_task_verification_prompt(tasks, claimed_flags, contractor_accomplishments_text, before_analysis=None):
+    """Prompt for structured per-task verdicts on ``tasks`` (see task_verification.VERDICT_SCHEMA)."""
+    task_lines = "\n".join(
+        f"{number}. {task}{' (the contractor claims this task is completed)' if claimed else ''}"
+        for number, (task, claimed) in enumerate(zip(tasks, claimed_flags), start=1)
+    )
+    if before_analysis is not None:
+        before_text = f"Description of the 'before' state: {before_analysis}\n"
+        image_text = "Inspect the *current 'after' image* you are analyzing"
+    else:
+        before_text = "The 'before' state is shown in the first image provided.\n"
+        image_text = "Inspect the *current 'after' image* (the second image provided)"
+
+    return (
+        "You are a strict, but reasonable, landscaping project quality assurance auditor verifying a contractor's work for payment. "
+        "Consider the *spirit and intent* of each task and allow common, functionally equivalent material substitutions "
+        "unless the task explicitly specifies a unique or non-substitutable material. "
+        "Only treat a substitution as not completing the task if it fundamentally alters the task's purpose, functionality, or significantly degrades quality.\n"
+        f"{before_text}"
+        f"Contractor's self-reported accomplishments: {contractor_accomplishments_text if contractor_accomplishments_text else 'N/A'}\n\n"
+        f"Tasks to verify:\n{task_lines}\n\n"
+        f"{image_text} and give one verdict per task above, using its number as task_number. "
+        "status is one of: completed, completed_with_substitution, partially_completed, partially_completed_with_substitution, "
+        "not_completed, or not_visible (the part of the property the task concerns is not shown). "
+        "evidence is one or two sentences of visual evidence. material_substitution names the substitution, or is null.\n"
+        "Respond only with JSON of the form "
+        '{"tasks": [{"task_number": 1, "status": "completed", "evidence": "...", "material_substitution": null}]}.'
+    )
+
+# --- No-Change Reports (used instead of a model call when nothing changed) ---
+def requested_task_names(requested_tasks_text):
+    names = [line.strip().lstrip("-*•").strip() for line in requested_tasks_text.splitlines()]
+    return [name for name in names if name]
+
+def describe_no_change(change_evidence):
+    if change_evidence["identical"]:
+        return "The 'after' photo is the same image as the 'before' photo."
+    return (
+        "The 'after' photo is visually indistinguishable from the 'before' photo "
+        f"(perceptual hash distance {change_evidence['phash_distance']}/64, "
+        f"largest regional difference {change_evidence['max_region_difference']:.1%})."
+    )
+
+def build_no_change_verification_report(requested_tasks_text, change_evidence):
+    task_lines = [
+        f"- Task: {task}\n  Status: Not completed. No visible change from the 'before' photo."
+        for task in requested_task_names(requested_tasks_text)
+    ]
+    return (
+        f"{describe_no_change(change_evidence)} No work can be verified from it; "
+        "please upload a photo taken after the work was done.\n\n" + "\n".join(task_lines)
+    )
+
+def build_no_change_final_report(all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list, change_evidence):
+    task_lines = "\n".join(
+        f"- {task}: Not Completed. The 'after' photo shows no change from the 'before' photo."
+        for task in requested_task_names(all_requested_tasks_text)
+    )
+    if contractor_accomplishments_text or contractor_selected_tasks_list:
+        comparison_text = "None of the contractor's reported work is visible: the 'after' photo matches the 'before' photo."
+    else:
+        comparison_text = "The contractor did not report any completed work."
+    return (
+        f"A. **VERIFY ALL REQUESTED TASKS:**\n{task_lines}\n\n"
+        f"B. **COMPARE TO CONTRACTOR'S CLAIM:**\n{comparison_text}\n\n"
+        "C. **PAYMENT VALIDATION DECISION:** Does Not Meet Requirements - Payment Withheld.\n"
+        f"{describe_no_change(change_evidence)} Please upload a photo taken after the work was done."
+    )
 
 # --- Helper Functions ---
-def pil_to_base64_data_url(pil_image, format="PNG"):
-    buffered = io.BytesIO()
-    pil_image.save(buffered, format=format)
-    return f"data:image/{format.lower()};base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+class InvalidRequestError(Exception):
+    """Raised for missing or malformed request inputs; reported to the client as a 400."""
+
+def has_image(data, field):
+    """Whether ``field`` was sent either as a data URL or as an uploaded ``<field>_id``."""
+    return bool(data.get(field) or data.get(f"{field}_id"))
+
+def load_request_image(data, field):
+    """Return the image for ``field``: raw bytes from the blob store when sent as an ID, else the data URL (or None)."""
+    image_id = data.get(f"{field}_id")
+    if image_id:
+        try:
+            return get_blob_store().load_bytes(image_id)
+        except BlobNotFoundError as e:
+            raise InvalidRequestError(str(e))
+    return data.get(field)
+
+def normalize_request_images(data, *fields):
+    return normalize_images(*(load_request_image(data, field) for field in fields))
 
-def base64_data_url_to_pil(data_url):
-    header, encoded = data_url.split(",", 1)
-    data = base64.b64decode(encoded)
-    return Image.open(io.BytesIO(data)).convert("RGB")
+def compare_before_after(before_image_data_url, after_image_data_url):
+    """Change evidence for a normalized image pair (None without an 'after' image)."""
+    if not after_image_data_url:
+        return None
+    # Imported on first use: NumPy is only needed once 'after' photos arrive
+    from image_diff import compare_images
 
-def build_messages_with_image(prompt_text, image_data_url=None, context_messages=None):
+    with span("image_diff"):
+        return compare_images(before_image_data_url, after_image_data_url)
+
+def is_no_change(change_evidence):
+    return IMAGE_DIFF_PREFILTER and change_evidence is not None and change_evidence["near_identical"]
+
+def build_messages_with_image(prompt_text, image_data_url=None, context_messages=None, extra_image_data_urls=None):
     messages = []
     if context_messages:
         for msg in context_messages:
             messages.append({"role": msg['role'], "content": msg['content']})
 
     user_content = [{"type": "text", "text": prompt_text}]
-    if image_data_url:
-        user_content.append({"type": "image_url", "image_url": {"url": image_data_url}})
+    for url in [image_data_url, *(extra_image_data_urls or [])]:
+        if url:
+            user_content.append({"type": "image_url", "image_url": {"url": url}})
     
     messages.append({"role": "user", "content": user_content})
     return messages
 
+def vision_completion(prompt_text, image_data_urls, max_tokens, temperature, model_id=LLAVA_MODEL_ID):
+    """Send a prompt with the given images (in order) and return the reply text."""
+    response = get_llm_client().create(
+        model=model_id,
+        messages=build_messages_with_image(prompt_text, image_data_urls[0], extra_image_data_urls=image_data_urls[1:]),
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return response.choices[0].message.content
+
+def vision_cache_key(prompt_text, image_data_url, model_id=LLAVA_MODEL_ID):
+    return analysis_cache_key(model_id, prompt_text, image_content_hash(data_url_to_bytes(image_data_url)))
+
+def cached_vision_completion(prompt_text, image_data_url, max_tokens, temperature, model_id=LLAVA_MODEL_ID):
+    """Run a single-image vision prompt, reusing a cached answer for identical image bytes."""
+    cache_key = vision_cache_key(prompt_text, image_data_url, model_id)
+    cached_content = get_analysis_cache().get(cache_key)
+    if cached_content is not None:
+        print(f"Analysis cache hit for {model_id} ({cache_key[:12]}).")
+        return cached_content
+
+    content = vision_completion(prompt_text, [image_data_url], max_tokens, temperature, model_id)
+    get_analysis_cache().set(cache_key, content)
+    return content
+
+def describe_before_image(before_image_data_url):
+    return cached_vision_completion(BEFORE_DESCRIPTION_PROMPT, before_image_data_url, max_tokens=1000, temperature=0.7)
+
+_multi_image_rejected = threading.Event()
+
+def note_multi_image_rejected(error):
+    if not _multi_image_rejected.is_set():
+        print(f"Endpoint rejected a request with both images ({error}); using chained context from now on.")
+    _multi_image_rejected.set()
+
+def use_chained_context(data):
+    """Whether verification should wait for the 'before' description instead of running alongside it."""
+    if _multi_image_rejected.is_set():
+        return True
+    chained = data.get('chained_context')
+    return CHAINED_VERIFICATION_CONTEXT if chained is None else bool(chained)
+
+def verify_with_both_images(build_prompt, before_image_data_url, after_image_data_url, max_tokens, temperature, before_analysis_future=None):
+    """Verification call that sends both images, redone in chained mode if the endpoint rejects two images.
+
+    ``before_analysis_future`` is a 'before' description already in flight, waited for instead of describing again.
+    """
+    try:
+        return vision_completion(build_prompt(None), [before_image_data_url, after_image_data_url], max_tokens, temperature)
+    except BadRequestError as e:
+        note_multi_image_rejected(e)
+        before_analysis = (before_analysis_future.result() if before_analysis_future is not None
+                           else describe_before_image(before_image_data_url))
+        return vision_completion(build_prompt(before_analysis), [after_image_data_url], max_tokens, temperature)
+
+def describe_and_verify(before_image_data_url, after_image_data_url, chained, build_prompt, max_tokens, temperature, need_before_analysis=True):
+    """Produce the 'before' description and an 'after' verification report.
+
+    ``build_prompt(before_analysis)`` builds the verification prompt. In chained mode
+    (or when the description is already cached, so chaining is free) the description
+    is fed into the prompt; otherwise both calls run concurrently and the verification
+    call receives both images. Callers that only need the verification can pass
+    ``need_before_analysis=False`` to skip describing an uncached 'before' image.
+    """
+    cached_before_analysis = get_analysis_cache().get(vision_cache_key(BEFORE_DESCRIPTION_PROMPT, before_image_data_url))
+    if chained or cached_before_analysis is not None:
+        before_analysis = cached_before_analysis or describe_before_image(before_image_data_url)
+        verification = vision_completion(build_prompt(before_analysis), [after_image_data_url], max_tokens, temperature)
+        return before_analysis, verification
+
+    if not need_before_analysis:
+        return None, verify_with_both_images(build_prompt, before_image_data_url, after_image_data_url, max_tokens, temperature)
+
+    before_future = submit_in_context(get_llm_executor(), describe_before_image, before_image_data_url)
+    verification_future = submit_in_context(
+        get_llm_executor(), verify_with_both_images, build_prompt, before_image_data_url, after_image_data_url,
+        max_tokens, temperature, before_future,
+    )
+    return before_future.result(), verification_future.result()
+
+
+# --- Streaming Helpers ---
+def format_api_error(e):
+    return f"API Error: {getattr(e, 'status_code', 'N/A')} - {e.response.json() if getattr(e, 'response', None) else str(e)}"
+
+def api_error_status(e):
+    """HTTP status for an upstream error that survived the client's retries."""
+    if isinstance(e, APIConnectionError) or (isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500)):
+        return 502
+    return 500
+
+def json_response(payload):
+    with span("serialization"):
+        return jsonify(payload)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        # Stop proxies (e.g. nginx) from buffering the stream until it ends
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def stream_completion(model_id, messages, max_tokens, temperature, usage=None, **kwargs):
+    """Yield reply text chunks as the model generates them.
+
+    If ``usage`` is a dict, the prompt/completion token counts reported at the
+    end of the stream are stored in it. Other keyword arguments (e.g.
+    ``response_format``) are passed on to the completion call.
+    """
+    stream = get_llm_client().stream(
+        model=model_id,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream_options={"include_usage": True},
+        **kwargs,
+    )
+    for chunk in stream:
+        if usage is not None and getattr(chunk, "usage", None):
+            usage["prompt_tokens"] = chunk.usage.prompt_tokens
+            usage["completion_tokens"] = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_vision_completion(prompt_text, image_data_urls, max_tokens, temperature, model_id=LLAVA_MODEL_ID):
+    messages = build_messages_with_image(prompt_text, image_data_urls[0], extra_image_data_urls=image_data_urls[1:])
+    return stream_completion(model_id, messages, max_tokens, temperature)
+
+def stream_before_description(before_image_data_url):
+    """Stream the 'before' description, serving it whole from the cache when possible."""
+    cache_key = vision_cache_key(BEFORE_DESCRIPTION_PROMPT, before_image_data_url)
+    cached_content = get_analysis_cache().get(cache_key)
+    if cached_content is not None:
+        print(f"Analysis cache hit for {LLAVA_MODEL_ID} ({cache_key[:12]}).")
+        yield cached_content
+        return
+
+    chunks = []
+    for text in stream_vision_completion(BEFORE_DESCRIPTION_PROMPT, [before_image_data_url], max_tokens=1000, temperature=0.7):
+        chunks.append(text)
+        yield text
+    get_analysis_cache().set(cache_key, "".join(chunks))
+
+def stream_verification(build_prompt, before_image_data_url, after_image_data_url, before_analysis, max_tokens, temperature):
+    """Stream a verification reply.
+
+    Without a 'before' description both images are sent; if the endpoint rejects
+    that, the description is generated and the verification redone with the
+    'after' image only (see verify_with_both_images).
+    """
+    if before_analysis is not None:
+        yield from stream_vision_completion(build_prompt(before_analysis), [after_image_data_url], max_tokens, temperature)
+        return
+    received = False
+    try:
+        for text in stream_vision_completion(build_prompt(None), [before_image_data_url, after_image_data_url], max_tokens, temperature):
+            received = True
+            yield text
+    except BadRequestError as e:
+        if received:
+            raise
+        note_multi_image_rejected(e)
+        before_analysis = describe_before_image(before_image_data_url)
+        yield from stream_vision_completion(build_prompt(before_analysis), [after_image_data_url], max_tokens, temperature)
+
+_STREAM_END = object()
+
+def prefetch_stream(chunks):
+    """Consume a chunk iterator on the LLM pool, buffering it until the caller is ready to read it."""
+    buffer = queue.Queue()
+
+    def pump():
+        try:
+            for chunk in chunks:
+                buffer.put(chunk)
+        except Exception as e:
+            buffer.put(e)
+        buffer.put(_STREAM_END)
+
+    submit_in_context(get_llm_executor(), pump)
+
+    def drain():
+        while True:
+            item = buffer.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return drain()
+
+# --- Chat Context Management ---
+# Prompt size for chat_query is capped at CHAT_PROMPT_TOKEN_BUDGET. Older turns
+# are folded into a rolling summary written by the cheaper text model.
+CHAT_PROMPT_TOKEN_BUDGET = int(os.environ.get("CHAT_PROMPT_TOKEN_BUDGET", 6000))
+CHAT_KEEP_RECENT_MESSAGES = int(os.environ.get("CHAT_KEEP_RECENT_MESSAGES", 6))
+# Upper bounds on the summarizing one chat request can trigger, whatever history the client sends
+CHAT_MAX_HISTORY_MESSAGES = int(os.environ.get("CHAT_MAX_HISTORY_MESSAGES", 200))
+CHAT_MAX_SUMMARY_CALLS = int(os.environ.get("CHAT_MAX_SUMMARY_CALLS", 2))
+
+CHAT_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a homeowner and an AI landscaping assistant. "
+    "Update the summary with the new messages below. Keep every fact, decision, task detail and open question "
+    "that later answers may depend on; drop greetings and repetition. Reply with the updated summary only, "
+    "in at most 200 words.\n\n"
+)
+
+def summarize_chat_turns(previous_summary, messages):
+    prompt_text = (
+        CHAT_SUMMARY_PROMPT
+        + (f"Summary so far:\n{previous_summary}\n\n" if previous_summary else "")
+        + f"New messages:\n{render_transcript(messages)}"
+    )
+    cache_key = analysis_cache_key(TEXT_LLM_MODEL_ID, prompt_text)
+    cached_summary = get_analysis_cache().get(cache_key)
+    if cached_summary is not None:
+        return cached_summary
+
+    print(f"Summarizing {len(messages)} older chat messages with {TEXT_LLM_MODEL_ID}...")
+    response = get_llm_client().create(
+        model=TEXT_LLM_MODEL_ID,
+        messages=[{"role": "user", "content": prompt_text}],
+        max_tokens=300,
+        temperature=0.2,
+    )
+    summary = response.choices[0].message.content
+    get_analysis_cache().set(cache_key, summary)
+    return summary
+
+chat_context_manager = ChatContextManager(
+    CHAT_PROMPT_TOKEN_BUDGET, summarize_chat_turns, keep_recent_messages=CHAT_KEEP_RECENT_MESSAGES,
+    max_history_messages=CHAT_MAX_HISTORY_MESSAGES, max_summary_calls=CHAT_MAX_SUMMARY_CALLS,
+)
+
+# --- Background Jobs ---
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# Each worker process refreshes the heartbeat of the jobs it holds; a queued or
+# running job not refreshed for JOB_LOST_AFTER_SECONDS is reported as failed
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 10))
+JOB_LOST_AFTER_SECONDS = float(os.environ.get("JOB_LOST_AFTER_SECONDS", 60))
+
+def describe_job_error(e):
+    if isinstance(e, (LLMUnavailableError, InvalidRequestError)):
+        return str(e)
+    if isinstance(e, APIError):
+        return format_api_error(e)
+    return f"An unexpected error occurred: {str(e)}"
+
+@per_process
+def get_job_queue():
+    return JobQueue(
+        JobStore(os.path.join(DATA_DIR, "jobs.sqlite3"), lost_after_seconds=JOB_LOST_AFTER_SECONDS),
+        max_workers=JOB_WORKERS, format_error=describe_job_error, heartbeat_seconds=JOB_HEARTBEAT_SECONDS,
+    )
+
+# --- Metrics and Tracing ---
+# Each request is traced from before_request until its response is closed (after
+# the last chunk of a streamed body). Stages inside it are timed with ``span`` and exported as
+# histograms at /metrics; TRACE_LOG=0 turns off the per-request JSON span log.
+UNTRACED_ENDPOINTS = ("garden.metrics", "garden.healthz", "garden.readyz")
+
+@bp.before_app_request
+def begin_request_trace():
+    if request.endpoint in UNTRACED_ENDPOINTS:
+        return
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace_token = start_trace(route, request.method)
+    if request.is_json:
+        # Parse the body up front so its cost shows up as its own stage
+        with span("json_parse"):
+            request.get_json(silent=True)
+
+@bp.after_app_request
+def finish_request_trace_on_close(response):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        # Runs once the last chunk of a streamed body has been sent
+        response.call_on_close(partial(finish_trace, token, response.status_code))
+    return response
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    # A scrape should not be what creates the client (or fail without an API key)
+    llm_stats = get_llm_client().stats() if get_llm_client.created() else {}
+    circuit_states = [
+        ((model_id,), int(model_stats["circuit_state"] != "closed"))
+        for model_id, model_stats in sorted(llm_stats.items())
+    ]
+    body = render_metrics(render_gauge(
+        "garden_llm_circuit_open", "1 while a model's circuit breaker is open or half-open.", ("model",), circuit_states,
+    ))
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 # --- Flask Routes ---
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
+# --- Image Upload ---
+@bp.route('/upload_image', methods=['POST'])
+def upload_image():
+    """Store an image on disk and return its content-addressed ID.
+
+    Accepts a multipart form with an 'image' file, or a raw image body
+    (Content-Type: image/*). Either way the bytes are copied to disk in chunks
+    rather than buffered into a JSON payload.
+    """
+    try:
+        if 'image' in request.files:
+            stream = request.files['image'].stream
+        elif request.mimetype.startswith('image/'):
+            stream = request.stream
+        else:
+            return jsonify({"error": "Send the image as a multipart 'image' file or as a raw image/* body."}), 400
+
+        image_id, size = get_blob_store().save_stream(stream)
+        # Normalizing now both rejects non-images and warms the normalization
+        # cache, so the first model call on this image skips the decode.
+        try:
+            normalize_images(get_blob_store().load_bytes(image_id))
+        except Exception:
+            get_blob_store().delete(image_id)
+            return jsonify({"error": "The uploaded file is not a readable image."}), 400
+
+        print(f"Stored uploaded image {image_id[:12]} ({size} bytes).")
+        return jsonify({"image_id": image_id, "bytes": size})
+
+    except BlobTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        print(f"Unexpected error storing uploaded image: {e}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
 # --- NEW ENDPOINT for Suggesting Tasks (Block 1) ---
-@app.route('/suggest_tasks', methods=['POST'])
+@bp.route('/suggest_tasks', methods=['POST'])
 def suggest_tasks():
     try:
         data = request.json
-        before_image_data_url = data['before_image']
+        if not has_image(data, 'before_image'):
+            raise InvalidRequestError("A 'before' image is required to suggest tasks.")
+        before_image_data_url = normalize_request_images(data, 'before_image')[0]
 
         suggest_prompt = (
             "You are an AI landscape designer assistant. "
@@ -76,264 +688,741 @@ def suggest_tasks():
         )
 
         print("Sending 'Before' image for task suggestions to LLaVA-OneVision...")
-        response = client.chat.completions.create(
-            model=LLAVA_MODEL_ID,
-            messages=build_messages_with_image(suggest_prompt, before_image_data_url),
-            max_tokens=500,
-            temperature=0.8,
+        suggested_tasks_text = cached_vision_completion(
+            suggest_prompt, before_image_data_url, max_tokens=500, temperature=0.8,
         )
-        suggested_tasks_text = response.choices[0].message.content
         print(f"Suggested Tasks: {suggested_tasks_text}")
 
-        return jsonify({"suggested_tasks": suggested_tasks_text})
+        return json_response({"suggested_tasks": suggested_tasks_text})
 
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable: {e}")
+        return jsonify({"error": str(e)}), 503
     except APIError as e:
         print(f"API Error suggesting tasks: {e}")
-        return jsonify({"error": f"API Error: {e.status_code} - {e.response.json() if e.response else str(e)}"}), 500
+        return jsonify({"error": format_api_error(e)}), api_error_status(e)
     except Exception as e:
         print(f"Unexpected error suggesting tasks: {e}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
 
-@app.route('/analyze_landscaping', methods=['POST'])
-def analyze_landscaping():
-    try:
-        data = request.json
-        before_image_data_url = data['before_image']
-        # This can now be null if no after image is provided for initial report
-        after_image_data_url = data['after_image'] 
-        requested_tasks_text = data['requested_tasks']
-        contractor_accomplishments_text = data.get('contractor_accomplishments', '') 
-
-        # --- Phase 1: Describe the "Before" Image ---
-        before_description_prompt = (
-            "You are a professional landscape designer and inspector. "
-            "Analyze the 'before' image provided. Describe in detail the current state "
-            "of the lawn, garden beds, and any bare dirt areas. "
-            "Focus on: plant health, presence of weeds, soil condition (if visible), "
-            "existing landscaping features, and any visible signs of neglect or areas "
-            "that clearly need work. "
-            "Provide a bulleted list of potential landscaping projects that seem necessary or could enhance the space based on this image. "
-            "Maintain a neutral, professional tone."
-        )
+def validate_analysis_request(data):
+    if not has_image(data, 'before_image'):
+        raise InvalidRequestError("A 'before' image is required to generate the initial report.")
+    if not data.get('requested_tasks'):
+        raise InvalidRequestError("Requested tasks are required to generate the initial report.")
 
-        print("Sending 'Before' image analysis request to LLaVA-OneVision...")
-        before_response = client.chat.completions.create(
-            model=LLAVA_MODEL_ID,
-            messages=build_messages_with_image(before_description_prompt, before_image_data_url),
-            max_tokens=1000,
-            temperature=0.7,
-        )
-        before_analysis = before_response.choices[0].message.content
-        print("Before Analysis Complete.")
+def run_analyze_landscaping(data):
+    """Build the initial project report. Shared by the JSON endpoint and background jobs."""
+    validate_analysis_request(data)
+    # The after image can be null if no after image is provided for initial report
+    before_image_data_url, after_image_data_url = normalize_request_images(data, 'before_image', 'after_image')
+    requested_tasks_text = data['requested_tasks']
+    contractor_accomplishments_text = data.get('contractor_accomplishments', '') 
 
-        # --- Phase 2: Conditionally Analyze "After" Image and Verify Tasks ---
-        task_verification_report_raw = "N/A - After image not provided for initial report."
-        if after_image_data_url: # Only run verification if after image is present
-            verification_prompt = (
-                "You are a meticulous landscape project manager focused on quality assurance. "
-                "You need to verify if landscaping tasks have been completed by a contractor. "
-                "I will provide an 'after' image (the current state) and descriptions of the "
-                "original 'before' state and the requested tasks. "
-                "Also, the contractor has provided the following statement about their accomplishments: "
-                f"'{contractor_accomplishments_text}'\n\n"
-                
-                f"Here is a description of the 'before' (initial) state:\n{before_analysis}\n\n"
-                f"Here are the requested tasks:\n{requested_tasks_text}\n\n"
-                
-                "Compare the *current image* (the 'after' image you are analyzing now) "
-                "to the provided 'before' state description, the requested tasks, and the contractor's statement. "
-                "For each task, clearly state its completion status based on the visual evidence "
-                "in the *current image*. "
-                "If a task is *not* completed, describe precisely what is still missing or what needs to be done. "
-                "If a task is completed, briefly describe the visual evidence confirming its completion. "
-                "Present your findings in a clear, concise, bulleted checklist format, one bullet point per task.\n\n"
-                "Example Format:\n"
-                "- Task: Install new rose garden\n  Status: Completed. New rose bushes are visible with fresh mulch in the designated area.\n"
-                "- Task: Lay sod in bare area\n  Status: Not completed. The bare dirt area still shows dirt and weeds; new sod has not been laid.\n"
-                "- Task: Trim bushes\n  Status: Partially completed. Some bushes appear trimmed, but the large hedge near the fence is still overgrown.\n\n"
-                "Now, analyze the *current 'after' image* and verify the tasks:"
-            )
+    change_evidence = compare_before_after(before_image_data_url, after_image_data_url)
 
-            print("Sending 'After' image for task verification to LLaVA-OneVision (with 'before' and contractor context)...")
-            after_response = client.chat.completions.create(
-                model=LLAVA_MODEL_ID,
-                messages=build_messages_with_image(verification_prompt, after_image_data_url),
-                max_tokens=1500,
-                temperature=0.7,
-            )
-            task_verification_report_raw = after_response.choices[0].message.content
-            print("Task Verification Complete.")
+    # --- Phase 1 & 2: Describe the "Before" Image and, if present, verify tasks against the "After" Image ---
+    task_verification_report_raw = "N/A - After image not provided for initial report."
+    if is_no_change(change_evidence):
+        print("'After' image shows no change from 'before'; skipping the verification call.")
+        before_analysis = describe_before_image(before_image_data_url)
+        task_verification_report_raw = build_no_change_verification_report(requested_tasks_text, change_evidence)
+    elif after_image_data_url: # Only run verification if after image is present
+        print("Sending 'Before' analysis and 'After' task verification requests to LLaVA-OneVision...")
+        before_analysis, task_verification_report_raw = describe_and_verify(
+            before_image_data_url, after_image_data_url, use_chained_context(data),
+            lambda before_text: build_verification_prompt(requested_tasks_text, contractor_accomplishments_text, before_text),
+            max_tokens=1500, temperature=0.7,
+        )
+        print("Before Analysis and Task Verification Complete.")
+    else:
+        print("Sending 'Before' image analysis request to LLaVA-OneVision...")
+        before_analysis = describe_before_image(before_image_data_url)
+        print("Before Analysis Complete.")
 
-        # --- Generate Initial Report ---
+    # --- Generate Initial Report ---
+    with span("report_assembly"):
         initial_report_sections = []
-        initial_report_sections.append("--- Initial Landscaping Project Report ---\n")
-        initial_report_sections.append(f"**Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S CDT')}**\n")
-        initial_report_sections.append("\n### 1. Before Image Analysis (Current State)\n")
+        initial_report_sections.append(initial_report_title())
+        initial_report_sections.append(BEFORE_SECTION_HEADER)
         initial_report_sections.append(before_analysis)
-        initial_report_sections.append("\n### 2. Requested Tasks (from your list)\n")
+        initial_report_sections.append(TASKS_SECTION_HEADER)
         initial_report_sections.append(f"{requested_tasks_text}\n")
-        
+
         # Only add verification section if an after image was processed
         if after_image_data_url:
-            initial_report_sections.append("\n### 3. Initial Task Verification (Based on After Image Provided)\n")
+            initial_report_sections.append(VERIFICATION_SECTION_HEADER)
             initial_report_sections.append(task_verification_report_raw)
         else:
-            initial_report_sections.append("\n### 3. Initial Task Verification (After Image Not Provided Yet)\n")
-            initial_report_sections.append("Please upload 'After Image(s)' in Block 2 and generate the Final Report in Block 3 for task verification.")
-
+            initial_report_sections.append(NO_AFTER_IMAGE_SECTION_HEADER)
+            initial_report_sections.append(NO_AFTER_IMAGE_SECTION_TEXT)
 
         full_initial_report_text = "".join(initial_report_sections)
-        print("Initial Report Generated.")
+    print("Initial Report Generated.")
 
-        return jsonify({
-            "report": full_initial_report_text,
-            "before_analysis_text": before_analysis,
-            "original_tasks_text": requested_tasks_text # This is the newline-separated string
-        })
+    return {
+        "report": full_initial_report_text,
+        "before_analysis_text": before_analysis,
+        "original_tasks_text": requested_tasks_text, # This is the newline-separated string
+        "change_evidence": change_evidence,
+    }
 
+@bp.route('/analyze_landscaping', methods=['POST'])
+def analyze_landscaping():
+    try:
+        return json_response(run_analyze_landscaping(request.json))
+
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable: {e}")
+        return jsonify({"error": str(e)}), 503
     except APIError as e:
         print(f"API Error during landscaping analysis: {e}")
-        return jsonify({"error": f"API Error: {e.status_code} - {e.response.json() if e.response else str(e)}"}), 500
+        return jsonify({"error": format_api_error(e)}), api_error_status(e)
     except Exception as e:
         print(f"Unexpected error during landscaping analysis: {e}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-# --- NEW ENDPOINT for Final Report Generation (Block 3) ---
-@app.route('/generate_final_report', methods=['POST'])
-def generate_final_report():
+@bp.route('/analyze_landscaping/stream', methods=['POST'])
+def analyze_landscaping_stream():
+    """Server-Sent Events variant of analyze_landscaping.
+
+    Emits ``section`` events for the report headers, ``token`` events for model
+    output as it is generated, then a ``done`` event carrying the same payload as
+    the JSON endpoint (or an ``error`` event).
+    """
+    data = request.json
     try:
-        data = request.json
-        before_image_data_url = data['before_image']
-        after_image_data_url = data['after_image'] 
-        all_requested_tasks_text = data['requested_tasks']
-        contractor_accomplishments_text = data.get('contractor_accomplishments', '')
-        contractor_selected_tasks_list = data.get('contractor_selected_tasks', [])
-
-        # --- Validate essential inputs for final report ---
-        if not before_image_data_url or not after_image_data_url:
-            return jsonify({"error": "Both 'before' and 'after' images are required for final report generation."}), 400
-        if not all_requested_tasks_text:
-            return jsonify({"error": "Requested tasks from Block 1 are required for final report generation."}), 400
-
-        # Generate fresh analysis of 'before' image (could cache this from analyze_landscaping if preferred)
-        before_description_prompt = (
-            "Describe the initial state of this landscaping image in detail. Focus on elements like lawn health, bare areas, existing plants, and any visible problems."
-        )
-        before_response = client.chat.completions.create(
-            model=LLAVA_MODEL_ID,
-            messages=build_messages_with_image(before_description_prompt, before_image_data_url),
-            max_tokens=1000, temperature=0.5,
+        validate_analysis_request(data)
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        try:
+            requested_tasks_text = data['requested_tasks']
+            contractor_accomplishments_text = data.get('contractor_accomplishments', '')
+            report_chunks = []
+
+            def emit(event, text):
+                report_chunks.append(text)
+                return sse_event(event, {"text": text})
+
+            # Send the title straight away so the user sees progress before any model call
+            yield emit("section", initial_report_title())
+            before_image_data_url, after_image_data_url = normalize_request_images(data, 'before_image', 'after_image')
+            change_evidence = compare_before_after(before_image_data_url, after_image_data_url)
+
+            chained = use_chained_context(data) or get_analysis_cache().get(
+                vision_cache_key(BEFORE_DESCRIPTION_PROMPT, before_image_data_url)
+            ) is not None
+            verification_chunks = None
+            if is_no_change(change_evidence):
+                print("'After' image shows no change from 'before'; skipping the verification call.")
+                verification_chunks = iter([build_no_change_verification_report(requested_tasks_text, change_evidence)])
+            elif after_image_data_url and not chained:
+                # Start verification now; it streams into a buffer while the 'before' section is sent
+                print("Streaming 'After' task verification from LLaVA-OneVision...")
+                verification_chunks = prefetch_stream(stream_verification(
+                    partial(build_verification_prompt, requested_tasks_text, contractor_accomplishments_text),
+                    before_image_data_url, after_image_data_url, None, max_tokens=1500, temperature=0.7,
+                ))
+
+            print("Streaming 'Before' image analysis from LLaVA-OneVision...")
+            yield emit("section", BEFORE_SECTION_HEADER)
+            before_chunks = []
+            for text in stream_before_description(before_image_data_url):
+                before_chunks.append(text)
+                yield emit("token", text)
+            before_analysis = "".join(before_chunks)
+
+            yield emit("section", TASKS_SECTION_HEADER)
+            yield emit("token", f"{requested_tasks_text}\n")
+
+            if after_image_data_url:
+                yield emit("section", VERIFICATION_SECTION_HEADER)
+                if verification_chunks is None:
+                    print("Streaming 'After' task verification from LLaVA-OneVision...")
+                    verification_chunks = stream_vision_completion(
+                        build_verification_prompt(requested_tasks_text, contractor_accomplishments_text, before_analysis),
+                        [after_image_data_url], max_tokens=1500, temperature=0.7,
+                    )
+                for text in verification_chunks:
+                    yield emit("token", text)
+            else:
+                yield emit("section", NO_AFTER_IMAGE_SECTION_HEADER)
+                yield emit("token", NO_AFTER_IMAGE_SECTION_TEXT)
+
+            print("Initial Report Streamed.")
+            yield sse_event("done", {
+                "report": "".join(report_chunks),
+                "before_analysis_text": before_analysis,
+                "original_tasks_text": requested_tasks_text,
+                "change_evidence": change_evidence,
+            })
+        except LLMUnavailableError as e:
+            print(f"LLM unavailable: {e}")
+            yield sse_event("error", {"error": str(e)})
+        except APIError as e:
+            print(f"API Error during streamed landscaping analysis: {e}")
+            yield sse_event("error", {"error": format_api_error(e)})
+        except Exception as e:
+            print(f"Unexpected error during streamed landscaping analysis: {e}")
+            yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}"})
+
+    return sse_response(generate())
+
+# --- Per-Task Verification ---
+# When a final report request carries a ``project_id``, each requested task gets a
+# structured verdict that is stored per project, task, image pair and claim (see
+# task_verification.py). Re-runs only send the model the tasks whose photo or
+# claim changed, and the report text is assembled from the stored verdicts. The
+# verdict call is streamed, so the stream endpoint reports each task as it arrives.
+@per_process
+def get_task_verification_store():
+    return TaskVerificationStore(os.path.join(DATA_DIR, "task_verifications.sqlite3"))
+
+# Response formats this process has seen the endpoint reject while a looser one worked
+_rejected_verdict_formats = set()
+
+def stream_task_verdicts(tasks, claimed_flags, contractor_accomplishments_text, before_image_data_url, after_image_data_url, chained, usage):
+    """Stream one LLaVA verdict call for ``tasks``, yielding (task_number, verdict) as each verdict arrives.
+
+    The reply is schema-constrained where the endpoint supports it; a 400 for the
+    response format falls back to ``json_object`` and then to the bare prompt.
+    A request with both images that is still rejected is redone in chained mode.
+    The call's token counts are stored in ``usage``.
+    """
+    before_analysis = get_analysis_cache().get(vision_cache_key(BEFORE_DESCRIPTION_PROMPT, before_image_data_url))
+    if before_analysis is None and chained:
+        before_analysis = describe_before_image(before_image_data_url)
+    parser = VerdictStreamParser(tasks)
+    try:
+        yield from stream_verdict_reply(
+            tasks, claimed_flags, contractor_accomplishments_text, before_analysis, before_image_data_url, after_image_data_url,
+            parser, usage,
         )
-        before_analysis_for_final = before_response.choices[0].message.content
-
-        # Convert contractor's selected tasks into a readable string
-        contractor_selected_tasks_str = "\n".join([f"- {task}" for task in contractor_selected_tasks_list]) if contractor_selected_tasks_list else "None specified by contractor."
-
-        # Prompt for final verification and payment validation
-        final_verification_prompt = (
-            "You are a strict, but reasonable, landscaping project quality assurance auditor. "
-            "Your goal is to provide a final decision on whether a contractor's work meets requirements for payment validation. "
-            "You must consider the *spirit and intent* of the requested tasks, allowing for common and functionally equivalent material substitutions "
-            "unless the original request *explicitly* specified a unique or non-substitutable material. "
-            "If a material is substituted, note it, but only mark the task as 'Not Completed' if the substitution fundamentally alters the task's purpose, functionality, or significantly degrades quality/aesthetics in the context of general landscaping. "
-            "If there's a minor material substitution that achieves the same purpose (e.g., bricks instead of rocks for a border, unless specific rock type was crucial), consider it 'Completed' but note the substitution. "
-            "If the request was for 'rocks' and 'bricks' were used, acknowledge the substitution but if the border is functional and aesthetic, you might consider it 'Completed (with material substitution)' unless explicitly instructed otherwise or there's a clear negative impact."
-            "I will provide:\n"
-            f"1. Description of the 'before' state: {before_analysis_for_final}\n"
-            f"2. All originally requested tasks: {all_requested_tasks_text}\n"
-            f"3. Contractor's self-reported accomplishments: {contractor_accomplishments_text if contractor_accomplishments_text else 'N/A'}\n"
-            f"4. Specific tasks the contractor claims they completed: {contractor_selected_tasks_str}\n\n"
-            "Based on the *current 'after' image* you are analyzing, and all the provided textual context, perform the following steps:\n"
-            "A. **VERIFY ALL REQUESTED TASKS:** Go through 'All originally requested tasks' one by one. For each task, visually inspect the 'after' image. State whether it is 'Completed', 'Partially Completed', or 'Not Completed'. "
-            "If there's a material substitution, indicate 'Completed (with material substitution)' or 'Partially Completed (with material substitution)' and specify the substitution. "
-            "Provide brief visual evidence for your assessment. Use a bulleted list for each task.\n"
-            "B. **COMPARE TO CONTRACTOR'S CLAIM:** Briefly comment on whether the contractor's self-reported accomplishments align with your visual verification, specifically noting any claimed tasks that appear incomplete or any unrequested work that was done.\n"
-            "C. **PAYMENT VALIDATION DECISION:** Based on your thorough verification of ALL originally requested tasks, and considering the flexibility for material substitution as described, provide a clear decision: 'Meets Requirements for Payment', 'Partially Meets Requirements - Further Action Needed', or 'Does Not Meet Requirements - Payment Withheld'. Justify your decision with specific reasons related to uncompleted, unsatisfactory, or fundamentally altered tasks.\n\n"
-            "Present your response clearly, with sections A, B, and C as described."
+    except BadRequestError as e:
+        if before_analysis is not None or parser.text:
+            raise
+        note_multi_image_rejected(e)
+        yield from stream_verdict_reply(
+            tasks, claimed_flags, contractor_accomplishments_text, describe_before_image(before_image_data_url),
+            before_image_data_url, after_image_data_url, parser, usage,
         )
+    yield from parser.finish()
 
-        print("Sending 'After' image for final report generation to LLaVA-OneVision...")
-        final_report_response = client.chat.completions.create(
-            model=LLAVA_MODEL_ID,
-            messages=build_messages_with_image(final_verification_prompt, after_image_data_url),
-            max_tokens=2000,
-            temperature=0.5,
+def stream_verdict_reply(tasks, claimed_flags, contractor_accomplishments_text, before_analysis, before_image_data_url, after_image_data_url, parser, usage):
+    prompt_text = build_task_verification_prompt(tasks, claimed_flags, contractor_accomplishments_text, before_analysis)
+    image_data_urls = [after_image_data_url] if before_analysis is not None else [before_image_data_url, after_image_data_url]
+    messages = build_messages_with_image(prompt_text, image_data_urls[0], extra_image_data_urls=image_data_urls[1:])
+
+    formats = [f for f in VERDICT_RESPONSE_FORMATS if f is None or f["type"] not in _rejected_verdict_formats]
+    rejected = []
+    for response_format in formats:
+        format_kwargs = {"response_format": response_format} if response_format is not None else {}
+        try:
+            for text in stream_completion(
+                LLAVA_MODEL_ID, messages, max_tokens=min(2000, 200 + 150 * len(tasks)), temperature=0.2,
+                usage=usage, **format_kwargs,
+            ):
+                yield from parser.feed(text)
+        except BadRequestError as e:
+            # Only a rejection before any reply text can be retried with a looser format
+            if parser.text or response_format is None:
+                raise
+            print(f"Endpoint rejected response_format '{response_format['type']}' ({e}); trying a looser format.")
+            rejected.append(response_format["type"])
+            continue
+        # The looser format worked, so the rejections were about the format itself
+        _rejected_verdict_formats.update(rejected)
+        return
+
+def verify_tasks_incrementally(project_id, data, before_image_data_url, after_image_data_url, change_evidence):
+    """Per-task verdicts for a final report request, reusing stored verdicts where the inputs are unchanged.
+
+    Yields a ``("task", verdict)`` event as each task's verdict is settled (stored
+    ones first, then the model's as they stream in) and returns (verdicts, usage).
+    """
+    tasks = list(dict.fromkeys(requested_task_names(data['requested_tasks'])))
+    claimed_tasks = {normalize_task(task) for task in data.get('contractor_selected_tasks', [])}
+    before_hash = image_content_hash(data_url_to_bytes(before_image_data_url))
+    after_hash = image_content_hash(data_url_to_bytes(after_image_data_url))
+
+    verdicts, pending = [], []
+    for task in tasks:
+        claimed = normalize_task(task) in claimed_tasks
+        # A task completed in any 'after' photo of this project stays completed, even
+        # when this photo was verified (as not completed) before that one
+        stored = (get_task_verification_store().find_completed(project_id, task, before_hash, claimed)
+                  or get_task_verification_store().get(project_id, task, before_hash, after_hash, claimed))
+        if stored is not None:
+            verdicts.append({**stored, "reused": True})
+            yield task_event(verdicts[-1])
+        else:
+            verdicts.append({"task": task, "claimed": claimed, "reused": False, "after_hash": after_hash})
+            pending.append(len(verdicts) - 1)
+
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    if pending and is_no_change(change_evidence):
+        print(f"'After' image shows no change from 'before'; marking {len(pending)} task(s) not completed without a model call.")
+        for index in pending:
+            verdicts[index].update(status=STATUS_NOT_COMPLETED, evidence=describe_no_change(change_evidence), material_substitution=None)
+            yield task_event(verdicts[index])
+    elif pending:
+        print(f"Verifying {len(pending)} of {len(tasks)} task(s) with LLaVA-OneVision ({len(tasks) - len(pending)} reused)...")
+        for number, verdict in stream_task_verdicts(
+            [verdicts[index]["task"] for index in pending], [verdicts[index]["claimed"] for index in pending],
+            data.get('contractor_accomplishments', ''), before_image_data_url, after_image_data_url,
+            use_chained_context(data), usage,
+        ):
+            index = pending[number - 1]
+            verdicts[index].update(verdict)
+            # Stored as each verdict arrives, so a dropped stream keeps what was verified
+            get_task_verification_store().put(project_id, before_hash, after_hash, verdicts[index], LLAVA_MODEL_ID)
+            yield task_event(verdicts[index])
+        for index in pending:
+            if "status" not in verdicts[index]:
+                verdicts[index].update(status=STATUS_UNVERIFIED, evidence="", material_substitution=None)
+                yield task_event(verdicts[index])
+
+    return verdicts, {
+        "tasks_total": len(tasks),
+        "tasks_reused": len(tasks) - len(pending),
+        "tasks_verified": len(pending),
+        **usage,
+    }
+
+def task_event(verdict):
+    return "task", {**verdict, "label": STATUS_LABELS[verdict["status"]]}
+
+def iter_structured_final_report(project_id, data, before_image_data_url, after_image_data_url, change_evidence):
+    """Yield ``("task", verdict)`` events as verdicts settle, then ``("done", result)``."""
+    verdicts, verification_usage = yield from verify_tasks_incrementally(
+        project_id, data, before_image_data_url, after_image_data_url, change_evidence,
+    )
+    with span("report_assembly"):
+        final_report_content = assemble_final_report(verdicts, data.get('contractor_accomplishments', ''))
+    yield "done", {
+        "final_report": final_report_content,
+        "task_verdicts": verdicts,
+        "verification_usage": verification_usage,
+        "change_evidence": change_evidence,
+    }
+
+def run_structured_final_report(project_id, data, before_image_data_url, after_image_data_url, change_evidence):
+    for event, payload in iter_structured_final_report(project_id, data, before_image_data_url, after_image_data_url, change_evidence):
+        if event == "done":
+            return payload
+
+# --- NEW ENDPOINT for Final Report Generation (Block 3) ---
+def validate_final_report_request(data):
+    if not has_image(data, 'before_image') or not has_image(data, 'after_image'):
+        raise InvalidRequestError("Both 'before' and 'after' images are required for final report generation.")
+    if not data.get('requested_tasks'):
+        raise InvalidRequestError("Requested tasks from Block 1 are required for final report generation.")
+    if data.get('project_id') is not None and not isinstance(data['project_id'], str):
+        raise InvalidRequestError("'project_id' must be a string.")
+
+def run_generate_final_report(data):
+    """Build the final verification report. Shared by the JSON endpoint and background jobs."""
+    # --- Validate essential inputs for final report ---
+    validate_final_report_request(data)
+    all_requested_tasks_text = data['requested_tasks']
+    contractor_accomplishments_text = data.get('contractor_accomplishments', '')
+    contractor_selected_tasks_list = data.get('contractor_selected_tasks', [])
+
+    before_image_data_url, after_image_data_url = normalize_request_images(data, 'before_image', 'after_image')
+    change_evidence = compare_before_after(before_image_data_url, after_image_data_url)
+    if data.get('project_id'):
+        return run_structured_final_report(data['project_id'], data, before_image_data_url, after_image_data_url, change_evidence)
+    if is_no_change(change_evidence):
+        print("'After' image shows no change from 'before'; skipping the final report call.")
+        final_report_content = build_no_change_final_report(
+            all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list, change_evidence,
         )
-        final_report_content = final_report_response.choices[0].message.content
-        print("Final Report Generated.")
+        return {"final_report": final_report_content, "change_evidence": change_evidence}
+
+    # The 'before' analysis from analyze_landscaping is reused from the cache when available
+    print("Sending 'After' image for final report generation to LLaVA-OneVision...")
+    _, final_report_content = describe_and_verify(
+        before_image_data_url, after_image_data_url, use_chained_context(data),
+        lambda before_text: build_final_verification_prompt(
+            all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list, before_text,
+        ),
+        max_tokens=2000, temperature=0.5, need_before_analysis=False,
+    )
+    print("Final Report Generated.")
 
-        return jsonify({"final_report": final_report_content})
+    return {"final_report": final_report_content, "change_evidence": change_evidence}
+
+@bp.route('/generate_final_report', methods=['POST'])
+def generate_final_report():
+    try:
+        return json_response(run_generate_final_report(request.json))
 
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable: {e}")
+        return jsonify({"error": str(e)}), 503
     except APIError as e:
         print(f"API Error during final report generation: {e}")
         print(f"API Response Details: {e.response.text if e.response else 'No response text'}")
-        return jsonify({"error": f"API Error: {e.status_code} - {e.response.json() if e.response else str(e)}"}), 500
+        return jsonify({"error": format_api_error(e)}), api_error_status(e)
     except Exception as e:
         print(f"Unexpected error during final report generation: {e}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@bp.route('/generate_final_report/stream', methods=['POST'])
+def generate_final_report_stream():
+    """Server-Sent Events variant of generate_final_report.
+
+    Sends ``token`` events with report text, or with a ``project_id`` a ``task``
+    event per task verdict as it is settled, then ``done``.
+    """
+    data = request.json
+    try:
+        validate_final_report_request(data)
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    all_requested_tasks_text = data['requested_tasks']
+    contractor_accomplishments_text = data.get('contractor_accomplishments', '')
+    contractor_selected_tasks_list = data.get('contractor_selected_tasks', [])
+
+    def generate():
+        try:
+            normalized_before, normalized_after = normalize_request_images(data, 'before_image', 'after_image')
+            change_evidence = compare_before_after(normalized_before, normalized_after)
+            if data.get('project_id'):
+                # A ``task`` event per verdict as it is settled, then the assembled report in ``done``
+                for event, payload in iter_structured_final_report(
+                    data['project_id'], data, normalized_before, normalized_after, change_evidence,
+                ):
+                    yield sse_event(event, payload)
+                return
+            if is_no_change(change_evidence):
+                print("'After' image shows no change from 'before'; skipping the final report call.")
+                final_report_content = build_no_change_final_report(
+                    all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list, change_evidence,
+                )
+                yield sse_event("token", {"text": final_report_content})
+                yield sse_event("done", {"final_report": final_report_content, "change_evidence": change_evidence})
+                return
+
+            before_analysis = get_analysis_cache().get(vision_cache_key(BEFORE_DESCRIPTION_PROMPT, normalized_before))
+            if before_analysis is None and use_chained_context(data):
+                before_analysis = describe_before_image(normalized_before)
+            build_prompt = partial(
+                build_final_verification_prompt, all_requested_tasks_text, contractor_accomplishments_text, contractor_selected_tasks_list,
+            )
+
+            print("Streaming final report from LLaVA-OneVision...")
+            report_chunks = []
+            for text in stream_verification(
+                build_prompt, normalized_before, normalized_after, before_analysis, max_tokens=2000, temperature=0.5,
+            ):
+                report_chunks.append(text)
+                yield sse_event("token", {"text": text})
+            print("Final Report Streamed.")
+            yield sse_event("done", {"final_report": "".join(report_chunks), "change_evidence": change_evidence})
+        except LLMUnavailableError as e:
+            print(f"LLM unavailable: {e}")
+            yield sse_event("error", {"error": str(e)})
+        except APIError as e:
+            print(f"API Error during streamed final report generation: {e}")
+            yield sse_event("error", {"error": format_api_error(e)})
+        except Exception as e:
+            print(f"Unexpected error during streamed final report generation: {e}")
+            yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}"})
+
+    return sse_response(generate())
+
+
+# --- Background Job Endpoints ---
+# Report generation can be submitted as a job and polled, so long model calls
+# never hold a request open. Identical in-flight submissions share one job.
+JOB_RUNNERS = {
+    "analyze_landscaping": (validate_analysis_request, run_analyze_landscaping),
+    "generate_final_report": (validate_final_report_request, run_generate_final_report),
+}
+
+def run_traced_job(kind, run, *args):
+    with trace(f"job:{kind}", "JOB"):
+        return run(*args)
+
+@bp.route('/jobs/<kind>', methods=['POST'])
+def submit_job(kind):
+    if kind not in JOB_RUNNERS:
+        return jsonify({"error": f"Unknown job type '{kind}'."}), 404
+    validate, run = JOB_RUNNERS[kind]
+    data = request.json
+    try:
+        validate(data)
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job, created = get_job_queue().submit(kind, data, partial(run_traced_job, kind, run))
+    status_url = f"/jobs/{job['id']}"
+    return jsonify({"job_id": job['id'], "status": job['status'], "status_url": status_url, "deduplicated": not created}), 202, {"Location": status_url}
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found."}), 404
+    return json_response(job)
+
+
+# --- Batch Inspections ---
+# Many sites can be verified in one request. The batch is a background job from
+# the start: sites run on their own bounded pool (their model calls still share
+# get_llm_executor(), the analysis cache and the client's per-model limits) and
+# each site's result is written to the job as soon as it finishes. The response
+# streams those results back as NDJSON by reading the job, so a dropped
+# connection loses nothing; the batch can be polled, and its payment-decision
+# summary downloaded as JSONL or CSV, by job ID.
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 8))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+# How often a batch stream checks its job for newly finished sites
+BATCH_STREAM_POLL_SECONDS = float(os.environ.get("BATCH_STREAM_POLL_SECONDS", 0.5))
+
+@per_process
+def get_batch_executor():
+    return ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-item")
+
+def verify_after_photo(item, before_image_data_url, after_image_data_url, before_analysis):
+    """Final verification of one 'after' photo, cached by prompt and image content."""
+    prompt_text = build_final_verification_prompt(
+        item['requested_tasks'], item['contractor_accomplishments'], item['contractor_selected_tasks'], before_analysis,
+    )
+    image_data_urls = [after_image_data_url] if before_analysis is not None else [before_image_data_url, after_image_data_url]
+    cache_key = analysis_cache_key(
+        LLAVA_MODEL_ID, prompt_text, *(image_content_hash(data_url_to_bytes(url)) for url in image_data_urls),
+    )
+    cached_report = get_analysis_cache().get(cache_key)
+    if cached_report is not None:
+        print(f"Analysis cache hit for {LLAVA_MODEL_ID} ({cache_key[:12]}).")
+        return cached_report
+    try:
+        report = vision_completion(prompt_text, image_data_urls, max_tokens=2000, temperature=0.5)
+    except BadRequestError as e:
+        if before_analysis is not None:
+            raise
+        note_multi_image_rejected(e)
+        return verify_after_photo(item, before_image_data_url, after_image_data_url, describe_before_image(before_image_data_url))
+    get_analysis_cache().set(cache_key, report)
+    return report
+
+def run_batch_item(item):
+    """Verify every 'after' photo of one manifest item and derive the site's payment decision."""
+    result = {"type": "item", "index": item['index'], "id": item['id']}
+    try:
+        with span("batch_item"):
+            before_image_data_url, *after_image_data_urls = normalize_images(
+                load_request_image(item['before'], 'before_image'),
+                *(load_request_image(source, 'after_image') for source in item['after_sources']),
+            )
+            change_evidence = [compare_before_after(before_image_data_url, after_url) for after_url in after_image_data_urls]
+            model_photos = [index for index, evidence in enumerate(change_evidence) if not is_no_change(evidence)]
+
+            # Several photos of one site share a single 'before' description instead of each re-sending the image
+            before_analysis = get_analysis_cache().get(vision_cache_key(BEFORE_DESCRIPTION_PROMPT, before_image_data_url))
+            if before_analysis is None and (use_chained_context(item) or len(model_photos) > 1):
+                before_analysis = describe_before_image(before_image_data_url)
+
+            futures = {
+                index: submit_in_context(
+                    get_llm_executor(), verify_after_photo, item, before_image_data_url, after_image_data_urls[index], before_analysis,
+                )
+                for index in model_photos
+            }
+            photos = []
+            for photo_index, evidence in enumerate(change_evidence):
+                if photo_index in futures:
+                    report = futures[photo_index].result()
+                else:
+                    report = build_no_change_final_report(
+                        item['requested_tasks'], item['contractor_accomplishments'], item['contractor_selected_tasks'], evidence,
+                    )
+                photos.append({
+                    "photo": photo_index,
+                    "payment_decision": extract_payment_decision(report),
+                    "final_report": report,
+                    "change_evidence": evidence,
+                })
+    except Exception as e:
+        print(f"Batch item '{item['id']}' failed: {e}")
+        result.update(status="failed", error=describe_job_error(e))
+        return result
+
+    result.update(
+        status="succeeded",
+        payment_decision=combine_decisions([photo["payment_decision"] for photo in photos]),
+        photos=photos,
+    )
+    return result
+
+def run_batch_inspection(job_id, data):
+    """Background job: verify every site of a manifest, recording each result on the job as it finishes."""
+    items = parse_manifest(data, BATCH_MAX_ITEMS)
+    print(f"Starting batch inspection of {len(items)} site(s) (job {job_id})...")
+    futures = [submit_in_context(get_batch_executor(), run_batch_item, item) for item in items]
+    rows = []
+    for future in as_completed(futures):
+        result = future.result()
+        get_job_queue().store.add_item(job_id, result)
+        rows.append(summary_row(result))
+
+    rows.sort(key=lambda row: row["index"])
+    counts = decision_counts(rows)
+    print(f"Batch inspection finished: {counts} (job {job_id}).")
+    return {"items": rows, "decision_counts": counts}
+
+def batch_summary_line(job):
+    if job['status'] == JOB_FAILED:
+        return {"type": "error", "job_id": job['id'], "error": job['error']}
+    return {
+        "type": "summary",
+        "job_id": job['id'],
+        "items": len(job['result']['items']),
+        "decision_counts": job['result']['decision_counts'],
+        "summary_urls": {
+            "jsonl": f"/batch_inspections/{job['id']}/summary?format=jsonl",
+            "csv": f"/batch_inspections/{job['id']}/summary?format=csv",
+        },
+    }
+
+@bp.route('/batch_inspections', methods=['POST'])
+def batch_inspections():
+    """Verify a manifest of sites (format in batch_inspection.py).
+
+    Streams NDJSON: a ``job`` line with the batch's job ID, one ``item`` line per
+    site in completion order, then a ``summary`` line with the decision counts
+    (or an ``error`` line if the job failed). The batch keeps running if the
+    connection drops; poll ``GET /batch_inspections/<job_id>`` for the rest.
+    Re-posting an identical manifest while it runs follows the same job.
+    """
+    data = request.json
+    try:
+        items = parse_manifest(data, BATCH_MAX_ITEMS)
+    except ManifestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job, created = get_job_queue().submit(
+        "batch_inspection", data, partial(run_traced_job, "batch_inspection", run_batch_inspection), pass_job_id=True,
+    )
+    job_id = job['id']
+
+    def generate():
+        yield json.dumps({
+            "type": "job", "job_id": job_id, "items": len(items), "deduplicated": not created,
+            "status_url": f"/batch_inspections/{job_id}",
+        }) + "\n"
+        sent = 0
+        while True:
+            # Status first: once it reads finished, the items read next are complete
+            current = get_job_queue().get(job_id)
+            for result in get_job_queue().store.get_items(job_id, start=sent):
+                sent += 1
+                yield json.dumps(result) + "\n"
+            if current['status'] in (JOB_SUCCEEDED, JOB_FAILED):
+                break
+            time.sleep(BATCH_STREAM_POLL_SECONDS)
+        yield json.dumps(batch_summary_line(current)) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@bp.route('/batch_inspections/<job_id>', methods=['GET'])
+def batch_inspection_status(job_id):
+    """Progress of a batch: its status, the site results from ``?start=`` on, and the summary once finished."""
+    job = get_job_queue().get(job_id)
+    if job is None or job['kind'] != "batch_inspection":
+        return jsonify({"error": f"Batch inspection '{job_id}' not found."}), 404
+    try:
+        start = max(0, int(request.args.get('start', 0)))
+    except ValueError:
+        return jsonify({"error": "start must be an integer."}), 400
+    results = get_job_queue().store.get_items(job_id, start=start)
+    finished = job['status'] in (JOB_SUCCEEDED, JOB_FAILED)
+    return json_response({
+        "job_id": job_id,
+        "status": job['status'],
+        "items": results,
+        "next_start": start + len(results),
+        "summary": batch_summary_line(job) if finished else None,
+    })
+
+@bp.route('/batch_inspections/<job_id>/summary', methods=['GET'])
+def batch_inspection_summary(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None or job['kind'] != "batch_inspection":
+        return jsonify({"error": f"Batch inspection '{job_id}' not found."}), 404
+    if job['status'] != JOB_SUCCEEDED:
+        return jsonify({"error": f"Batch inspection '{job_id}' is {job['status']}; its summary is not available."}), 409
+    rows = job['result']['items']
+    summary_format = request.args.get('format', 'jsonl')
+    if summary_format == 'csv':
+        return Response(render_summary_csv(rows), mimetype="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="batch-inspection-{job_id}.csv"'})
+    if summary_format == 'jsonl':
+        return Response(render_summary_jsonl(rows), mimetype="application/x-ndjson")
+    return jsonify({"error": "format must be 'jsonl' or 'csv'."}), 400
+
 
 # --- NEW ENDPOINT for Chat Functionality ---
-@app.route('/chat_query', methods=['POST'])
+def build_chat_messages(data):
+    """Pick the chat model and build the messages for a chat request. Returns (model_id, messages, token_usage)."""
+    user_question = data['user_question']
+    context = data['context']
+    before_image_data_url, after_image_data_url = normalize_request_images(data, 'before_image', 'after_image')
+
+    # Determine which model to use based on question type and image availability
+    use_llama3 = False
+    current_model_id = LLAVA_MODEL_ID
+    if not before_image_data_url and not after_image_data_url and TEXT_LLM_MODEL_ID:
+        use_llama3 = True
+        current_model_id = TEXT_LLM_MODEL_ID
+        print("Using Llama3 for text-only chat query.")
+    else:
+        print("Using LLaVA-OneVision for chat query (image context available).")
+
+    # Fit the conversation and project context into the prompt token budget
+    history_messages, context_text, token_usage = chat_context_manager.build(
+        user_question, context, context.get('conversation_history'), image_count=0 if use_llama3 else 1,
+    )
+    messages_for_api = list(history_messages)
+
+    # Build the current user message content
+    current_user_content = [{"type": "text", "text": context_text}]
+
+    # Add one image only if using LLaVA: the 'after' photo if there is one, else the 'before' photo
+    if not use_llama3: 
+        if after_image_data_url:
+            current_user_content.append({"type": "image_url", "image_url": {"url": after_image_data_url}})
+            print("Attaching 'After' image to chat query.")
+        elif before_image_data_url: 
+            current_user_content.append({"type": "image_url", "image_url": {"url": before_image_data_url}})
+            print("Attaching 'Before' image to chat query.")
+    
+    messages_for_api.append({"role": "user", "content": current_user_content})
+    print(f"Sending chat query to {current_model_id} (~{token_usage['estimated_prompt_tokens']} prompt tokens). Question: {user_question}")
+    return current_model_id, messages_for_api, token_usage
+
+@bp.route('/chat_query', methods=['POST'])
 def chat_query():
     try:
         data = request.json
-        user_question = data['user_question']
-        before_image_data_url = data['before_image']
-        after_image_data_url = data['after_image'] 
-        context = data['context']
-
-        # Determine which model to use based on question type and image availability
-        use_llama3 = False
-        current_model_id = LLAVA_MODEL_ID
-        if not before_image_data_url and not after_image_data_url and TEXT_LLM_MODEL_ID:
-            use_llama3 = True
-            current_model_id = TEXT_LLM_MODEL_ID
-            print("Using Llama3 for text-only chat query.")
-        else:
-            print("Using LLaVA-OneVision for chat query (image context available).")
-
-        # Reconstruct messages list for the API call
-        messages_for_api = []
-
-        # Add previous conversation history
-        if context.get('conversation_history'):
-            for msg in context['conversation_history']:
-                role = "user" if msg['role'] == 'user' else "assistant"
-                # Check if content is already in the OpenAI multimodal format (list of dicts)
-                # or if it's a simple text string.
-                if isinstance(msg.get('content'), list): 
-                    messages_for_api.append({"role": role, "content": msg['content']})
-                else: 
-                    messages_for_api.append({"role": role, "content": msg.get('message', '')})
-
-
-        # Construct the context for the current user question
-        context_text = (
-            f"Here is relevant context from the user's landscaping project:\n\n"
-            f"--- Initial Project Analysis (Before Image) ---\n{context.get('before_analysis', 'N/A')}\n\n"
-            f"--- Original Requested Tasks ---\n{context.get('original_tasks', 'N/A')}\n\n"
-            f"--- Contractor's Accomplishments (Statement) ---\n{context.get('contractor_accomplishments', 'N/A')}\n\n"
-            f"--- Full Project Report ---\n{context.get('full_report', 'N/A')}\n\n"
-        )
-        
-        # Build the current user message content
-        current_user_content = [{"type": "text", "text": context_text + "User's Question: " + user_question}]
+        current_model_id, messages_for_api, token_usage = build_chat_messages(data)
 
-        # Add images only if using LLaVA and images are present, respecting 1-image-per-request limit
-        if not use_llama3: 
-            if after_image_data_url:
-                current_user_content.append({"type": "image_url", "image_url": {"url": after_image_data_url}})
-                print("Attaching 'After' image to chat query.")
-            elif before_image_data_url: 
-                current_user_content.append({"type": "image_url", "image_url": {"url": before_image_data_url}})
-                print("Attaching 'Before' image to chat query.")
-        
-        messages_for_api.append({"role": "user", "content": current_user_content})
-        
-        print(f"Sending chat query to {current_model_id}. Question: {user_question}")
-        chat_response = client.chat.completions.create(
+        chat_response = get_llm_client().create(
             model=current_model_id,
             messages=messages_for_api,
             max_tokens=500,
@@ -341,17 +1430,91 @@ def chat_query():
         )
         ai_response_content = chat_response.choices[0].message.content
         print(f"AI Chat Response: {ai_response_content}")
+        if chat_response.usage:
+            token_usage["prompt_tokens"] = chat_response.usage.prompt_tokens
+            token_usage["completion_tokens"] = chat_response.usage.completion_tokens
 
-        return jsonify({"response": ai_response_content})
+        return json_response({"response": ai_response_content, "token_usage": token_usage})
 
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable: {e}")
+        return jsonify({"error": str(e)}), 503
     except APIError as e:
         print(f"API Error during chat query: {e}")
         print(f"API Response Details: {e.response.text if e.response else 'No response text'}")
-        return jsonify({"error": f"API Error: {e.status_code} - {e.response.json() if e.response else str(e)}"}), 500
+        return jsonify({"error": format_api_error(e)}), api_error_status(e)
     except Exception as e:
         print(f"Unexpected error during chat query: {e}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@bp.route('/chat_query/stream', methods=['POST'])
+def chat_query_stream():
+    data = request.json
+
+    def generate():
+        try:
+            current_model_id, messages_for_api, token_usage = build_chat_messages(data)
+            response_chunks = []
+            for text in stream_completion(current_model_id, messages_for_api, max_tokens=500, temperature=0.5, usage=token_usage):
+                response_chunks.append(text)
+                yield sse_event("token", {"text": text})
+            ai_response_content = "".join(response_chunks)
+            print(f"AI Chat Response: {ai_response_content}")
+            yield sse_event("done", {"response": ai_response_content, "token_usage": token_usage})
+        except LLMUnavailableError as e:
+            print(f"LLM unavailable: {e}")
+            yield sse_event("error", {"error": str(e)})
+        except APIError as e:
+            print(f"API Error during streamed chat query: {e}")
+            yield sse_event("error", {"error": format_api_error(e)})
+        except Exception as e:
+            print(f"Unexpected error during streamed chat query: {e}")
+            yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}"})
+
+    return sse_response(generate())
+
+
+# --- Health Checks ---
+# /healthz only says the process is serving. /readyz creates this worker's
+# clients, pools and stores (so the first real request does not pay for it) and
+# answers 503 until all of them are usable.
+READINESS_CHECKS = (
+    ("llm_client", get_llm_client),
+    ("llm_executor", get_llm_executor),
+    ("blob_store", get_blob_store),
+    ("analysis_cache", get_analysis_cache),
+    ("job_queue", get_job_queue),
+    ("task_verification_store", get_task_verification_store),
+    ("batch_executor", get_batch_executor),
+)
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    checks = {}
+    for name, get_resource in READINESS_CHECKS:
+        try:
+            get_resource()
+            checks[name] = "ok"
+        except Exception as e:
+            checks[name] = f"error: {e}"
+    ready = all(result == "ok" for result in checks.values())
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), 200 if ready else 503
+
+
+# --- Application Factory ---
+def create_app():
+    """Build the Flask app. Cheap to call: shared resources are created per process on first use."""
+    app = Flask(__name__)
+    CORS(app, origins=["http://localhost:5173", "https://cotterslist.com"])
+    app.register_blueprint(bp)
+    return app
+
 
 if __name__ == '__main__':
     if not os.getenv("NRP_API_KEY"):
@@ -362,4 +1525,5 @@ if __name__ == '__main__':
         print("$env:NRP_API_KEY='your_api_key_here' (Windows PowerShell)")
         exit(1)
     
-    app.run(debug=True, host='0.0.0.0')
+    # Development server only; see wsgi.py and gunicorn.conf.py for production serving
+    create_app().run(debug=True, host='0.0.0.0')
@@ -0,0 +1,152 @@
+# batch_inspection.py
+"""Manifest parsing and payment-decision summaries for batch inspections.
+
+A batch manifest lists many sites, each with one 'before' image and one or
+more 'after' photos. Images are given the same way as on the single-site
+endpoints (``before_image``/``before_image_id``, and ``after_image``,
+``after_image_id``, ``after_images`` or ``after_image_ids``). Top-level
+``requested_tasks``, ``contractor_accomplishments``, ``contractor_selected_tasks``
+and ``chained_context`` act as defaults for every item:
+
+    {
+      "requested_tasks": "- Mow lawn\\n- Mulch beds",
+      "items": [
+        {"id": "12 Elm St", "before_image_id": "...", "after_image_ids": ["...", "..."]},
+        {"id": "14 Elm St", "before_image_id": "...", "after_image_id": "...",
+         "contractor_accomplishments": "Mowed and mulched."}
+      ]
+    }
+"""
+import csv
+import io
+import json
+import re
+
+DECISION_MEETS = "meets_requirements"
+DECISION_PARTIAL = "partially_meets"
+DECISION_FAILS = "does_not_meet"
+DECISION_UNDETERMINED = "undetermined"
+
+# Phrases the final verification prompt asks the model to use in section C
+_DECISION_PATTERNS = (
+    (DECISION_FAILS, re.compile(r"does\s+not\s+meet\s+requirements", re.IGNORECASE)),
+    (DECISION_PARTIAL, re.compile(r"partially\s+meets\s+requirements", re.IGNORECASE)),
+    (DECISION_MEETS, re.compile(r"meets\s+requirements\s+for\s+payment", re.IGNORECASE)),
+)
+_DECISION_SECTION_PATTERN = re.compile(r"payment\s+validation\s+decision", re.IGNORECASE)
+
+ITEM_DEFAULT_FIELDS = ("requested_tasks", "contractor_accomplishments", "contractor_selected_tasks", "chained_context")
+SUMMARY_FIELDS = ("index", "id", "status", "payment_decision", "photo_count", "photo_decisions", "error")
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def _after_sources(item):
+    """The item's 'after' photos as ``{"after_image": ...}`` / ``{"after_image_id": ...}`` dicts."""
+    sources = []
+    for key, field in (("after_image", "after_image"), ("after_image_id", "after_image_id"),
+                       ("after_images", "after_image"), ("after_image_ids", "after_image_id")):
+        value = item.get(key)
+        if not value:
+            continue
+        for entry in value if isinstance(value, list) else [value]:
+            if not isinstance(entry, str) or not entry:
+                raise ManifestError(f"'{key}' must hold image data URLs or IDs.")
+            sources.append({field: entry})
+    return sources
+
+
+def parse_manifest(data, max_items):
+    """Validate a batch manifest and return one normalized dict per item."""
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list) or not data["items"]:
+        raise ManifestError("The manifest must be a JSON object with a non-empty 'items' list.")
+    if len(data["items"]) > max_items:
+        raise ManifestError(f"A batch may contain at most {max_items} items; split larger manifests.")
+
+    defaults = {field: data[field] for field in ITEM_DEFAULT_FIELDS if field in data}
+    items = []
+    for index, raw_item in enumerate(data["items"]):
+        if not isinstance(raw_item, dict):
+            raise ManifestError(f"Item {index} must be a JSON object.")
+        item = {**defaults, **raw_item}
+        label = str(item.get("id", index))
+        if not (item.get("before_image") or item.get("before_image_id")):
+            raise ManifestError(f"Item '{label}' needs a 'before_image' or 'before_image_id'.")
+        after_sources = _after_sources(item)
+        if not after_sources:
+            raise ManifestError(f"Item '{label}' needs at least one 'after' photo.")
+        if not item.get("requested_tasks"):
+            raise ManifestError(f"Item '{label}' needs 'requested_tasks' (on the item or the manifest).")
+        items.append({
+            "index": index,
+            "id": label,
+            "before": {key: item[key] for key in ("before_image", "before_image_id") if item.get(key)},
+            "after_sources": after_sources,
+            "requested_tasks": item["requested_tasks"],
+            "contractor_accomplishments": item.get("contractor_accomplishments", ""),
+            "contractor_selected_tasks": item.get("contractor_selected_tasks", []),
+            "chained_context": item.get("chained_context"),
+        })
+    return items
+
+
+def extract_payment_decision(report_text):
+    """Read the payment decision out of a final verification report."""
+    text = report_text or ""
+    section = _DECISION_SECTION_PATTERN.search(text)
+    if section:
+        text = text[section.end():]
+    earliest = None
+    for decision, pattern in _DECISION_PATTERNS:
+        match = pattern.search(text)
+        if match and (earliest is None or match.start() < earliest[0]):
+            earliest = (match.start(), decision)
+    return earliest[1] if earliest else DECISION_UNDETERMINED
+
+
+def combine_decisions(decisions):
+    """Site-level decision from per-photo decisions.
+
+    Photos usually show different parts of a site, so unanimous decisions carry
+    over, any unreadable report needs review, and mixed results are partial.
+    """
+    if not decisions or DECISION_UNDETERMINED in decisions:
+        return DECISION_UNDETERMINED
+    if len(set(decisions)) == 1:
+        return decisions[0]
+    return DECISION_PARTIAL
+
+
+def summary_row(result):
+    return {
+        "index": result["index"],
+        "id": result["id"],
+        "status": result["status"],
+        "payment_decision": result.get("payment_decision"),
+        "photo_count": len(result.get("photos", [])),
+        "photo_decisions": [photo["payment_decision"] for photo in result.get("photos", [])],
+        "error": result.get("error"),
+    }
+
+
+def decision_counts(rows):
+    counts = {}
+    for row in rows:
+        key = row["payment_decision"] if row["status"] == "succeeded" else "failed"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def render_summary_jsonl(rows):
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def render_summary_csv(rows):
+    buffered = io.StringIO()
+    writer = csv.DictWriter(buffered, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "photo_decisions": ";".join(row["photo_decisions"]), "error": row["error"] or ""})
+    return buffered.getvalue()
@@ -0,0 +1,82 @@
+# bench/compare.py
+"""Compare two bench.load result files and flag regressions.
+
+    python -m bench.compare bench/results/baseline.json bench/results/candidate.json --threshold 0.10
+
+Exits with status 1 when, for any route and concurrency level present in both
+files, p95 latency rose or throughput fell by more than ``threshold``, or the
+error count grew.
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path) as results_file:
+        report = json.load(results_file)
+    return {(result["route"], result["concurrency"]): result for result in report["results"]}
+
+
+def relative_change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(baseline, candidate, threshold):
+    """Return (rows, regressions) for the keys present in both result sets."""
+    rows, regressions = [], []
+    for key in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[key], candidate[key]
+        p95_change = relative_change(old["latency_ms"]["p95"], new["latency_ms"]["p95"])
+        throughput_change = relative_change(old["throughput_rps"], new["throughput_rps"])
+        row = {
+            "route": key[0],
+            "concurrency": key[1],
+            "p95_ms": (old["latency_ms"]["p95"], new["latency_ms"]["p95"]),
+            "p95_change": p95_change,
+            "throughput_rps": (old["throughput_rps"], new["throughput_rps"]),
+            "throughput_change": throughput_change,
+            "errors": (old["errors"], new["errors"]),
+        }
+        rows.append(row)
+        if p95_change is not None and p95_change > threshold:
+            regressions.append(f"{key[0]} c={key[1]}: p95 latency up {p95_change:.0%}")
+        if throughput_change is not None and throughput_change < -threshold:
+            regressions.append(f"{key[0]} c={key[1]}: throughput down {-throughput_change:.0%}")
+        if new["errors"] > old["errors"]:
+            regressions.append(f"{key[0]} c={key[1]}: errors {old['errors']} -> {new['errors']}")
+    return rows, regressions
+
+
+def format_change(change):
+    return "n/a" if change is None else f"{change:+.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%).")
+    args = parser.parse_args()
+
+    rows, regressions = compare(load_results(args.baseline), load_results(args.candidate), args.threshold)
+    print(f"{'route':<24} {'conc':>4} {'p95 ms (old -> new)':>26} {'change':>8} {'req/s (old -> new)':>24} {'change':>8}")
+    for row in rows:
+        print(
+            f"{row['route']:<24} {row['concurrency']:>4} "
+            f"{str(row['p95_ms'][0]) + ' -> ' + str(row['p95_ms'][1]):>26} {format_change(row['p95_change']):>8} "
+            f"{str(row['throughput_rps'][0]) + ' -> ' + str(row['throughput_rps'][1]):>24} {format_change(row['throughput_change']):>8}"
+        )
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions beyond the threshold.")
+
+
+if __name__ == "__main__":
+    main()
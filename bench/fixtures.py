@@ -0,0 +1,94 @@
+# bench/fixtures.py
+"""Synthetic landscaping photos for benchmarks.
+
+Images are generated deterministically (smooth colour gradients with sensor-like
+noise) so they compress to roughly the file sizes real phone photos have, without
+shipping binary fixtures in the repository.
+
+    python -m bench.fixtures --out bench/fixtures   # write the JPEGs to disk
+"""
+import argparse
+import base64
+import io
+import os
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# name -> (width, height, JPEG quality)
+FIXTURE_SIZES = {
+    "phone_12mp": (4032, 3024, 92),
+    "phone_8mp": (3264, 2448, 90),
+    "hd": (1920, 1080, 88),
+    "small": (800, 600, 85),
+}
+
+
+def generate_fixture_image(name, seed=0):
+    """Return the fixture ``name`` as a PIL image; ``seed`` varies the scene."""
+    width, height, _ = FIXTURE_SIZES[name]
+    # Sky over grass, drawn small and scaled up so the gradients are smooth
+    scene = Image.new("RGB", (64, 48))
+    draw = ImageDraw.Draw(scene)
+    horizon = 16 + seed % 8
+    for y in range(48):
+        if y < horizon:
+            draw.line([(0, y), (63, y)], fill=(120 + y * 3, 170 + y * 2, 230))
+        else:
+            shade = (y - horizon) * 3 + (seed * 17) % 40
+            draw.line([(0, y), (63, y)], fill=(60 + shade // 2, 110 + shade, 40 + shade // 3))
+    for index in range(6):
+        x = (seed * 13 + index * 11) % 60
+        draw.ellipse([x, horizon + 4 + index * 3, x + 6, horizon + 8 + index * 3], fill=(90, 70, 50))
+    scene = scene.resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+
+    # Foliage and sensor noise are what make real photos expensive to compress
+    noise = Image.effect_noise((width, height), 48 + seed % 5).convert("RGB")
+    return Image.blend(scene, noise, 0.15)
+
+
+def encode_fixture(image, name):
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=FIXTURE_SIZES[name][2])
+    return buffered.getvalue()
+
+
+def generate_fixture(name, seed=0):
+    """Return JPEG bytes for the fixture ``name``."""
+    return encode_fixture(generate_fixture_image(name, seed), name)
+
+
+def unique_variant(image, name, token):
+    """JPEG bytes of ``image`` with a small corner patch coloured by ``token``.
+
+    The patch survives normalization, so every variant has a distinct
+    normalized image and misses the content-addressed analysis cache.
+    """
+    variant = image.copy()
+    side = max(32, image.width // 64)
+    color = (token * 37 % 256, token * 91 % 256, token * 53 % 256)
+    ImageDraw.Draw(variant).rectangle([0, 0, side, side], fill=color)
+    return encode_fixture(variant, name)
+
+
+def to_data_url(jpeg_bytes):
+    return f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode('utf-8')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic benchmark photos to disk.")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument("--seeds", type=int, default=2, help="Variants to write per size.")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name in FIXTURE_SIZES:
+        for seed in range(args.seeds):
+            path = os.path.join(args.out, f"{name}_{seed}.jpg")
+            data = generate_fixture(name, seed)
+            with open(path, "wb") as fixture_file:
+                fixture_file.write(data)
+            print(f"Wrote {path} ({len(data)} bytes).")
+
+
+if __name__ == "__main__":
+    main()
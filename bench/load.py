@@ -0,0 +1,285 @@
+# bench/load.py
+"""Load driver for the report and chat endpoints.
+
+By default this starts the mock LLM server and the Flask app in-process on local
+ports, then drives each route at each concurrency level and records throughput
+and latency percentiles:
+
+    python -m bench.load --concurrency 1,4,16 --requests 32 --output bench/results/baseline.json
+
+Use ``--target http://host:port`` to drive an app that is already running (for
+example under gunicorn, pointed at ``python -m bench.mock_llm_server`` through
+NRP_BASE_URL). Compare two result files with ``python -m bench.compare``.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from bench.fixtures import FIXTURE_SIZES, encode_fixture, generate_fixture_image, to_data_url, unique_variant
+from bench.mock_llm_server import add_server_arguments, server_from_arguments
+
+ROUTES = ("suggest_tasks", "analyze_landscaping", "generate_final_report", "chat_query")
+
+REQUESTED_TASKS = "- Mow and edge the front lawn\n- Weed and mulch the garden beds\n- Trim the hedge along the fence\n- Reseed the bare patch by the walkway"
+CONTRACTOR_STATEMENT = "Mowed and edged the lawn, weeded and mulched both beds, trimmed the hedge. Reseeding is scheduled for next week."
+CHAT_REPORT = "\n\n".join(
+    f"### {index}. Section {index}\n" + "The beds along the fence need weeding and fresh mulch. " * 12
+    for index in range(1, 7)
+)
+
+
+class PayloadFactory:
+    """Builds request bodies. In ``cold`` cache mode every request carries images
+    with unique pixels, so no analysis or normalization result can be reused."""
+
+    def __init__(self, image_size, cache_mode):
+        self.image_size = image_size
+        self.cache_mode = cache_mode
+        self._before = generate_fixture_image(image_size, seed=0)
+        self._after = generate_fixture_image(image_size, seed=1)
+        self._before_url = to_data_url(encode_fixture(self._before, image_size))
+        self._after_url = to_data_url(encode_fixture(self._after, image_size))
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _images(self):
+        if self.cache_mode == "warm":
+            return self._before_url, self._after_url
+        with self._lock:
+            self._counter += 1
+            token = self._counter
+        return (
+            to_data_url(unique_variant(self._before, self.image_size, token)),
+            to_data_url(unique_variant(self._after, self.image_size, token)),
+        )
+
+    def build(self, route):
+        if route == "chat_query":
+            with self._lock:
+                self._counter += 1
+                token = self._counter
+            history = []
+            for turn in range(10):
+                history.append({"role": "user", "message": f"Question {turn} about the hedge and beds?"})
+                history.append({"role": "ai", "message": "The hedge was trimmed evenly and the beds were mulched. " * 4})
+            question = "Was the bare patch by the walkway reseeded?" + ("" if self.cache_mode == "warm" else f" ({token})")
+            history.append({"role": "user", "message": question})
+            return {
+                "user_question": question,
+                "context": {
+                    "original_tasks": REQUESTED_TASKS,
+                    "contractor_accomplishments": CONTRACTOR_STATEMENT,
+                    "full_report": CHAT_REPORT,
+                    "conversation_history": history,
+                },
+            }
+
+        before_image, after_image = self._images()
+        if route == "suggest_tasks":
+            return {"before_image": before_image}
+        if route == "analyze_landscaping":
+            return {
+                "before_image": before_image,
+                "after_image": after_image,
+                "requested_tasks": REQUESTED_TASKS,
+                "contractor_accomplishments": CONTRACTOR_STATEMENT,
+            }
+        return {
+            "before_image": before_image,
+            "after_image": after_image,
+            "requested_tasks": REQUESTED_TASKS,
+            "contractor_accomplishments": CONTRACTOR_STATEMENT,
+            "contractor_selected_tasks": REQUESTED_TASKS.splitlines()[:3],
+        }
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_latencies(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"p50": None, "p90": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(ordered, 0.50) * 1000, 2),
+        "p90": round(percentile(ordered, 0.90) * 1000, 2),
+        "p95": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99": round(percentile(ordered, 0.99) * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def run_level(client, target, route, concurrency, total_requests, payloads, timeout):
+    """Send ``total_requests`` requests to ``route`` from ``concurrency`` threads."""
+    # Bodies are built up front (in parallel, JPEG encoding releases the GIL) so it is not timed
+    with ThreadPoolExecutor() as pool:
+        bodies = list(pool.map(lambda _: json.dumps(payloads.build(route)).encode("utf-8"), range(total_requests)))
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def send(body):
+        started = time.perf_counter()
+        try:
+            response = client.post(f"{target}/{route}", content=body,
+                                   headers={"Content-Type": "application/json"}, timeout=timeout)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, bodies))
+    wall_seconds = time.perf_counter() - started
+
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "succeeded": len(latencies),
+        "errors": total_requests - len(latencies),
+        "status_counts": statuses,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_local_app(mock_base_url, data_dir, verbose=False):
+    """Import the app against the mock server and serve it on a free local port."""
+    os.environ["NRP_BASE_URL"] = mock_base_url
+    os.environ.setdefault("NRP_API_KEY", "mock")
+    os.environ["GARDEN_DATA_DIR"] = data_dir
+    from werkzeug.serving import make_server
+    import app as garden_app
+
+    if not verbose:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = make_server("127.0.0.1", 0, garden_app.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the landscaping report and chat endpoints.")
+    parser.add_argument("--target", help="Base URL of a running app. Omit to start the app and mock LLM in-process.")
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"Comma-separated subset of: {', '.join(ROUTES)}.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per route and concurrency level.")
+    parser.add_argument("--image-size", choices=sorted(FIXTURE_SIZES), default="phone_12mp")
+    parser.add_argument("--cache-mode", choices=("cold", "warm"), default="cold",
+                        help="cold: unique image bytes per request; warm: identical images so caches are hit.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--output", help="Write results as JSON to this path.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's log output.")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(",") if route.strip()]
+    unknown_routes = sorted(set(routes) - set(ROUTES))
+    if unknown_routes:
+        parser.error(f"Unknown routes: {', '.join(unknown_routes)}")
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+
+    mock_server = None
+    app_server = None
+    data_dir = tempfile.TemporaryDirectory(prefix="garden-bench-")
+    if args.target:
+        target = args.target.rstrip("/")
+    else:
+        mock_server = server_from_arguments(args).start()
+        app_server, target = start_local_app(mock_server.base_url, data_dir.name, args.verbose)
+
+    print(f"Generating {args.image_size} fixtures...", file=sys.stderr)
+    payloads = PayloadFactory(args.image_size, args.cache_mode)
+
+    results = []
+    log_sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with httpx.Client(limits=httpx.Limits(max_connections=max(concurrency_levels) * 2)) as client, log_sink:
+            for route in routes:
+                if args.cache_mode == "warm":
+                    client.post(f"{target}/{route}", json=payloads.build(route), timeout=args.timeout)
+                for concurrency in concurrency_levels:
+                    result = run_level(client, target, route, concurrency, args.requests, payloads, args.timeout)
+                    results.append(result)
+                    latency = result["latency_ms"]
+                    print(
+                        f"{route:<24} c={concurrency:<3} {result['throughput_rps']:>8} req/s  "
+                        f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms  "
+                        f"errors={result['errors']}",
+                        file=sys.stderr,
+                    )
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        if mock_server is not None:
+            mock_server.stop()
+        data_dir.cleanup()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.target or "in-process",
+            "image_size": args.image_size,
+            "cache_mode": args.cache_mode,
+            "requests_per_level": args.requests,
+            "mock_llm": None if args.target else {
+                "latency": args.latency,
+                "latency_jitter": args.latency_jitter,
+                "tokens_per_second": args.tokens_per_second,
+                "completion_tokens": args.completion_tokens,
+                "error_rate": args.error_rate,
+                "error_status": args.error_status,
+                "seed": args.seed,
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# bench/mock_llm_server.py
+"""Local stand-in for the OpenAI-compatible NRP endpoint.
+
+Serves ``POST /v1/chat/completions`` (plain and streamed) with a configurable
+time to first token, token generation rate and injected error rate, so the app
+can be benchmarked without network access or an API key.
+
+Run it on its own and point the app at it:
+
+    python -m bench.mock_llm_server --port 8001 --latency 0.4 --tokens-per-second 40
+    NRP_BASE_URL=http://127.0.0.1:8001/v1 NRP_API_KEY=mock python app.py
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-image prompt token estimate, matching chat_context.IMAGE_TOKEN_ESTIMATE
+IMAGE_PROMPT_TOKENS = 1500
+FILLER_WORDS = (
+    "The lawn shows patchy growth with bare soil near the walkway and weeds along the bed edges. "
+    "Mulch has been refreshed around the shrubs and the hedge line is trimmed evenly."
+).split()
+
+
+def estimate_prompt_tokens(messages):
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += len(part.get("text", "")) // 4
+                elif part.get("type") == "image_url":
+                    tokens += IMAGE_PROMPT_TOKENS
+        else:
+            tokens += len(content or "") // 4
+        tokens += 4
+    return tokens
+
+
+class MockLLMServer:
+    """Threaded mock server. ``latency`` is the time to first token in seconds;
+    each completion then produces ``completion_tokens`` (capped by the request's
+    ``max_tokens``) at ``tokens_per_second``. A fraction ``error_rate`` of
+    requests fail with ``error_status`` before generating anything."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, latency_jitter=0.1, tokens_per_second=50.0,
+                 completion_tokens=200, error_rate=0.0, error_status=503, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.request_count = 0
+        self.error_count = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def _uniform(self, low, high):
+        with self._random_lock:
+            return self._random.uniform(low, high)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/v1/models":
+                    self._send_json(200, {"object": "list", "data": [
+                        {"id": model_id, "object": "model", "owned_by": "mock"} for model_id in ("llava-onevision", "llama3")
+                    ]})
+                else:
+                    self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+                server.request_count += 1
+                payload = json.loads(body or b"{}")
+
+                if server.error_rate and server._uniform(0, 1) < server.error_rate:
+                    server.error_count += 1
+                    headers = {"Retry-After": "1"} if server.error_status == 429 else {}
+                    self._send_json(server.error_status, {
+                        "error": {"message": "Injected upstream failure", "type": "server_error"},
+                    }, headers)
+                    return
+
+                completion_id = f"chatcmpl-mock-{next(server._ids)}"
+                model = payload.get("model", "mock")
+                prompt_tokens = estimate_prompt_tokens(payload.get("messages", []))
+                completion_tokens = min(server.completion_tokens, payload.get("max_tokens") or server.completion_tokens)
+                words = [FILLER_WORDS[index % len(FILLER_WORDS)] for index in range(completion_tokens)]
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+                time_to_first_token = max(0.0, server.latency + server._uniform(-server.latency_jitter, server.latency_jitter))
+                token_interval = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+
+                if payload.get("stream"):
+                    include_usage = (payload.get("stream_options") or {}).get("include_usage", False)
+                    self._stream(completion_id, model, words, usage if include_usage else None,
+                                 time_to_first_token, token_interval)
+                    return
+
+                time.sleep(time_to_first_token + token_interval * completion_tokens)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id, model, words, usage, time_to_first_token, token_interval):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def chunk(choices, **extra):
+                    data = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                            "model": model, "choices": choices, **extra}
+                    self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                time.sleep(time_to_first_token)
+                try:
+                    for index, word in enumerate(words):
+                        if index:
+                            time.sleep(token_interval)
+                        delta = {"content": word if index == 0 else " " + word}
+                        if index == 0:
+                            delta["role"] = "assistant"
+                        chunk([{"index": 0, "delta": delta, "finish_reason": None}])
+                    chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                    if usage is not None:
+                        chunk([], usage=usage)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="Time to first token in seconds.")
+    parser.add_argument("--latency-jitter", type=float, default=0.1, help="Uniform +/- jitter on the time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Generation rate after the first token.")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens per reply (capped by max_tokens).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for jitter and error injection.")
+
+
+def server_from_arguments(args, host="127.0.0.1", port=0):
+    return MockLLMServer(
+        host=host, port=port, latency=args.latency, latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_arguments(args, args.host, args.port)
+    print(f"Mock LLM server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
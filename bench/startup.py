@@ -0,0 +1,115 @@
+# bench/startup.py
+"""Measure how long a fresh worker process takes to start serving.
+
+Each run starts a new Python process that imports ``wsgi`` (what a gunicorn
+worker does without preload_app), then answers a first /healthz and a first
+/readyz (which creates the worker's LLM client, pools and stores):
+
+    python -m bench.startup --runs 10 --output bench/results/startup.json
+
+Per-core request throughput is measured with ``bench.load --target``
+against ``gunicorn -c gunicorn.conf.py wsgi:app`` with GUNICORN_WORKERS set.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bench.load import git_revision
+
+# Runs in the child process; prints one JSON line of millisecond timings
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+client = wsgi.app.test_client()
+health = client.get('/healthz')
+healthy = time.perf_counter()
+ready = client.get('/readyz')
+readied = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_healthz_ms": (healthy - imported) * 1000,
+    "first_readyz_ms": (readied - healthy) * 1000,
+    "healthz_status": health.status_code,
+    "readyz_status": ready.status_code,
+    "pil_loaded": "PIL.Image" in sys.modules,
+    "numpy_loaded": "numpy" in sys.modules,
+}))
+"""
+
+TIMINGS = ("import_ms", "first_healthz_ms", "first_readyz_ms", "process_ms")
+
+
+def run_probe(repo_dir, data_dir):
+    env = {**os.environ, "GARDEN_DATA_DIR": data_dir, "TRACE_LOG": "0"}
+    env.setdefault("NRP_API_KEY", "mock")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=repo_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summarize(runs):
+    summary = {}
+    for timing in TIMINGS:
+        values = [run[timing] for run in runs]
+        summary[timing] = {
+            "min": round(min(values), 2),
+            "median": round(statistics.median(values), 2),
+            "max": round(max(values), 2),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker startup time.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to start.")
+    parser.add_argument("--output", help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for index in range(args.runs):
+        # A fresh data directory each run, as on a newly scheduled container
+        with tempfile.TemporaryDirectory(prefix="garden-startup-") as data_dir:
+            run = run_probe(repo_dir, data_dir)
+        runs.append(run)
+        print(
+            f"run {index + 1}: import={run['import_ms']:.0f}ms healthz={run['first_healthz_ms']:.0f}ms "
+            f"readyz={run['first_readyz_ms']:.0f}ms ({run['readyz_status']}) process={run['process_ms']:.0f}ms",
+            file=sys.stderr,
+        )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+        },
+        "summary": summarize(runs),
+        "runs": runs,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report["summary"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# blob_store.py
+"""Content-addressed image storage on local disk.
+
+Uploaded images are streamed to disk in chunks while being hashed, and stored
+under their SHA-256 digest. That digest is the image ID clients send back in
+place of a base64 data URL, so a photo is sent over the network once and every
+later call refers to it by ID.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobTooLargeError(Exception):
+    pass
+
+
+class BlobNotFoundError(Exception):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root, max_bytes=50 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+
+    def path_for(self, image_id):
+        if not IMAGE_ID_PATTERN.match(image_id or ""):
+            raise BlobNotFoundError(f"Invalid image ID '{image_id}'.")
+        return os.path.join(self.root, image_id[:2], image_id)
+
+    def exists(self, image_id):
+        try:
+            return os.path.exists(self.path_for(image_id))
+        except BlobNotFoundError:
+            return False
+
+    def save_stream(self, stream):
+        """Copy ``stream`` to disk in chunks and return (image_id, size_in_bytes)."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise BlobTooLargeError(f"Image exceeds the {self.max_bytes} byte upload limit.")
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+
+            image_id = digest.hexdigest()
+            final_path = self.path_for(image_id)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return image_id, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, image_id):
+        path = self.path_for(image_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def load_bytes(self, image_id):
+        path = self.path_for(image_id)
+        try:
+            with open(path, "rb") as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            raise BlobNotFoundError(f"Image '{image_id}' not found. Please upload it again.")
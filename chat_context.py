@@ -0,0 +1,291 @@
+# chat_context.py
+"""Token-budgeted prompt assembly for chat_query.
+
+The frontend sends the whole conversation plus the full report with every chat
+turn. Instead of forwarding all of it, ChatContextManager:
+
+* folds older turns into a rolling summary, produced in fixed-size chunks and
+  handed back to the client (``token_usage.conversation_summary``) so the next
+  turn only has to summarize the chunk that has aged out since,
+* keeps the most recent turns verbatim,
+* splits the report context into sections and keeps the ones most relevant to
+  the question,
+
+so the prompt stays within a configurable token budget no matter how long the
+conversation gets.
+"""
+import hashlib
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _encoding = None
+
+# Rough per-image cost for LLaVA-OneVision (a 384px tile is 729 tokens, and an
+# image normalized to <=1152px uses a base tile plus a few high-res crops).
+IMAGE_TOKEN_ESTIMATE = 1500
+# Role markers and chat template overhead per message
+MESSAGE_OVERHEAD_TOKENS = 4
+MAX_SECTION_TOKENS = 300
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_HEADING_PATTERN = re.compile(r"^\s*(#{1,6}\s|---.*---\s*$|\*\*[A-Z]\.|[A-Z]\.\s+\*\*)")
+_STOPWORDS = {
+    "the", "and", "for", "are", "was", "were", "this", "that", "with", "what", "which", "who",
+    "how", "why", "when", "where", "does", "did", "can", "could", "should", "would", "will",
+    "have", "has", "had", "any", "all", "about", "there", "their", "they", "them", "you",
+    "your", "our", "from", "into", "than", "then", "but", "not", "its", "it's", "been", "also",
+}
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # ~4 characters per token for English prose
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]) + "..."
+    return text[:max_tokens * 4] + "..."
+
+
+def message_tokens(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        total = 0
+        for part in content:
+            if part.get("type") == "text":
+                total += count_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                total += IMAGE_TOKEN_ESTIMATE
+    else:
+        total = count_tokens(content or "")
+    return total + MESSAGE_OVERHEAD_TOKENS
+
+
+def _keywords(text):
+    return {word for word in _WORD_PATTERN.findall(text.lower()) if len(word) > 2 and word not in _STOPWORDS}
+
+
+def split_sections(text):
+    """Split report text at headings, then break long sections at blank lines."""
+    sections, current = [], []
+    for line in text.splitlines():
+        if _HEADING_PATTERN.match(line) and any(existing.strip() for existing in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(line.strip() for line in current):
+        sections.append("\n".join(current).strip())
+
+    chunks = []
+    for section in sections:
+        if count_tokens(section) <= MAX_SECTION_TOKENS:
+            chunks.append(section)
+            continue
+        chunk = ""
+        for paragraph in re.split(r"\n\s*\n", section):
+            candidate = f"{chunk}\n\n{paragraph}" if chunk else paragraph
+            if chunk and count_tokens(candidate) > MAX_SECTION_TOKENS:
+                chunks.append(chunk)
+                chunk = paragraph
+            else:
+                chunk = candidate
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def history_message_text(message):
+    """Plain text of a conversation_history entry ({'role', 'message'} or OpenAI-style content)."""
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    if isinstance(content, str):
+        return content
+    return message.get("message", "")
+
+
+def render_transcript(messages):
+    return "\n".join(
+        f"{'User' if message.get('role') == 'user' else 'Assistant'}: {history_message_text(message)}"
+        for message in messages
+    )
+
+
+def _chunk_digest(messages):
+    return hashlib.sha256(render_transcript(messages).encode("utf-8")).hexdigest()[:16]
+
+
+class ChatContextManager:
+    """Builds chat prompts that fit ``prompt_token_budget``.
+
+    ``summarize(previous_summary, messages)`` must return a summary of
+    ``previous_summary`` extended with ``messages``; it is called once per
+    ``summary_chunk_messages`` turns that age out of the verbatim window.
+
+    The summary is returned as ``usage["conversation_summary"]`` and accepted
+    back as ``context["conversation_summary"]``, so each turn normally needs at
+    most one summarize call. However long the history sent by the client, one
+    request makes at most ``max_summary_calls`` calls and never summarizes
+    messages older than the last ``max_history_messages``; older messages that
+    no carried summary covers are left out.
+    """
+
+    def __init__(self, prompt_token_budget, summarize, keep_recent_messages=6,
+                 summary_chunk_messages=6, history_share=0.4, max_history_messages=200, max_summary_calls=2):
+        self.prompt_token_budget = prompt_token_budget
+        self.summarize = summarize
+        self.keep_recent_messages = keep_recent_messages
+        self.summary_chunk_messages = summary_chunk_messages
+        self.history_share = history_share
+        self.max_history_messages = max_history_messages
+        self.max_summary_calls = max_summary_calls
+
+    def _carried_summary(self, history, boundary, carried):
+        """(covered_messages, text) from a summary the client sent back, or (0, "") if it does not fit ``history``."""
+        if not isinstance(carried, dict):
+            return 0, ""
+        covered, text, digest = carried.get("messages"), carried.get("text"), carried.get("digest")
+        chunk = self.summary_chunk_messages
+        if (not isinstance(covered, int) or not isinstance(text, str) or isinstance(covered, bool)
+                or covered <= 0 or covered > boundary or covered % chunk):
+            return 0, ""
+        # The last summarized chunk must still be the same messages (the history was not edited or reset)
+        if digest != _chunk_digest(history[covered - chunk:covered]):
+            return 0, ""
+        return covered, text
+
+    def _rolling_summary(self, history, boundary, carried):
+        """Summary of ``history[:boundary]``. Returns (text, state to hand back, summarize calls, messages left out)."""
+        chunk = self.summary_chunk_messages
+        covered, summary = self._carried_summary(history, boundary, carried)
+        # Bound the upstream work one request can cause, keeping the most recent chunks
+        first = max(covered, boundary - self.max_summary_calls * chunk, len(history) - self.max_history_messages)
+        first = min(boundary, -(-first // chunk) * chunk)
+        calls = 0
+        for start in range(first, boundary, chunk):
+            summary = self.summarize(summary, history[start:start + chunk])
+            calls += 1
+        if boundary <= 0:
+            return "", None, calls, 0
+        state = {"messages": boundary, "digest": _chunk_digest(history[boundary - chunk:boundary]), "text": summary}
+        return summary, state, calls, first - covered
+
+    def build(self, question, context, conversation_history, image_count=0):
+        """Return (history_messages, context_text, usage) for the current question.
+
+        ``history_messages`` are OpenAI chat messages for the turns kept
+        verbatim; ``context_text`` holds the conversation summary and the
+        selected project context; ``usage`` reports the token accounting.
+        """
+        history = [message for message in (conversation_history or []) if history_message_text(message)]
+        # The frontend appends the current question to the history before sending it
+        if history and history[-1].get("role") == "user" and history_message_text(history[-1]).strip() == question.strip():
+            history = history[:-1]
+
+        question_text = "User's Question: " + question
+        fixed_tokens = count_tokens(question_text) + image_count * IMAGE_TOKEN_ESTIMATE + MESSAGE_OVERHEAD_TOKENS
+        available_tokens = max(self.prompt_token_budget - fixed_tokens, 0)
+        history_budget = int(available_tokens * self.history_share)
+
+        # --- Conversation history: rolling summary of older turns + recent turns verbatim ---
+        aged_count = max(len(history) - self.keep_recent_messages, 0)
+        summary_boundary = aged_count - aged_count % self.summary_chunk_messages
+        summary_text, summary_state, summary_calls, unsummarized_messages = self._rolling_summary(
+            history, summary_boundary, context.get("conversation_summary"),
+        )
+        verbatim = history[summary_boundary:]
+
+        summary_block = f"--- Summary of Earlier Conversation ---\n{summary_text}\n\n" if summary_text else ""
+        summary_tokens = count_tokens(summary_block)
+        if summary_tokens > history_budget:
+            summary_block = truncate_to_tokens(summary_block, history_budget) + "\n\n"
+            summary_tokens = count_tokens(summary_block)
+
+        history_messages = [
+            {"role": "user" if message.get("role") == "user" else "assistant", "content": history_message_text(message)}
+            for message in verbatim
+        ]
+        history_tokens = summary_tokens + sum(message_tokens(message) for message in history_messages)
+        dropped_messages = 0
+        while history_messages and history_tokens > history_budget:
+            history_tokens -= message_tokens(history_messages.pop(0))
+            dropped_messages += 1
+
+        # --- Project context: most relevant sections within the remaining budget ---
+        context_budget = available_tokens - history_tokens
+        candidates = []
+        for label, key, essential in (
+            ("Original Requested Tasks", "original_tasks", True),
+            ("Contractor's Accomplishments (Statement)", "contractor_accomplishments", True),
+            ("Initial Project Analysis (Before Image)", "before_analysis", False),
+            ("Full Project Report", "full_report", False),
+        ):
+            value = context.get(key)
+            if not value:
+                continue
+            for section in split_sections(value):
+                candidates.append({"label": label, "text": section, "essential": essential,
+                                   "tokens": count_tokens(section), "order": len(candidates)})
+
+        # The full report repeats the 'before' analysis and task list; drop exact duplicates
+        seen_texts = set()
+        unique_candidates = []
+        for candidate in candidates:
+            if candidate["text"] not in seen_texts:
+                seen_texts.add(candidate["text"])
+                unique_candidates.append(candidate)
+
+        question_keywords = _keywords(question)
+        for candidate in unique_candidates:
+            overlap = len(question_keywords & _keywords(candidate["text"]))
+            candidate["score"] = overlap + (100 if candidate["essential"] else 0)
+
+        selected, context_tokens = [], 0
+        for candidate in sorted(unique_candidates, key=lambda c: (-c["score"], c["order"])):
+            if context_tokens + candidate["tokens"] <= context_budget:
+                selected.append(candidate)
+                context_tokens += candidate["tokens"]
+        selected.sort(key=lambda c: c["order"])
+
+        context_lines = ["Here is relevant context from the user's landscaping project:\n\n"]
+        current_label = None
+        for candidate in selected:
+            if candidate["label"] != current_label:
+                if current_label is not None:
+                    context_lines.append("\n")
+                context_lines.append(f"--- {candidate['label']} ---\n")
+                current_label = candidate["label"]
+            context_lines.append(candidate["text"] + "\n")
+        if selected:
+            context_lines.append("\n")
+        context_text = summary_block + "".join(context_lines) + question_text
+
+        usage = {
+            "prompt_token_budget": self.prompt_token_budget,
+            "estimated_prompt_tokens": fixed_tokens + history_tokens + count_tokens("".join(context_lines)),
+            "history_tokens": history_tokens,
+            "context_tokens": context_tokens,
+            "image_tokens": image_count * IMAGE_TOKEN_ESTIMATE,
+            "summarized_messages": summary_boundary - unsummarized_messages,
+            "unsummarized_messages": unsummarized_messages,
+            "summary_calls": summary_calls,
+            "verbatim_messages": len(history_messages),
+            "dropped_messages": dropped_messages,
+            "context_sections_used": len(selected),
+            "context_sections_total": len(unique_candidates),
+            # Send back as context.conversation_summary with the next turn
+            "conversation_summary": summary_state,
+        }
+        return history_messages, context_text, usage
@@ -0,0 +1,66 @@
+# gunicorn.conf.py
+"""Production serving configuration: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Handlers spend nearly all their time waiting on the LLM endpoint and stream
+responses from generators, so workers are threaded (gthread) rather than async:
+each thread holds one in-flight request while the model calls run on the
+worker's own pools. The app is preloaded in the master, so Flask, the OpenAI
+SDK and the prompts are imported once and every forked worker starts from that
+copy; clients, pools and SQLite connections are only created inside a worker
+(see resources.py).
+
+Every setting can be overridden with the GUNICORN_* variables below. Note that
+LLM_MODEL_CONCURRENCY and the other LLM_* limits apply per worker process, and
+that /metrics reports the counters of whichever worker answers the scrape.
+In-memory caches are per process too: the normalized-image and image-diff
+caches only hit on the worker that filled them. The analysis cache defaults
+to the SQLite backend, which every worker shares; ANALYSIS_CACHE_BACKEND=memory
+makes it per worker as well.
+"""
+import multiprocessing
+import os
+import time
+
+_started = time.monotonic()
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# One process per core handles image decoding and JSON work; threads cover the waiting
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+# Final reports and batch inspections can hold a request open for minutes
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+# Recycle each worker after a few thousand requests (jittered so workers do not
+# restart together) to hand back memory fragmented by decoding large photos; the
+# in-memory caches are bounded and simply start empty again. A recycled worker
+# finishes or fails its background jobs first (see worker_exit). 0 disables.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def when_ready(server):
+    server.log.info("Master ready in %.0f ms (preload_app=%s).", (time.monotonic() - _started) * 1000, preload_app)
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.monotonic()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.0f ms.", worker.pid, (time.monotonic() - worker.fork_started) * 1000)
+
+
+def worker_exit(server, worker):
+    # Runs in the exiting worker (recycled, reloaded or shut down): give its queued
+    # and running jobs the graceful timeout to finish, then report the rest failed
+    # so pollers are told to resubmit instead of waiting for the heartbeat to lapse
+    from app import get_job_queue
+
+    if get_job_queue.created():
+        get_job_queue().shutdown(timeout=graceful_timeout)
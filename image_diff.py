@@ -0,0 +1,156 @@
+# image_diff.py
+"""Local before/after image comparison.
+
+Perceptual hashes (a gradient dHash and a DCT-based pHash) recognize re-uploads
+and near-identical photos, and a coarse grid of pixel differences shows where
+the scene changed. Both take milliseconds on normalized images, so they run
+before any vision model call and a pair with no visible change can be answered
+without one.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from analysis_cache import InMemoryCache, image_content_hash
+from image_processing import data_url_to_bytes
+
+HASH_SIZE = 8
+# pHash is taken from the low frequencies of a 32x32 DCT
+PHASH_SAMPLE_SIZE = HASH_SIZE * 4
+# Long side of the grayscale copy hashes and region differences are computed on
+DIFF_SAMPLE_SIDE = 256
+IMAGE_DIFF_GRID = int(os.environ.get("IMAGE_DIFF_GRID", 8))
+# Pairs within this many differing hash bits (of 64) on both hashes...
+IMAGE_DIFF_HASH_THRESHOLD = int(os.environ.get("IMAGE_DIFF_HASH_THRESHOLD", 4))
+# ...and with no grid cell whose mean absolute difference exceeds this are near-identical.
+# JPEG recompression stays around 0.003 and a 10% exposure change around 0.01, while
+# trimming a shrub to ~85% of its width inside one cell reaches ~0.03.
+IMAGE_DIFF_REGION_THRESHOLD = float(os.environ.get("IMAGE_DIFF_REGION_THRESHOLD", 0.02))
+HOTSPOT_COUNT = 3
+
+_comparison_cache = InMemoryCache(max_entries=256, ttl_seconds=3600)
+
+
+def _load_gray(data):
+    """Decode ``data`` straight to a grayscale image of at most DIFF_SAMPLE_SIDE on the long side."""
+    image = Image.open(io.BytesIO(data))
+    # Let the JPEG decoder downscale while decoding
+    image.draft("L", (DIFF_SAMPLE_SIDE, DIFF_SAMPLE_SIDE))
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((DIFF_SAMPLE_SIDE, DIFF_SAMPLE_SIDE), Image.BILINEAR, reducing_gap=2.0)
+    return image
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix, so ``M @ X @ M.T`` is the 2-D DCT of ``X``."""
+    frequencies = np.arange(size)[:, None]
+    positions = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * positions + 1) * frequencies / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_PHASH_DCT = _dct_matrix(PHASH_SAMPLE_SIZE)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(gray_image):
+    """Difference hash: whether each pixel is brighter than its left neighbour on a 9x8 thumbnail."""
+    pixels = np.asarray(gray_image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray_image):
+    """Perceptual hash: low-frequency DCT coefficients compared to their median."""
+    pixels = np.asarray(gray_image.resize((PHASH_SAMPLE_SIZE, PHASH_SAMPLE_SIZE), Image.LANCZOS), dtype=np.float64)
+    low_frequencies = (_PHASH_DCT @ pixels @ _PHASH_DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only reflects overall brightness
+    median = np.median(low_frequencies.flatten()[1:])
+    return _bits_to_int(low_frequencies > median)
+
+
+def hamming_distance(first_hash, second_hash):
+    return bin(first_hash ^ second_hash).count("1")
+
+
+def region_differences(before_gray, after_gray, grid=IMAGE_DIFF_GRID):
+    """Mean absolute difference (0-1) per cell of a ``grid`` x ``grid`` layout, and over the whole image."""
+    size = (max(grid, before_gray.width), max(grid, before_gray.height))
+    before_pixels = np.asarray(before_gray.resize(size, Image.BILINEAR), dtype=np.float32) / 255.0
+    after_pixels = np.asarray(after_gray.resize(size, Image.BILINEAR), dtype=np.float32) / 255.0
+    # Match overall brightness so a change in exposure or time of day is not read as work done
+    after_pixels = after_pixels - after_pixels.mean() + before_pixels.mean()
+    difference = np.abs(before_pixels - after_pixels)
+    cells = np.array([
+        [band.mean() for band in np.array_split(row_band, grid, axis=1)]
+        for row_band in np.array_split(difference, grid, axis=0)
+    ])
+    return cells, float(difference.mean())
+
+
+def _evidence(identical, dhash_distance, phash_distance, cells, mean_difference):
+    max_region_difference = float(cells.max())
+    changed = cells > IMAGE_DIFF_REGION_THRESHOLD
+    hotspots = sorted(
+        ({"row": int(row), "col": int(col), "difference": round(float(cells[row, col]), 4)} for row, col in zip(*np.nonzero(changed))),
+        key=lambda hotspot: -hotspot["difference"],
+    )[:HOTSPOT_COUNT]
+    return {
+        "identical": identical,
+        "near_identical": identical or (
+            dhash_distance <= IMAGE_DIFF_HASH_THRESHOLD
+            and phash_distance <= IMAGE_DIFF_HASH_THRESHOLD
+            and max_region_difference <= IMAGE_DIFF_REGION_THRESHOLD
+        ),
+        "dhash_distance": dhash_distance,
+        "phash_distance": phash_distance,
+        "mean_difference": round(mean_difference, 4),
+        "max_region_difference": round(max_region_difference, 4),
+        "changed_region_fraction": round(float(changed.mean()), 4),
+        "heatmap": {
+            "rows": cells.shape[0],
+            "cols": cells.shape[1],
+            "cells": [[round(float(value), 4) for value in row] for row in cells],
+        },
+        "hotspots": hotspots,
+        "thresholds": {"hash_distance": IMAGE_DIFF_HASH_THRESHOLD, "region_difference": IMAGE_DIFF_REGION_THRESHOLD},
+    }
+
+
+def compare_images(before_data_url, after_data_url):
+    """Compare two (normalized) images and return the change evidence as a JSON-ready dict.
+
+    ``heatmap.cells[row][col]`` is the mean absolute brightness difference (0-1)
+    of that grid cell, row 0 being the top of the image.
+    """
+    before_bytes = data_url_to_bytes(before_data_url)
+    after_bytes = data_url_to_bytes(after_data_url)
+    before_hash, after_hash = image_content_hash(before_bytes), image_content_hash(after_bytes)
+    cache_key = f"{before_hash}:{after_hash}"
+    cached = _comparison_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if before_hash == after_hash:
+        evidence = _evidence(True, 0, 0, np.zeros((IMAGE_DIFF_GRID, IMAGE_DIFF_GRID)), 0.0)
+    else:
+        before_gray = _load_gray(before_bytes)
+        after_gray = _load_gray(after_bytes)
+        cells, mean_difference = region_differences(before_gray, after_gray)
+        evidence = _evidence(
+            False,
+            hamming_distance(dhash(before_gray), dhash(after_gray)),
+            hamming_distance(phash(before_gray), phash(after_gray)),
+            cells,
+            mean_difference,
+        )
+    _comparison_cache.set(cache_key, evidence)
+    return evidence
@@ -0,0 +1,141 @@
+# image_processing.py
+"""Image decoding and normalization for requests to the vision model.
+
+Browsers upload full-resolution phone photos as base64 data URLs. Before any of
+those reach LLaVA they are decoded once, EXIF-oriented, downscaled to the
+model's effective input resolution and re-encoded, which keeps request payloads
+and upstream inference time down.
+
+Pillow is imported on first use rather than at import, so app workers start
+without loading it.
+"""
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_cache import InMemoryCache, image_content_hash
+from metrics import record_image_normalization, span, submit_in_context
+from resources import per_process
+
+# LLaVA-OneVision tiles images into 384px crops (up to a 3x3 grid), so anything
+# beyond ~1152px on the long side is discarded by the model anyway.
+VISION_MAX_IMAGE_SIDE = int(os.environ.get("VISION_MAX_IMAGE_SIDE", 1152))
+VISION_IMAGE_FORMAT = os.environ.get("VISION_IMAGE_FORMAT", "JPEG").upper()
+VISION_IMAGE_QUALITY = int(os.environ.get("VISION_IMAGE_QUALITY", 85))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 4))
+
+
+@per_process
+def get_image_executor():
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-normalize")
+
+
+# Chat turns re-send the same images, so remember recent normalization results
+_normalized_cache = InMemoryCache(max_entries=64, ttl_seconds=3600)
+
+
+def pil_to_base64_data_url(pil_image, format="PNG", **save_kwargs):
+    buffered = io.BytesIO()
+    pil_image.save(buffered, format=format, **save_kwargs)
+    return f"data:image/{format.lower()};base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+
+
+def data_url_to_bytes(data_url):
+    header, encoded = data_url.split(",", 1)
+    return base64.b64decode(encoded)
+
+
+# EXIF tag holding the camera rotation; 1 means the pixels are already upright
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _open_oriented(data):
+    """Decode ``data`` upright and in RGB. Returns (image, source format, whether the source bytes already were)."""
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    source_format = image.format
+    # Phone cameras store rotation in EXIF rather than in the pixel data, and
+    # vision servers ignore EXIF, so rotated photos must be re-encoded upright
+    upright_rgb = image.mode == "RGB" and image.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB"), source_format, upright_rgb
+
+
+def bytes_to_pil(data):
+    return _open_oriented(data)[0]
+
+
+def base64_data_url_to_pil(data_url):
+    return bytes_to_pil(data_url_to_bytes(data_url))
+
+
+def normalize_image_bytes(original_bytes):
+    """Return a downscaled, re-encoded data URL for ``original_bytes`` and stats about the bytes saved.
+
+    The stats are also exported as the garden_image_bytes_* metrics, on cache hits too.
+    """
+    raw_hash = image_content_hash(original_bytes)
+    cached = _normalized_cache.get(raw_hash)
+    if cached is not None:
+        record_image_normalization(cached[1])
+        return cached
+
+    from PIL import Image
+
+    with span("image_decode"):
+        image, source_format, upright_rgb = _open_oriented(original_bytes)
+    original_size = image.size
+    with span("image_resize_encode"):
+        if max(image.size) > VISION_MAX_IMAGE_SIDE:
+            image.thumbnail((VISION_MAX_IMAGE_SIDE, VISION_MAX_IMAGE_SIDE), Image.LANCZOS)
+
+        save_kwargs = {"quality": VISION_IMAGE_QUALITY}
+        if VISION_IMAGE_FORMAT == "JPEG":
+            save_kwargs["optimize"] = True
+        normalized_data_url = pil_to_base64_data_url(image, format=VISION_IMAGE_FORMAT, **save_kwargs)
+    normalized_length = len(normalized_data_url.split(",", 1)[1]) * 3 // 4
+
+    # Small, already-compressed uploads can come out larger after re-encoding; send
+    # those as they are unless the original still needs rotating or converting
+    if normalized_length >= len(original_bytes) and image.size == original_size and source_format and upright_rgb:
+        content_type = Image.MIME.get(source_format, f"image/{source_format.lower()}")
+        normalized_data_url = f"data:{content_type};base64,{base64.b64encode(original_bytes).decode('utf-8')}"
+        normalized_length = len(original_bytes)
+
+    stats = {
+        "original_bytes": len(original_bytes),
+        "normalized_bytes": normalized_length,
+        "bytes_saved": len(original_bytes) - normalized_length,
+        "original_size": list(original_size),
+        "normalized_size": list(image.size),
+    }
+    print(
+        f"Normalized image {original_size[0]}x{original_size[1]} -> {image.size[0]}x{image.size[1]}, "
+        f"{stats['original_bytes']} -> {stats['normalized_bytes']} bytes ({stats['bytes_saved']} saved)."
+    )
+    record_image_normalization(stats)
+    result = (normalized_data_url, stats)
+    _normalized_cache.set(raw_hash, result)
+    return result
+
+
+def normalize_image_data_url(data_url):
+    return normalize_image_bytes(data_url_to_bytes(data_url))
+
+
+def normalize_images(*sources):
+    """Normalize several images in the image thread pool and return their data URLs.
+
+    Each source is a data URL or raw image bytes; ``None`` entries are passed through.
+    """
+    with span("image_normalize"):
+        futures = [
+            submit_in_context(
+                get_image_executor(), normalize_image_bytes if isinstance(source, bytes) else normalize_image_data_url, source,
+            )
+            if source else None
+            for source in sources
+        ]
+        return [future.result()[0] if future is not None else None for future in futures]
@@ -0,0 +1,278 @@
+# jobs.py
+"""Background job queue for long-running report generation.
+
+Jobs run on a bounded thread pool and their status and results are kept in a
+local SQLite database so any worker process can answer status polls. Jobs made
+of many parts (e.g. batch inspections) also record each part's result as soon
+as it is done, so readers can follow progress and nothing finished is lost if
+the reader goes away. The queue that owns a queued or running job refreshes its
+heartbeat, so a job whose worker process died (restart, deploy, crash) is
+reported as failed within a minute instead of being polled forever. Submitting
+the same inputs while an identical job is still queued or running returns the
+existing job instead of starting another one.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+LOST_JOB_ERROR = (
+    "The job was lost before it finished: the server process running it stopped "
+    "(for example during a restart or deploy). Please submit it again."
+)
+
+
+def job_input_hash(kind, payload):
+    digest = hashlib.sha256()
+    digest.update(kind.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(payload, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class JobStore:
+    """SQLite-backed job status and result store."""
+
+    def __init__(self, path, lost_after_seconds=60):
+        self.path = path
+        # Queued/running jobs whose heartbeat is older than this are assumed lost
+        # (their worker process stopped): they no longer absorb duplicate
+        # submissions and are reported as failed when polled.
+        self.lost_after_seconds = lost_after_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " input_hash TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " heartbeat_at REAL)"
+        )
+        try:
+            # Databases created before heartbeats were recorded
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        except sqlite3.OperationalError:
+            pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_input_hash ON jobs (input_hash, status)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            " job_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, position))"
+        )
+
+    def create_or_get_active(self, kind, input_hash):
+        """Create a queued job, or return the active job with the same inputs. Returns (job, created)."""
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front so two worker processes
+            # cannot both miss the active job and create duplicates.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE input_hash = ? AND status IN (?, ?) "
+                    "AND COALESCE(heartbeat_at, created_at) > ? ORDER BY created_at DESC LIMIT 1",
+                    (input_hash, JOB_QUEUED, JOB_RUNNING, now - self.lost_after_seconds),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("COMMIT")
+                    return self._row_to_job(row), False
+
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, input_hash, status, created_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, input_hash, JOB_QUEUED, now, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id), True
+
+    # Each transition only applies to a job still in the expected state, so a job
+    # already reported as lost stays failed. They return whether it applied.
+    def mark_running(self, job_id):
+        return self._update(job_id, (JOB_QUEUED,), status=JOB_RUNNING, started_at=time.time())
+
+    def mark_succeeded(self, job_id, result):
+        return self._update(job_id, (JOB_QUEUED, JOB_RUNNING), status=JOB_SUCCEEDED, result=json.dumps(result), finished_at=time.time())
+
+    def mark_failed(self, job_id, error):
+        return self._update(job_id, (JOB_QUEUED, JOB_RUNNING), status=JOB_FAILED, error=error, finished_at=time.time())
+
+    def heartbeat(self, job_ids):
+        """Record that the queue owning these jobs is still alive."""
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({placeholders}) AND status IN (?, ?)",
+                (time.time(), *job_ids, JOB_QUEUED, JOB_RUNNING),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and self._is_lost(row):
+                # Fail a lost job on read so pollers stop waiting on it; the status
+                # and heartbeat checks keep this from overwriting a job that just
+                # finished or was just kept alive
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?) "
+                    "AND COALESCE(heartbeat_at, created_at) <= ?",
+                    (JOB_FAILED, LOST_JOB_ERROR, time.time(), job_id, JOB_QUEUED, JOB_RUNNING,
+                     time.time() - self.lost_after_seconds),
+                )
+                row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def _is_lost(self, row):
+        last_seen = row["heartbeat_at"] if row["heartbeat_at"] is not None else row["created_at"]
+        return row["status"] in (JOB_QUEUED, JOB_RUNNING) and last_seen <= time.time() - self.lost_after_seconds
+
+    def add_item(self, job_id, result):
+        """Append one part's result to a job, in completion order."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_items (job_id, position, result) "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0), ? FROM job_items WHERE job_id = ?",
+                (job_id, json.dumps(result), job_id),
+            )
+
+    def get_items(self, job_id, start=0):
+        """The job's part results from position ``start`` on."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM job_items WHERE job_id = ? AND position >= ? ORDER BY position", (job_id, start),
+            ).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+    def _update(self, job_id, from_statuses, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        placeholders = ", ".join("?" for _ in from_statuses)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status IN ({placeholders})",
+                (*fields.values(), job_id, *from_statuses),
+            )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _row_to_job(row):
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job.pop("input_hash")
+        job.pop("heartbeat_at")
+        return job
+
+
+class JobQueue:
+    """Runs submitted jobs on a bounded worker pool and records their outcome in a JobStore.
+
+    A background thread refreshes the heartbeat of every job this queue holds
+    (queued or running) every ``heartbeat_seconds``; keep that well below the
+    store's ``lost_after_seconds``.
+    """
+
+    def __init__(self, store, max_workers=4, format_error=str, heartbeat_seconds=10):
+        self.store = store
+        self.format_error = format_error
+        self.heartbeat_seconds = heartbeat_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._active = set()
+        self._active_lock = threading.Lock()
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def submit(self, kind, payload, func, pass_job_id=False):
+        """Queue ``func(payload)`` unless an identical job is already in flight. Returns (job, created).
+
+        With ``pass_job_id`` the job runs ``func(job_id, payload)``, e.g. to record part results.
+        """
+        job, created = self.store.create_or_get_active(kind, job_input_hash(kind, payload))
+        if created:
+            if pass_job_id:
+                func = partial(func, job["id"])
+            with self._active_lock:
+                self._active.add(job["id"])
+            self._executor.submit(self._run, job["id"], kind, payload, func)
+        else:
+            print(f"Duplicate {kind} submission collapsed onto job {job['id']}.")
+        return job, created
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def shutdown(self, timeout):
+        """Let held jobs finish for up to ``timeout`` seconds, then fail the rest.
+
+        For a worker process about to exit (e.g. recycled by gunicorn): its jobs are
+        reported failed right away instead of once their heartbeat runs out.
+        """
+        # Jobs already queued still run; new submissions are refused
+        self._executor.shutdown(wait=False)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._active_lock:
+                if not self._active:
+                    return
+            time.sleep(0.1)
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._active_lock:
+            job_ids = list(self._active)
+        for job_id in job_ids:
+            self.store.mark_failed(job_id, LOST_JOB_ERROR)
+        print(f"Worker stopping with {len(job_ids)} unfinished job(s); marked them failed.")
+
+    def _run(self, job_id, kind, payload, func):
+        try:
+            if not self.store.mark_running(job_id):
+                print(f"Job {job_id} ({kind}) was no longer queued (reported lost); not running it.")
+                return
+            print(f"Job {job_id} ({kind}) started.")
+            try:
+                result = func(payload)
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed: {e}")
+                traceback.print_exc()
+                self.store.mark_failed(job_id, self.format_error(e))
+                return
+            if self.store.mark_succeeded(job_id, result):
+                print(f"Job {job_id} ({kind}) finished.")
+            else:
+                print(f"Job {job_id} ({kind}) finished after it was reported lost; result discarded.")
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._active_lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                self.store.heartbeat(job_ids)
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
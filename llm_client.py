@@ -0,0 +1,351 @@
+# llm_client.py
+"""Resilient wrapper around the OpenAI-compatible NRP endpoint.
+
+All chat completion calls go through LLMClient, which owns:
+
+* the HTTP connection pool and timeouts,
+* per-model concurrency slots and token-bucket request rate limits,
+* retries with jittered exponential backoff on 429/5xx/connection errors,
+* a per-model circuit breaker that fails fast while the upstream is down (5xx,
+  connection and timeout errors; a 429 means it is up but throttling),
+* a record of latency, token usage and outcome for every call.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    DefaultHttpxClient,
+    OpenAI,
+    RateLimitError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """Raised without calling upstream when a model's circuit is open or its rate limit wait times out."""
+
+
+def parse_model_settings(text):
+    """Parse ``"model-a=4,model-b=8"`` into ``{"model-a": "4", "model-b": "8"}``."""
+    settings = {}
+    for entry in (text or "").split(","):
+        if entry.strip():
+            model_id, value = entry.split("=", 1)
+            settings[model_id.strip()] = value.strip()
+    return settings
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average with bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive upstream failures and lets a
+    single trial call through once ``reset_seconds`` have passed.
+
+    Every trial must end in ``record_success``, ``record_failure`` or
+    ``release_trial``; a trial that reports nothing within ``trial_timeout``
+    seconds is abandoned and the next call becomes a new trial.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_seconds=30, trial_timeout=None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.trial_timeout = reset_seconds if trial_timeout is None else trial_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if (self.state == self.OPEN and now - self._opened_at >= self.reset_seconds) or (
+                self.state == self.HALF_OPEN and now - self._trial_started_at >= self.trial_timeout
+            ):
+                self.state = self.HALF_OPEN
+                self._trial_started_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        """End a call that told nothing about the upstream (cancelled, or never sent).
+
+        A half-open breaker goes back to open with its wait already over, so the
+        next call is let through as a new trial.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_seconds
+
+
+def _is_retryable(error):
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _trips_breaker(error):
+    """Whether a retryable error means the upstream is down rather than throttling (429)."""
+    return _is_retryable(error) and not isinstance(error, RateLimitError)
+
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    def __init__(self, api_key, base_url, timeout=120.0, connect_timeout=10.0,
+                 max_connections=32, max_keepalive_connections=16,
+                 max_retries=3, retry_base_delay=0.5, retry_max_delay=20.0,
+                 concurrency_limits=None, rate_limits=None, rate_limit_timeout=30.0,
+                 circuit_failure_threshold=5, circuit_reset_seconds=30.0, history_size=1000):
+        self._client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            # Retries are handled here so they respect the circuit breaker and rate limits
+            max_retries=0,
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                ),
+            ),
+        )
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.rate_limit_timeout = rate_limit_timeout
+        self._semaphores = {
+            model_id: threading.BoundedSemaphore(int(limit)) for model_id, limit in (concurrency_limits or {}).items()
+        }
+        self._buckets = {}
+        for model_id, setting in (rate_limits or {}).items():
+            rate, _, burst = str(setting).partition(":")
+            self._buckets[model_id] = TokenBucket(float(rate), float(burst or rate))
+        self._circuit_failure_threshold = circuit_failure_threshold
+        self._circuit_reset_seconds = circuit_reset_seconds
+        # A trial call can legitimately take as long as one request may
+        self._circuit_trial_timeout = max(circuit_reset_seconds, timeout + connect_timeout)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.recent_calls = deque(maxlen=history_size)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Register ``listener(record)``, called after every completed or failed call."""
+        self._listeners.append(listener)
+
+    def breaker_for(self, model_id):
+        with self._breakers_lock:
+            if model_id not in self._breakers:
+                self._breakers[model_id] = CircuitBreaker(
+                    self._circuit_failure_threshold, self._circuit_reset_seconds, self._circuit_trial_timeout,
+                )
+            return self._breakers[model_id]
+
+    def slot(self, model_id):
+        """Context manager holding one of ``model_id``'s concurrency slots (unlimited if not configured)."""
+        return self._semaphores.get(model_id, nullcontext())
+
+    def create(self, model, messages, **kwargs):
+        """Non-streaming chat completion with retries. Returns the OpenAI response object."""
+        started = time.monotonic()
+        attempts = 0
+        with self.slot(model):
+            while True:
+                attempts += 1
+                self._admit(model, started, attempts, "create")
+                try:
+                    response = self._client.chat.completions.create(model=model, messages=messages, **kwargs)
+                except Exception as e:
+                    if self._should_retry(model, e, attempts):
+                        continue
+                    self._settle_breaker(model, e)
+                    self._record(model, "create", started, attempts, e)
+                    raise
+                self.breaker_for(model).record_success()
+                self._record(model, "create", started, attempts, None, response.usage)
+                return response
+
+    def stream(self, model, messages, **kwargs):
+        """Streaming chat completion. Yields chunks; retries only before the first chunk arrives."""
+        started = time.monotonic()
+        attempts = 0
+        usage = None
+        with self.slot(model):
+            while True:
+                attempts += 1
+                self._admit(model, started, attempts, "stream")
+                received_chunk = False
+                try:
+                    for chunk in self._client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs):
+                        received_chunk = True
+                        if getattr(chunk, "usage", None):
+                            usage = chunk.usage
+                        yield chunk
+                except GeneratorExit:
+                    # The consumer stopped reading (e.g. the browser disconnected) after
+                    # at least one chunk, so the upstream was answering
+                    self.breaker_for(model).record_success()
+                    self._record(model, "stream", started, attempts, None, usage, outcome="cancelled")
+                    raise
+                except Exception as e:
+                    if not received_chunk and self._should_retry(model, e, attempts):
+                        continue
+                    if received_chunk and _is_retryable(e):
+                        self._count_retryable(model, e)
+                    else:
+                        self._settle_breaker(model, e)
+                    self._record(model, "stream", started, attempts, e, usage)
+                    raise
+                self.breaker_for(model).record_success()
+                self._record(model, "stream", started, attempts, None, usage)
+                return
+
+    def _admit(self, model, started, attempts, operation):
+        """Check the circuit breaker and wait for a rate-limit token before an attempt."""
+        if not self.breaker_for(model).allow():
+            error = LLMUnavailableError(f"{model} is temporarily unavailable (upstream circuit open). Please retry shortly.")
+            self._record(model, operation, started, attempts, error, outcome="circuit_open")
+            raise error
+        bucket = self._buckets.get(model)
+        if bucket is not None and not bucket.acquire(self.rate_limit_timeout):
+            # Nothing was sent, so a trial granted by allow() above must not stay pending
+            self.breaker_for(model).release_trial()
+            error = LLMUnavailableError(f"{model} is at its request rate limit. Please retry shortly.")
+            self._record(model, operation, started, attempts, error, outcome="rate_limited")
+            raise error
+
+    def _settle_breaker(self, model, error):
+        """Report a non-retryable error to the breaker.
+
+        An HTTP error status (400, 401, 422, ...) means the upstream is up and
+        answering, which closes the breaker; any other error never reached it.
+        Retryable errors were already counted by ``_should_retry``.
+        """
+        if _is_retryable(error):
+            return
+        if isinstance(error, APIStatusError):
+            self.breaker_for(model).record_success()
+        else:
+            self.breaker_for(model).release_trial()
+
+    def _count_retryable(self, model, error):
+        if _trips_breaker(error):
+            self.breaker_for(model).record_failure()
+        else:
+            # A 429 comes from an upstream that is up; it is handled by backoff,
+            # Retry-After and the token bucket, never by opening the circuit
+            self.breaker_for(model).record_success()
+
+    def _should_retry(self, model, error, attempts):
+        if not _is_retryable(error):
+            return False
+        self._count_retryable(model, error)
+        if attempts > self.max_retries:
+            return False
+        # Full jitter keeps many workers from retrying in lockstep
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1)))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.retry_max_delay))
+        print(f"LLM call to {model} failed ({type(error).__name__}); retry {attempts}/{self.max_retries} in {delay:.2f}s.")
+        time.sleep(delay)
+        return True
+
+    def _record(self, model, operation, started, attempts, error, usage=None, outcome=None):
+        if outcome is None:
+            outcome = "success" if error is None else f"error:{type(error).__name__}"
+        record = {
+            "model": model,
+            "operation": operation,
+            "outcome": outcome,
+            "latency_seconds": time.monotonic() - started,
+            "attempts": attempts,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "finished_at": time.time(),
+        }
+        self.recent_calls.append(record)
+        print(
+            f"LLM {operation} {model}: {outcome} in {record['latency_seconds']:.2f}s "
+            f"({attempts} attempt(s), prompt={record['prompt_tokens']}, completion={record['completion_tokens']})."
+        )
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"LLM call listener failed: {e}")
+
+    def stats(self):
+        """Aggregate the recent call records per model."""
+        summary = {}
+        for record in list(self.recent_calls):
+            model_stats = summary.setdefault(record["model"], {
+                "calls": 0, "errors": 0, "retries": 0, "latency_seconds_total": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            model_stats["calls"] += 1
+            model_stats["errors"] += record["outcome"] not in ("success", "cancelled")
+            model_stats["retries"] += record["attempts"] - 1
+            model_stats["latency_seconds_total"] += record["latency_seconds"]
+            model_stats["prompt_tokens"] += record["prompt_tokens"] or 0
+            model_stats["completion_tokens"] += record["completion_tokens"] or 0
+        for model_id, model_stats in summary.items():
+            model_stats["circuit_state"] = self.breaker_for(model_id).state
+        return summary
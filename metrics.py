@@ -0,0 +1,242 @@
+# metrics.py
+"""Prometheus-style metrics and per-request stage tracing.
+
+Each request (or background job) gets a trace. Code wraps its stages in
+``span("stage_name")``; every span is recorded in the stage histogram labelled
+by route and model and appended to the trace, which is logged as one JSON line
+when the request finishes. ``render_metrics()`` produces the Prometheus text
+exposition format served at /metrics.
+
+Metrics live in process memory, so with several worker processes each one
+reports its own series.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TRACE_LOG = os.environ.get("TRACE_LOG", "1").lower() in ("1", "true", "yes")
+
+_current_trace = contextvars.ContextVar("garden_trace", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for upper_bound, count in zip(self.buckets, series["counts"]):
+                    labels = _format_labels(self.labelnames, key, {"le": repr(float(upper_bound))})
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "garden_request_duration_seconds", "End-to-end request duration, including streamed bodies.",
+    ("route", "method", "status"),
+)
+STAGE_DURATION = Histogram(
+    "garden_stage_duration_seconds", "Duration of individual request stages.",
+    ("route", "stage", "model"),
+)
+LLM_CALL_DURATION = Histogram(
+    "garden_llm_call_duration_seconds", "Duration of chat completion calls, including retries.",
+    ("route", "model", "operation", "outcome"),
+)
+LLM_TOKENS = Counter(
+    "garden_llm_tokens_total", "Tokens reported by the upstream model.",
+    ("route", "model", "kind"),
+)
+IMAGE_BYTES = Counter(
+    "garden_image_bytes_total", "Image bytes as uploaded (original) and as sent upstream (normalized).",
+    ("route", "kind"),
+)
+IMAGE_BYTES_SAVED = Counter(
+    "garden_image_bytes_saved_total", "Image bytes kept out of upstream requests by normalization.",
+    ("route",),
+)
+REGISTRY = [REQUEST_DURATION, STAGE_DURATION, LLM_CALL_DURATION, LLM_TOKENS, IMAGE_BYTES, IMAGE_BYTES_SAVED]
+
+
+def render_gauge(name, documentation, labelnames, samples):
+    """Exposition lines for a gauge computed at scrape time from ``(label_values, value)`` pairs."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for label_values, value in samples:
+        lines.append(f"{name}{_format_labels(labelnames, label_values)} {value}")
+    return lines
+
+
+def render_metrics(extra_lines=()):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    def __init__(self, route, method=""):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add_span(self, stage, started, duration, **attributes):
+        self.spans.append({
+            "stage": stage,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+            **attributes,
+        })
+
+
+def start_trace(route, method=""):
+    """Begin a trace for the current context. Returns a token for finish_trace."""
+    return _current_trace.set(Trace(route, method))
+
+
+def current_route():
+    trace = _current_trace.get()
+    return trace.route if trace is not None else "background"
+
+
+def finish_trace(token, status):
+    trace = _current_trace.get()
+    try:
+        _current_trace.reset(token)
+    except ValueError:  # finished from a different context than it was started in
+        _current_trace.set(None)
+    if trace is None:
+        return
+    duration = time.perf_counter() - trace.started
+    REQUEST_DURATION.observe(duration, route=trace.route, method=trace.method, status=status)
+    if TRACE_LOG:
+        print("TRACE " + json.dumps({
+            "route": trace.route,
+            "method": trace.method,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "spans": trace.spans,
+        }))
+
+
+@contextmanager
+def trace(route, method=""):
+    """Trace a unit of work that is not a Flask request, such as a background job."""
+    token = start_trace(route, method)
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        finish_trace(token, status)
+
+
+@contextmanager
+def span(stage, model=""):
+    """Time a stage of the current request and record it in the stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_DURATION.observe(duration, route=current_route(), stage=stage, model=model)
+        trace = _current_trace.get()
+        if trace is not None:
+            attributes = {"model": model} if model else {}
+            trace.add_span(stage, started, duration, **attributes)
+
+
+def record_llm_call(record):
+    """LLMClient listener: export a finished call as metrics and as a span on the current trace."""
+    route = current_route()
+    LLM_CALL_DURATION.observe(
+        record["latency_seconds"], route=route, model=record["model"],
+        operation=record["operation"], outcome=record["outcome"],
+    )
+    STAGE_DURATION.observe(record["latency_seconds"], route=route, stage="llm_call", model=record["model"])
+    for kind in ("prompt", "completion"):
+        if record[f"{kind}_tokens"]:
+            LLM_TOKENS.inc(record[f"{kind}_tokens"], route=route, model=record["model"], kind=kind)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(
+            "llm_call", time.perf_counter() - record["latency_seconds"], record["latency_seconds"],
+            model=record["model"], operation=record["operation"], outcome=record["outcome"],
+            attempts=record["attempts"], prompt_tokens=record["prompt_tokens"],
+            completion_tokens=record["completion_tokens"],
+        )
+
+
+def record_image_normalization(stats):
+    """Export the byte counts of one normalized image (see image_processing.normalize_image_bytes)."""
+    route = current_route()
+    IMAGE_BYTES.inc(stats["original_bytes"], route=route, kind="original")
+    IMAGE_BYTES.inc(stats["normalized_bytes"], route=route, kind="normalized")
+    # An upright re-encode of a small rotated photo can come out larger; counters never go down
+    IMAGE_BYTES_SAVED.inc(max(0, stats["bytes_saved"]), route=route)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """``executor.submit`` that carries the caller's trace into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,45 @@
+# resources.py
+"""Lazily created, per-process shared resources.
+
+HTTP clients, thread pools and SQLite connections must not be created at
+import time: a gunicorn master that preloads the app would build them once and
+every forked worker would inherit its sockets, connections and (dead) pool
+threads. Factories decorated with ``per_process`` instead run on first use in
+each process, and are forgotten in a forked child so it builds its own.
+"""
+import os
+import threading
+from functools import wraps
+
+_instances = {}
+_lock = threading.RLock()
+
+
+def per_process(factory):
+    """Turn ``factory`` into a getter that creates its resource once per process, on first call.
+
+    A factory that raises is retried on the next call. ``getter.created()`` tells
+    whether the resource exists yet without creating it.
+    """
+    @wraps(factory)
+    def get():
+        instance = _instances.get(factory)
+        if instance is None:
+            # Re-entrant: one factory may use another's getter
+            with _lock:
+                instance = _instances.get(factory)
+                if instance is None:
+                    instance = _instances[factory] = factory()
+        return instance
+
+    get.created = lambda: factory in _instances
+    return get
+
+
+def _forget_instances_after_fork():
+    global _lock
+    _instances.clear()
+    _lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_forget_instances_after_fork)
@@ -31,60 +31,113 @@ document.addEventListener('DOMContentLoaded', () => {
     const downloadFinalReportBtn = document.getElementById('downloadFinalReportBtn');
 
 
-    let beforeImageDataURL = null;
-    let afterImageDataURLs = []; // Array for multiple images
+    let beforeImageId = null;    // Server-side IDs returned by /upload_image
+    let afterImageIds = [];      // Array for multiple images
     let requestedTasks = [];     // Array to store tasks
     let storedBeforeAnalysisText = null;
     let storedOriginalTasksText = null; // Store tasks as a raw string for BID download
     let currentReport = null; // Store the last generated full report for chat context
     let chatConversationHistory = []; // Store chat messages for context
+    let chatConversationSummary = null; // Server-built summary of older messages, sent back each turn
 
 
-    // --- Image Upload Handlers ---
-    function handleImageUpload(event, fileNameDisplay) {
-        const files = event.target.files;
-        if (files.length > 0) {
-            let names = [];
-            let dataURLs = [];
-            let filesProcessed = 0; // Counter for async reads
-
-            // Clear previous image data if it's a new selection
-            if (event.target.id === 'beforeImageUpload') {
-                beforeImageDataURL = null;
-            } else if (event.target.id === 'afterImageUpload') {
-                afterImageDataURLs = [];
-            }
+    // --- Streaming (Server-Sent Events) Helper ---
+    // EventSource only supports GET, so read the POST response body and parse SSE frames by hand.
+    async function postEventStream(url, body, onEvent) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body),
+        });
 
-            for (let i = 0; i < files.length; i++) {
-                const file = files[i];
-                names.push(file.name);
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    dataURLs.push(e.target.result);
-                    filesProcessed++;
-                    // Only assign when all files are read to ensure completeness
-                    if (filesProcessed === files.length) {
-                        if (event.target.id === 'beforeImageUpload') {
-                            beforeImageDataURL = dataURLs[0]; // Only take the first for 'before'
-                            console.log('beforeImageDataURL set:', file.name);
-                        } else if (event.target.id === 'afterImageUpload') {
-                            afterImageDataURLs = dataURLs; // Store all after images
-                            console.log('afterImageDataURLs set:', names.join(', '));
-                            updateCompletedTaskList(); // Update Block 2's list
-                        }
-                    }
-                };
-                reader.readAsDataURL(file);
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let donePayload = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+
+                let eventName = 'message';
+                let dataText = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) dataText += line.slice(6);
+                });
+                const payload = dataText ? JSON.parse(dataText) : {};
+
+                if (eventName === 'error') throw new Error(payload.error);
+                if (eventName === 'done') donePayload = payload;
+                else onEvent(eventName, payload);
             }
-            fileNameDisplay.textContent = names.join(', ');
-            console.log(`Selected files for ${event.target.id}: ${names.join(', ')}`);
+        }
+
+        if (!donePayload) throw new Error('Stream ended before the response was complete.');
+        return donePayload;
+    }
+
+
+    // --- Image Upload Handlers ---
+    // Images are uploaded once and referenced by ID afterwards, so the (large)
+    // image bytes are not re-sent with every report or chat request.
+    async function uploadImageFile(file) {
+        const formData = new FormData();
+        formData.append('image', file);
+        const response = await fetch('/upload_image', { method: 'POST', body: formData });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        return data.image_id;
+    }
+
+    async function handleImageUpload(event, fileNameDisplay) {
+        const files = Array.from(event.target.files);
+        const isBefore = event.target.id === 'beforeImageUpload';
+
+        // Clear previous image data if it's a new selection
+        if (isBefore) {
+            beforeImageId = null;
         } else {
+            afterImageIds = [];
+        }
+
+        if (files.length === 0) {
             fileNameDisplay.textContent = 'No files chosen';
-            if (event.target.id === 'beforeImageUpload') {
-                beforeImageDataURL = null;
-            } else if (event.target.id === 'afterImageUpload') {
-                afterImageDataURLs = [];
+            return;
+        }
+
+        const names = files.map(file => file.name);
+        fileNameDisplay.textContent = `Uploading ${names.join(', ')}...`;
+        console.log(`Selected files for ${event.target.id}: ${names.join(', ')}`);
+
+        try {
+            const imageIds = await Promise.all(files.map(uploadImageFile));
+            if (isBefore) {
+                beforeImageId = imageIds[0]; // Only take the first for 'before'
+                console.log('beforeImageId set:', names[0]);
+            } else {
+                afterImageIds = imageIds; // Store all after images
+                console.log('afterImageIds set:', names.join(', '));
+                updateCompletedTaskList(); // Update Block 2's list
             }
+            fileNameDisplay.textContent = names.join(', ');
+        } catch (error) {
+            console.error('Error uploading images:', error);
+            fileNameDisplay.textContent = 'Upload failed';
+            alert('Failed to upload image: ' + error.message);
         }
     }
 
@@ -143,7 +196,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Suggest Tasks Functionality ---
     suggestTasksBtn.addEventListener('click', async () => {
         console.log('Suggest Tasks button clicked!');
-        if (!beforeImageDataURL) {
+        if (!beforeImageId) {
             alert('Please upload a "Before" image first to get task suggestions.');
             return;
         }
@@ -157,7 +210,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const response = await fetch('/suggest_tasks', { // NEW ENDPOINT
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ before_image: beforeImageDataURL })
+                body: JSON.stringify({ before_image_id: beforeImageId })
             });
 
             if (!response.ok) {
@@ -184,6 +237,7 @@ document.addEventListener('DOMContentLoaded', () => {
             sendChatBtn.disabled = false;
             chatHistory.innerHTML = '<div class="ai-message">Hi! I can answer questions about your landscaping project. Start by suggesting tasks or analyzing your images.</div>';
             chatConversationHistory = [{ role: 'ai', message: 'Hi! I can answer questions about your landscaping project. Start by suggesting tasks or analyzing your images.' }];
+            chatConversationSummary = null;
 
 
         } catch (error) {
@@ -201,7 +255,7 @@ document.addEventListener('DOMContentLoaded', () => {
         console.log('Analyze button clicked!');
         
         // --- MODIFIED VALIDATION: Only 'before' image is strictly required for initial report ---
-        if (!beforeImageDataURL) { 
+        if (!beforeImageId) { 
             alert('Please upload a "Before" image to generate the initial report.');
             return;
         }
@@ -216,26 +270,18 @@ document.addEventListener('DOMContentLoaded', () => {
         sendChatBtn.disabled = true;
 
         try {
-            const response = await fetch('/analyze_landscaping', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    before_image: beforeImageDataURL,
-                    // Send first after image if available, otherwise null
-                    after_image: afterImageDataURLs.length > 0 ? afterImageDataURLs[0] : null, 
-                    requested_tasks: requestedTasks.join('\n'), 
-                    contractor_accomplishments: contractorAccomplishmentsInput.value.trim() 
-                }),
+            reportOutput.textContent = '';
+            const data = await postEventStream('/analyze_landscaping/stream', {
+                before_image_id: beforeImageId,
+                // Send first after image if available, otherwise null
+                after_image_id: afterImageIds.length > 0 ? afterImageIds[0] : null, 
+                requested_tasks: requestedTasks.join('\n'), 
+                contractor_accomplishments: contractorAccomplishmentsInput.value.trim() 
+            }, (eventName, payload) => {
+                // Section headers and model tokens are both appended as they arrive
+                loadingSpinner.style.display = 'none';
+                reportOutput.textContent += payload.text;
             });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
             console.log('Received API Response Data:', data);
 
             storedBeforeAnalysisText = data.before_analysis_text;
@@ -249,6 +295,7 @@ document.addEventListener('DOMContentLoaded', () => {
             sendChatBtn.disabled = false;
             chatHistory.innerHTML = '<div class="ai-message">Hi! I can answer questions about your landscaping project once you\'ve generated the initial report.</div>';
             chatConversationHistory = [{ role: 'ai', message: 'Hi! I can answer questions about your landscaping project once you\'ve generated the initial report.' }];
+            chatConversationSummary = null;
 
         } catch (error) {
             console.error('Error during fetch or processing:', error);
@@ -314,7 +361,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     finalizeWorkBtn.addEventListener('click', async () => {
         console.log('Finalize Work button clicked!');
-        if (!beforeImageDataURL || afterImageDataURLs.length === 0 || requestedTasks.length === 0) {
+        if (!beforeImageId || afterImageIds.length === 0 || requestedTasks.length === 0) {
             alert('Please ensure Block 1 is complete and "After Images" are uploaded in Block 2.');
             return;
         }
@@ -332,7 +379,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Block 3 Logic (Final Report) ---
     downloadFinalReportBtn.addEventListener('click', async () => {
         console.log('Download Final Report button clicked!');
-        if (!beforeImageDataURL || afterImageDataURLs.length === 0 || requestedTasks.length === 0) {
+        if (!beforeImageId || afterImageIds.length === 0 || requestedTasks.length === 0) {
             alert('Please complete Block 1 and upload After Images in Block 2.');
             return;
         }
@@ -346,26 +393,21 @@ document.addEventListener('DOMContentLoaded', () => {
         loadingSpinner.style.display = 'block';
 
         try {
-            const response = await fetch('/generate_final_report', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    before_image: beforeImageDataURL,
-                    after_image: afterImageDataURLs.length > 0 ? afterImageDataURLs[0] : null,
-                    requested_tasks: requestedTasks.join('\n'), 
-                    contractor_accomplishments: contractorAccomplishments,
-                    contractor_selected_tasks: selectedTasks
-                }),
+            finalReportOutput.textContent = '';
+            const data = await postEventStream('/generate_final_report/stream', {
+                // Per-task verdicts are kept per 'before' image, so re-runs only re-verify what changed
+                project_id: beforeImageId,
+                before_image_id: beforeImageId,
+                after_image_id: afterImageIds.length > 0 ? afterImageIds[0] : null,
+                requested_tasks: requestedTasks.join('\n'), 
+                contractor_accomplishments: contractorAccomplishments,
+                contractor_selected_tasks: selectedTasks
+            }, (eventName, payload) => {
+                loadingSpinner.style.display = 'none';
+                // Per-task verdicts stream in one by one; the assembled report replaces them at the end
+                if (eventName === 'task') finalReportOutput.textContent += `- ${payload.task}: ${payload.label}\n`;
+                else finalReportOutput.textContent += payload.text;
             });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
             console.log('Received Final Report Data:', data);
             finalReportOutput.textContent = data.final_report;
 
@@ -408,35 +450,38 @@ document.addEventListener('DOMContentLoaded', () => {
         chatConversationHistory.push({ role: 'user', message: userMessage });
 
         try {
-            const response = await fetch('/chat_query', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    user_question: userMessage,
-                    before_image: beforeImageDataURL,
-                    after_image: afterImageDataURLs.length > 0 ? afterImageDataURLs[0] : null, 
-                    context: {
-                        before_analysis: storedBeforeAnalysisText,
-                        original_tasks: storedOriginalTasksText,
-                        contractor_accomplishments: contractorAccomplishmentsInput.value.trim(),
-                        full_report: currentReport,
-                        conversation_history: chatConversationHistory 
-                    }
-                }),
+            let aiMessageDiv = null;
+            const data = await postEventStream('/chat_query/stream', {
+                user_question: userMessage,
+                before_image_id: beforeImageId,
+                after_image_id: afterImageIds.length > 0 ? afterImageIds[0] : null, 
+                context: {
+                    before_analysis: storedBeforeAnalysisText,
+                    original_tasks: storedOriginalTasksText,
+                    contractor_accomplishments: contractorAccomplishmentsInput.value.trim(),
+                    full_report: currentReport,
+                    conversation_history: chatConversationHistory,
+                    conversation_summary: chatConversationSummary
+                }
+            }, (eventName, payload) => {
+                chatLoadingSpinner.style.display = 'none';
+                if (!aiMessageDiv) {
+                    aiMessageDiv = displayChatMessage('', 'ai');
+                }
+                aiMessageDiv.textContent += payload.text;
+                chatHistory.scrollTop = chatHistory.scrollHeight;
             });
-
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
             console.log('Received Chat API Response:', data);
             const aiMessage = data.response;
-            displayChatMessage(aiMessage, 'ai');
+            if (aiMessageDiv) {
+                aiMessageDiv.textContent = aiMessage;
+            } else {
+                displayChatMessage(aiMessage, 'ai');
+            }
             chatConversationHistory.push({ role: 'ai', message: aiMessage });
+            if (data.token_usage && data.token_usage.conversation_summary) {
+                chatConversationSummary = data.token_usage.conversation_summary;
+            }
 
         } catch (error) {
             console.error('Error during chat query:', error);
@@ -455,6 +500,7 @@ document.addEventListener('DOMContentLoaded', () => {
         messageDiv.textContent = message;
         chatHistory.appendChild(messageDiv);
         chatHistory.scrollTop = chatHistory.scrollHeight;
+        return messageDiv;
     }
 
     // Initialize chat input state
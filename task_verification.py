@@ -0,0 +1,324 @@
+# task_verification.py
+"""Per-task verification verdicts for the final report.
+
+Instead of one free-text report per request, every requested task gets a
+structured verdict from a JSON-schema-constrained model call. Verdicts are
+stored per project, task, image pair and claim, so a re-run only sends the
+model the tasks whose inputs changed:
+
+* a task already verified against the same 'before'/'after' pair with the same
+  claim is reused as is,
+* a task verified as completed from any 'after' photo of the project stays
+  completed, whichever order the photos were checked in (other photos are
+  only checked for tasks still outstanding),
+* checking or unchecking a task in ``contractor_selected_tasks`` re-verifies
+  just that task.
+
+The final report text is then assembled locally from the verdicts. A task the
+model returned no usable verdict for is reported as not verified and leaves the
+payment decision undetermined rather than counting against the contractor.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+STATUS_COMPLETED = "completed"
+STATUS_COMPLETED_SUBSTITUTION = "completed_with_substitution"
+STATUS_PARTIAL = "partially_completed"
+STATUS_PARTIAL_SUBSTITUTION = "partially_completed_with_substitution"
+STATUS_NOT_COMPLETED = "not_completed"
+STATUS_NOT_VISIBLE = "not_visible"
+# Set locally when the model returned no usable verdict; never stored
+STATUS_UNVERIFIED = "unverified"
+
+COMPLETED_STATUSES = (STATUS_COMPLETED, STATUS_COMPLETED_SUBSTITUTION)
+PARTIAL_STATUSES = (STATUS_PARTIAL, STATUS_PARTIAL_SUBSTITUTION)
+MODEL_STATUSES = (
+    STATUS_COMPLETED, STATUS_COMPLETED_SUBSTITUTION, STATUS_PARTIAL, STATUS_PARTIAL_SUBSTITUTION,
+    STATUS_NOT_COMPLETED, STATUS_NOT_VISIBLE,
+)
+STATUS_LABELS = {
+    STATUS_COMPLETED: "Completed",
+    STATUS_COMPLETED_SUBSTITUTION: "Completed (with material substitution)",
+    STATUS_PARTIAL: "Partially Completed",
+    STATUS_PARTIAL_SUBSTITUTION: "Partially Completed (with material substitution)",
+    STATUS_NOT_COMPLETED: "Not Completed",
+    STATUS_NOT_VISIBLE: "Not Completed (not visible in the 'after' photo)",
+    STATUS_UNVERIFIED: "Not Verified (no usable model verdict; will be retried)",
+}
+
+DECISION_MEETS_TEXT = "Meets Requirements for Payment"
+DECISION_PARTIAL_TEXT = "Partially Meets Requirements - Further Action Needed"
+DECISION_FAILS_TEXT = "Does Not Meet Requirements - Payment Withheld"
+# A model or parse failure is not evidence about the work, so it never decides payment
+DECISION_UNDETERMINED_TEXT = "Undetermined - Manual Review Needed"
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tasks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "task_number": {"type": "integer"},
+                    "status": {"type": "string", "enum": list(MODEL_STATUSES)},
+                    "evidence": {"type": "string"},
+                    "material_substitution": {"type": ["string", "null"]},
+                },
+                "required": ["task_number", "status", "evidence", "material_substitution"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["tasks"],
+    "additionalProperties": False,
+}
+VERDICT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "task_verifications", "strict": True, "schema": VERDICT_SCHEMA},
+}
+# Strictest first; endpoints without schema support reject it with a 400, and the
+# prompt asks for the same JSON either way (None sends no response_format at all)
+VERDICT_RESPONSE_FORMATS = (VERDICT_RESPONSE_FORMAT, {"type": "json_object"}, None)
+
+_JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+_TASKS_ARRAY_PATTERN = re.compile(r'"tasks"\s*:\s*\[')
+_ENTRY_SEPARATORS = " \t\r\n,"
+
+
+def normalize_task(task):
+    """Task text as used for matching claims and keying verdicts."""
+    return " ".join(task.strip().lstrip("-*•").split()).casefold()
+
+
+def task_hash(task):
+    return hashlib.sha256(normalize_task(task).encode("utf-8")).hexdigest()
+
+
+def parse_verdicts(content, tasks):
+    """Map the model's JSON reply onto ``tasks`` (numbered from 1).
+
+    Returns {task_number: verdict}; tasks the reply does not cover are left out.
+    """
+    try:
+        payload = json.loads(content)
+    except (TypeError, ValueError):
+        # Without server-side schema enforcement the JSON may come wrapped in prose
+        match = _JSON_OBJECT_PATTERN.search(content or "")
+        if match is None:
+            return {}
+        try:
+            payload = json.loads(match.group(0))
+        except ValueError:
+            return {}
+
+    verdicts = {}
+    entries = payload.get("tasks", []) if isinstance(payload, dict) else []
+    for entry in entries if isinstance(entries, list) else []:
+        parsed = _parse_entry(entry, tasks)
+        if parsed is not None:
+            verdicts[parsed[0]] = parsed[1]
+    return verdicts
+
+
+def _parse_entry(entry, tasks):
+    """(task_number, verdict) for one entry of the reply's ``tasks`` array, or None if unusable."""
+    if not isinstance(entry, dict):
+        return None
+    number = entry.get("task_number")
+    if not isinstance(number, int) or not 1 <= number <= len(tasks) or entry.get("status") not in MODEL_STATUSES:
+        return None
+    return number, {
+        "status": entry["status"],
+        "evidence": str(entry.get("evidence") or ""),
+        "material_substitution": entry.get("material_substitution") or None,
+    }
+
+
+class VerdictStreamParser:
+    """Picks verdicts out of a streamed reply as soon as each entry of its ``tasks`` array closes.
+
+    ``feed`` each text chunk and report the (task_number, verdict) pairs it returns;
+    ``finish`` returns any verdicts only a parse of the whole reply could find.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.text = ""
+        self.verdicts = {}
+        self._decoder = json.JSONDecoder()
+        self._position = None
+
+    def feed(self, text):
+        self.text += text
+        if self._position is None:
+            match = _TASKS_ARRAY_PATTERN.search(self.text)
+            if match is None:
+                return []
+            self._position = match.end()
+
+        found = []
+        while True:
+            position = self._position
+            while position < len(self.text) and self.text[position] in _ENTRY_SEPARATORS:
+                position += 1
+            if position >= len(self.text) or self.text[position] == "]":
+                break
+            try:
+                entry, self._position = self._decoder.raw_decode(self.text, position)
+            except ValueError:
+                # The entry is still arriving
+                break
+            found.extend(self._accept(_parse_entry(entry, self.tasks)))
+        return found
+
+    def finish(self):
+        found = []
+        for parsed in parse_verdicts(self.text, self.tasks).items():
+            found.extend(self._accept(parsed))
+        return found
+
+    def _accept(self, parsed):
+        if parsed is None or parsed[0] in self.verdicts:
+            return []
+        self.verdicts[parsed[0]] = parsed[1]
+        return [parsed]
+
+
+def payment_decision_text(verdicts):
+    statuses = [verdict["status"] for verdict in verdicts]
+    if STATUS_UNVERIFIED in statuses:
+        return DECISION_UNDETERMINED_TEXT
+    if statuses and all(status in COMPLETED_STATUSES for status in statuses):
+        return DECISION_MEETS_TEXT
+    if not any(status in COMPLETED_STATUSES + PARTIAL_STATUSES for status in statuses):
+        return DECISION_FAILS_TEXT
+    return DECISION_PARTIAL_TEXT
+
+
+def assemble_final_report(verdicts, contractor_accomplishments_text):
+    """Final report text (sections A-C, same layout as the free-text report) built from verdicts."""
+    task_lines = []
+    for verdict in verdicts:
+        line = f"- {verdict['task']}: {STATUS_LABELS[verdict['status']]}."
+        if verdict.get("material_substitution"):
+            line += f" Substitution: {verdict['material_substitution']}."
+        if verdict.get("evidence"):
+            line += f" {verdict['evidence']}"
+        task_lines.append(line)
+
+    unverified = [verdict["task"] for verdict in verdicts if verdict["status"] == STATUS_UNVERIFIED]
+    claimed = [verdict for verdict in verdicts if verdict["claimed"]]
+    claimed_but_open = [
+        verdict["task"] for verdict in claimed
+        if verdict["status"] not in COMPLETED_STATUSES and verdict["status"] != STATUS_UNVERIFIED
+    ]
+    done_unclaimed = [verdict["task"] for verdict in verdicts if not verdict["claimed"] and verdict["status"] in COMPLETED_STATUSES]
+    comparison_lines = []
+    if contractor_accomplishments_text:
+        comparison_lines.append(f"Contractor's statement: {contractor_accomplishments_text}")
+    if not claimed:
+        comparison_lines.append("The contractor did not mark any tasks as completed.")
+    elif claimed_but_open:
+        comparison_lines.append("Claimed as completed but not verified as completed: " + "; ".join(claimed_but_open) + ".")
+    elif not unverified:
+        comparison_lines.append("Every task the contractor marked as completed was verified as completed.")
+    if done_unclaimed:
+        comparison_lines.append("Verified as completed although not marked by the contractor: " + "; ".join(done_unclaimed) + ".")
+
+    decision = payment_decision_text(verdicts)
+    outstanding = [
+        verdict["task"] for verdict in verdicts
+        if verdict["status"] not in COMPLETED_STATUSES and verdict["status"] != STATUS_UNVERIFIED
+    ]
+    justification_lines = []
+    if unverified:
+        justification_lines.append(
+            "No usable verdict for: " + "; ".join(unverified) + ". Re-run the report or review these tasks manually."
+        )
+    if outstanding:
+        justification_lines.append("Outstanding tasks: " + "; ".join(outstanding) + ".")
+    if not justification_lines:
+        justification_lines.append("All requested tasks were verified as completed.")
+    justification = "\n".join(justification_lines)
+
+    return (
+        "A. **VERIFY ALL REQUESTED TASKS:**\n" + "\n".join(task_lines) + "\n\n"
+        "B. **COMPARE TO CONTRACTOR'S CLAIM:**\n" + "\n".join(comparison_lines) + "\n\n"
+        f"C. **PAYMENT VALIDATION DECISION:** {decision}\n{justification}"
+    )
+
+
+class TaskVerificationStore:
+    """SQLite store of per-task verdicts keyed by project, task, image pair and claim."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS task_verifications ("
+            " project_id TEXT NOT NULL,"
+            " task_hash TEXT NOT NULL,"
+            " before_hash TEXT NOT NULL,"
+            " after_hash TEXT NOT NULL,"
+            " claimed INTEGER NOT NULL,"
+            " task TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " evidence TEXT,"
+            " material_substitution TEXT,"
+            " model TEXT,"
+            " verified_at REAL NOT NULL,"
+            " PRIMARY KEY (project_id, task_hash, before_hash, after_hash, claimed))"
+        )
+        self._conn.commit()
+
+    def get(self, project_id, task, before_hash, after_hash, claimed):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM task_verifications WHERE project_id = ? AND task_hash = ? AND before_hash = ? "
+                "AND after_hash = ? AND claimed = ?",
+                (project_id, task_hash(task), before_hash, after_hash, int(claimed)),
+            ).fetchone()
+        return self._row_to_verdict(row) if row is not None else None
+
+    def find_completed(self, project_id, task, before_hash, claimed):
+        """Most recent 'completed' verdict for the task from any 'after' photo of the project."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM task_verifications WHERE project_id = ? AND task_hash = ? AND before_hash = ? "
+                "AND claimed = ? AND status IN (?, ?) ORDER BY verified_at DESC LIMIT 1",
+                (project_id, task_hash(task), before_hash, int(claimed), *COMPLETED_STATUSES),
+            ).fetchone()
+        return self._row_to_verdict(row) if row is not None else None
+
+    def put(self, project_id, before_hash, after_hash, verdict, model_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO task_verifications (project_id, task_hash, before_hash, after_hash, claimed, "
+                "task, status, evidence, material_substitution, model, verified_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (project_id, task_hash(verdict["task"]), before_hash, after_hash, int(verdict["claimed"]),
+                 verdict["task"], verdict["status"], verdict["evidence"], verdict["material_substitution"],
+                 model_id, time.time()),
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _row_to_verdict(row):
+        return {
+            "task": row["task"],
+            "claimed": bool(row["claimed"]),
+            "status": row["status"],
+            "evidence": row["evidence"],
+            "material_substitution": row["material_substitution"],
+            "after_hash": row["after_hash"],
+            "verified_at": row["verified_at"],
+        }
@@ -0,0 +1,92 @@
+# tests/test_batch_inspection.py
+"""Batch manifests and payment-decision summaries. Run with ``python -m unittest discover tests``."""
+import unittest
+
+from batch_inspection import (
+    DECISION_FAILS, DECISION_MEETS, DECISION_PARTIAL, DECISION_UNDETERMINED, ManifestError, combine_decisions,
+    extract_payment_decision, parse_manifest,
+)
+
+
+class ParseManifestTest(unittest.TestCase):
+    def test_items_inherit_manifest_defaults(self):
+        items = parse_manifest({
+            "requested_tasks": "- Mow lawn",
+            "contractor_accomplishments": "Mowed.",
+            "items": [
+                {"id": "12 Elm St", "before_image_id": "b1", "after_image_ids": ["a1", "a2"]},
+                {"before_image": "data:image/jpeg;base64,AA", "after_image_id": "a3", "requested_tasks": "- Edge walk"},
+            ],
+        }, max_items=10)
+        self.assertEqual(items[0]["id"], "12 Elm St")
+        self.assertEqual(items[0]["before"], {"before_image_id": "b1"})
+        self.assertEqual(items[0]["after_sources"], [{"after_image_id": "a1"}, {"after_image_id": "a2"}])
+        self.assertEqual(items[0]["contractor_accomplishments"], "Mowed.")
+        self.assertEqual(items[1]["id"], "1")
+        self.assertEqual(items[1]["requested_tasks"], "- Edge walk")
+        self.assertEqual(items[1]["contractor_selected_tasks"], [])
+
+    def test_all_after_photo_fields_are_collected(self):
+        items = parse_manifest({"requested_tasks": "- Mow", "items": [{
+            "before_image_id": "b", "after_image": "data:1", "after_image_id": "i1",
+            "after_images": ["data:2"], "after_image_ids": ["i2"],
+        }]}, max_items=1)
+        self.assertEqual(items[0]["after_sources"], [
+            {"after_image": "data:1"}, {"after_image_id": "i1"}, {"after_image": "data:2"}, {"after_image_id": "i2"},
+        ])
+
+    def test_invalid_manifests_are_rejected(self):
+        item = {"before_image_id": "b", "after_image_id": "a"}
+        for manifest in (
+            None,
+            [],
+            {"items": []},
+            {"items": "x"},
+            {"items": ["x"], "requested_tasks": "- Mow"},
+            {"items": [{"after_image_id": "a"}], "requested_tasks": "- Mow"},
+            {"items": [{"before_image_id": "b"}], "requested_tasks": "- Mow"},
+            {"items": [{**item, "after_image_ids": ["a", 5]}], "requested_tasks": "- Mow"},
+            {"items": [item]},
+            {"items": [item, item, item], "requested_tasks": "- Mow"},
+        ):
+            with self.assertRaises(ManifestError, msg=manifest):
+                parse_manifest(manifest, max_items=2)
+
+
+class ExtractPaymentDecisionTest(unittest.TestCase):
+    def test_each_decision_phrase(self):
+        for text, decision in (
+            ("C. **PAYMENT VALIDATION DECISION:** Meets Requirements for Payment", DECISION_MEETS),
+            ("C. **PAYMENT VALIDATION DECISION:** Partially Meets Requirements - Further Action Needed", DECISION_PARTIAL),
+            ("C. **PAYMENT VALIDATION DECISION:** Does Not Meet Requirements - Payment Withheld", DECISION_FAILS),
+        ):
+            self.assertEqual(extract_payment_decision(text), decision)
+
+    def test_earliest_phrase_in_the_decision_section_wins(self):
+        report = (
+            "A. The mulch does not meet requirements yet.\n"
+            "C. PAYMENT VALIDATION DECISION: Partially Meets Requirements - Further Action Needed. "
+            "It does not meet requirements for payment in full."
+        )
+        self.assertEqual(extract_payment_decision(report), DECISION_PARTIAL)
+
+    def test_report_without_a_decision_is_undetermined(self):
+        for report in (None, "", "The lawn looks mowed.", "C. PAYMENT VALIDATION DECISION: Undetermined - Manual Review Needed"):
+            self.assertEqual(extract_payment_decision(report), DECISION_UNDETERMINED)
+
+
+class CombineDecisionsTest(unittest.TestCase):
+    def test_unanimous_decision_carries_over(self):
+        self.assertEqual(combine_decisions([DECISION_MEETS, DECISION_MEETS]), DECISION_MEETS)
+        self.assertEqual(combine_decisions([DECISION_FAILS]), DECISION_FAILS)
+
+    def test_mixed_decisions_are_partial(self):
+        self.assertEqual(combine_decisions([DECISION_MEETS, DECISION_FAILS]), DECISION_PARTIAL)
+
+    def test_any_undetermined_photo_needs_review(self):
+        self.assertEqual(combine_decisions([DECISION_MEETS, DECISION_UNDETERMINED]), DECISION_UNDETERMINED)
+        self.assertEqual(combine_decisions([]), DECISION_UNDETERMINED)
+
+
+if __name__ == "__main__":
+    unittest.main()
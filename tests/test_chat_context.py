@@ -0,0 +1,79 @@
+# tests/test_chat_context.py
+"""Rolling conversation summary bounds. Run with ``python -m unittest discover tests``."""
+import unittest
+
+from chat_context import ChatContextManager
+
+
+def conversation(length):
+    return [
+        {"role": "user" if index % 2 == 0 else "ai", "message": f"Message {index} about the hedge."}
+        for index in range(length)
+    ]
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous_summary, messages):
+        self.calls.append(messages)
+        return f"{previous_summary}|{messages[0]['message']}..{messages[-1]['message']}"
+
+
+def build(history, carried=None, **kwargs):
+    summarize = RecordingSummarizer()
+    manager = ChatContextManager(6000, summarize, **kwargs)
+    context = {"conversation_summary": carried} if carried is not None else {}
+    _, _, usage = manager.build("Was the hedge trimmed?", context, history)
+    return usage, summarize.calls
+
+
+class RollingSummaryTest(unittest.TestCase):
+    def test_calls_per_request_are_capped(self):
+        usage, calls = build(conversation(60))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(usage["summary_calls"], 2)
+        self.assertEqual(usage["summarized_messages"] + usage["unsummarized_messages"], 54)
+
+    def test_huge_history_does_not_recurse_or_fan_out(self):
+        usage, calls = build(conversation(7000))
+        self.assertLessEqual(len(calls), 2)
+        self.assertIsNotNone(usage["conversation_summary"])
+
+    def test_old_messages_beyond_the_read_window_are_not_summarized(self):
+        _, calls = build(conversation(60), max_history_messages=20, max_summary_calls=100)
+        summarized = [message for chunk in calls for message in chunk]
+        self.assertTrue(all(int(message["message"].split()[1]) >= 40 for message in summarized))
+
+    def test_carried_summary_needs_only_the_new_chunk(self):
+        history = conversation(30)
+        first_usage, _ = build(history, max_summary_calls=100)
+        history += conversation(36)[30:]
+        usage, calls = build(history, first_usage["conversation_summary"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(usage["unsummarized_messages"], 0)
+        self.assertTrue(usage["conversation_summary"]["text"].startswith(first_usage["conversation_summary"]["text"]))
+
+    def test_unchanged_history_with_carried_summary_makes_no_calls(self):
+        history = conversation(30)
+        first_usage, _ = build(history, max_summary_calls=100)
+        _, calls = build(history, first_usage["conversation_summary"])
+        self.assertEqual(calls, [])
+
+    def test_carried_summary_for_edited_history_is_ignored(self):
+        history = conversation(30)
+        first_usage, _ = build(history, max_summary_calls=100)
+        history[20] = {"role": "user", "message": "Something else entirely."}
+        usage, calls = build(history, first_usage["conversation_summary"])
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(usage["conversation_summary"]["text"].startswith(first_usage["conversation_summary"]["text"]))
+
+    def test_malformed_carried_summary_is_ignored(self):
+        for carried in ({"messages": "6", "text": "x", "digest": "y"}, {"messages": 7, "text": "x"}, "summary"):
+            _, calls = build(conversation(20), carried)
+            self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
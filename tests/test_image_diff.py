@@ -0,0 +1,75 @@
+# tests/test_image_diff.py
+"""No-change thresholds of the before/after prefilter. Run with ``python -m unittest discover tests``."""
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+import image_diff
+from image_diff import IMAGE_DIFF_GRID, compare_images
+from image_processing import pil_to_base64_data_url
+
+WIDTH, HEIGHT = 1200, 900
+SHRUB_CELL = (3, 5)
+SHRUB_RADIUS = 50
+
+
+def garden_photo(seed, shrub_radius=SHRUB_RADIUS):
+    """A textured lawn with one dark shrub centred in grid cell SHRUB_CELL."""
+    rng = np.random.default_rng(seed)
+    blotches = Image.fromarray((rng.random((HEIGHT // 30, WIDTH // 30, 3)) * 255).astype("uint8"))
+    lawn = np.asarray(blotches.resize((WIDTH, HEIGHT), Image.BICUBIC), dtype=np.float32) * 0.4
+    lawn += np.array([40, 110, 40]) * 0.6 + rng.normal(0, 12, (HEIGHT, WIDTH, 1))
+    photo = Image.fromarray(np.clip(lawn, 0, 255).astype("uint8"))
+    cell_width, cell_height = WIDTH // IMAGE_DIFF_GRID, HEIGHT // IMAGE_DIFF_GRID
+    x = cell_width * SHRUB_CELL[1] + cell_width // 2
+    y = cell_height * SHRUB_CELL[0] + cell_height // 2
+    ImageDraw.Draw(photo).ellipse(
+        (x - shrub_radius, y - shrub_radius, x + shrub_radius, y + shrub_radius), fill=(20, 70, 25),
+    )
+    return photo
+
+
+def jpeg_data_url(photo, quality=90):
+    return pil_to_base64_data_url(photo, format="JPEG", quality=quality)
+
+
+class NoChangeThresholdTest(unittest.TestCase):
+    SEEDS = range(4)
+
+    def setUp(self):
+        image_diff._comparison_cache.clear()
+
+    def test_identical_reupload_is_near_identical(self):
+        upload = jpeg_data_url(garden_photo(0))
+        evidence = compare_images(upload, upload)
+        self.assertTrue(evidence["identical"])
+        self.assertTrue(evidence["near_identical"])
+
+    def test_recompressed_copy_is_near_identical(self):
+        for seed in self.SEEDS:
+            photo = garden_photo(seed)
+            original = jpeg_data_url(photo, quality=95)
+            for copy in (
+                jpeg_data_url(photo, quality=40),
+                jpeg_data_url(photo.resize((WIDTH // 2, HEIGHT // 2), Image.LANCZOS), quality=70),
+                jpeg_data_url(ImageEnhance.Brightness(photo).enhance(1.1)),
+            ):
+                evidence = compare_images(original, copy)
+                self.assertFalse(evidence["identical"])
+                self.assertTrue(evidence["near_identical"], (seed, evidence["max_region_difference"]))
+                self.assertEqual(evidence["hotspots"], [])
+
+    def test_shrub_trimmed_within_one_cell_is_a_change(self):
+        for seed in self.SEEDS:
+            for trimmed_radius in (42, 38):
+                evidence = compare_images(
+                    jpeg_data_url(garden_photo(seed)), jpeg_data_url(garden_photo(seed, trimmed_radius)),
+                )
+                self.assertFalse(evidence["near_identical"], (seed, trimmed_radius, evidence["max_region_difference"]))
+                hotspots = [(hotspot["row"], hotspot["col"]) for hotspot in evidence["hotspots"]]
+                self.assertEqual(hotspots[:1], [SHRUB_CELL])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+# tests/test_jobs.py
+"""Jobs lost with their worker. Run with ``python -m unittest discover tests``."""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, LOST_JOB_ERROR, JobQueue, JobStore
+
+
+def wait_for(job_queue, job_id, statuses=(JOB_SUCCEEDED, JOB_FAILED), timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+
+class LostJobTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A job created straight on the store has no queue refreshing its heartbeat,
+        # like one whose worker process died
+        self.store = JobStore(os.path.join(directory.name, "jobs.sqlite3"), lost_after_seconds=0.05)
+
+    def test_fresh_job_keeps_its_status(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        self.assertEqual(self.store.get(job["id"])["status"], JOB_QUEUED)
+
+    def test_stale_running_job_is_reported_failed(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        self.store.mark_running(job["id"])
+        time.sleep(0.06)
+        lost = self.store.get(job["id"])
+        self.assertEqual(lost["status"], JOB_FAILED)
+        self.assertEqual(lost["error"], LOST_JOB_ERROR)
+        self.assertIsNotNone(lost["finished_at"])
+
+    def test_stale_queued_job_is_reported_failed(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        time.sleep(0.06)
+        self.assertEqual(self.store.get(job["id"])["status"], JOB_FAILED)
+
+    def test_finished_job_is_not_failed_later(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        self.store.mark_succeeded(job["id"], {"report": "done"})
+        time.sleep(0.06)
+        self.assertEqual(self.store.get(job["id"])["status"], JOB_SUCCEEDED)
+
+    def test_lost_job_stays_failed_if_its_worker_comes_back(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        time.sleep(0.06)
+        self.store.get(job["id"])
+        self.assertFalse(self.store.mark_running(job["id"]))
+        self.assertFalse(self.store.mark_succeeded(job["id"], {"report": "late"}))
+        lost = self.store.get(job["id"])
+        self.assertEqual(lost["status"], JOB_FAILED)
+        self.assertIsNone(lost["result"])
+
+    def test_resubmission_after_loss_creates_a_new_job(self):
+        job, _ = self.store.create_or_get_active("final_report", "inputs")
+        self.store.mark_running(job["id"])
+        time.sleep(0.06)
+        self.store.get(job["id"])
+        again, created = self.store.create_or_get_active("final_report", "inputs")
+        self.assertTrue(created)
+        self.assertNotEqual(again["id"], job["id"])
+        self.assertNotIn(again["status"], (JOB_FAILED, JOB_RUNNING))
+
+
+class HeartbeatTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jobs.sqlite3")
+        self.store = JobStore(self.path, lost_after_seconds=0.1)
+
+    def test_long_running_job_is_kept_alive(self):
+        job_queue = JobQueue(self.store, max_workers=1, heartbeat_seconds=0.02)
+        job, _ = job_queue.submit("final_report", {"n": 1}, lambda payload: time.sleep(0.4) or payload)
+        wait_for(job_queue, job["id"], statuses=(JOB_RUNNING,))
+        time.sleep(0.2)
+        self.assertEqual(job_queue.get(job["id"])["status"], JOB_RUNNING)
+        self.assertEqual(wait_for(job_queue, job["id"])["status"], JOB_SUCCEEDED)
+
+    def test_job_queued_behind_others_is_kept_alive(self):
+        job_queue = JobQueue(self.store, max_workers=1, heartbeat_seconds=0.02)
+        release = threading.Event()
+        first, _ = job_queue.submit("final_report", {"n": 1}, lambda payload: release.wait(5) and payload)
+        second, _ = job_queue.submit("final_report", {"n": 2}, lambda payload: payload)
+        time.sleep(0.3)
+        self.assertEqual(job_queue.get(second["id"])["status"], JOB_QUEUED)
+        release.set()
+        self.assertEqual(wait_for(job_queue, first["id"])["status"], JOB_SUCCEEDED)
+        self.assertEqual(wait_for(job_queue, second["id"])["result"], {"n": 2})
+
+    def test_database_from_before_heartbeats_is_upgraded(self):
+        old_path = self.path + ".old"
+        conn = sqlite3.connect(old_path)
+        conn.execute(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, input_hash TEXT NOT NULL, status TEXT NOT NULL,"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        conn.execute("INSERT INTO jobs (id, kind, input_hash, status, created_at) VALUES ('old', 'k', 'h', 'running', 0)")
+        conn.commit()
+        conn.close()
+        store = JobStore(old_path)
+        self.assertEqual(store.get("old")["status"], JOB_FAILED)
+        job, created = store.create_or_get_active("k", "h")
+        self.assertTrue(created)
+
+
+class ShutdownTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.job_queue = JobQueue(JobStore(os.path.join(directory.name, "jobs.sqlite3")), max_workers=1)
+
+    def test_jobs_that_finish_in_time_succeed(self):
+        first, _ = self.job_queue.submit("final_report", {"n": 1}, lambda payload: time.sleep(0.1) or payload)
+        second, _ = self.job_queue.submit("final_report", {"n": 2}, lambda payload: payload)
+        self.job_queue.shutdown(timeout=2)
+        self.assertEqual(self.job_queue.get(first["id"])["status"], JOB_SUCCEEDED)
+        self.assertEqual(self.job_queue.get(second["id"])["status"], JOB_SUCCEEDED)
+
+    def test_unfinished_jobs_are_failed_and_stay_failed(self):
+        release = threading.Event()
+        running, _ = self.job_queue.submit("final_report", {"n": 1}, lambda payload: release.wait(5) and payload)
+        queued, _ = self.job_queue.submit("final_report", {"n": 2}, lambda payload: payload)
+        wait_for(self.job_queue, running["id"], statuses=(JOB_RUNNING,))
+        self.job_queue.shutdown(timeout=0.1)
+        for job in (running, queued):
+            failed = self.job_queue.get(job["id"])
+            self.assertEqual(failed["status"], JOB_FAILED)
+            self.assertEqual(failed["error"], LOST_JOB_ERROR)
+        release.set()
+        time.sleep(0.1)
+        self.assertEqual(self.job_queue.get(running["id"])["status"], JOB_FAILED)
+
+
+class JobItemsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = JobStore(os.path.join(directory.name, "jobs.sqlite3"))
+
+    def test_items_are_kept_in_completion_order_per_job(self):
+        job, _ = self.store.create_or_get_active("batch_inspection", "first")
+        other, _ = self.store.create_or_get_active("batch_inspection", "second")
+        for index in (2, 0, 1):
+            self.store.add_item(job["id"], {"index": index})
+        self.store.add_item(other["id"], {"index": 9})
+        self.assertEqual([item["index"] for item in self.store.get_items(job["id"])], [2, 0, 1])
+        self.assertEqual(self.store.get_items(job["id"], start=2), [{"index": 1}])
+        self.assertEqual(self.store.get_items(other["id"]), [{"index": 9}])
+
+
+if __name__ == "__main__":
+    unittest.main()
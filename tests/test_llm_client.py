@@ -0,0 +1,175 @@
+# tests/test_llm_client.py
+"""Circuit breaker trial-call outcomes. Run with ``python -m unittest discover tests``."""
+import time
+import types
+import unittest
+
+import httpx
+from openai import APITimeoutError, BadRequestError, InternalServerError, RateLimitError
+
+from llm_client import CircuitBreaker, LLMClient, LLMUnavailableError
+
+MODEL = "test-model"
+
+
+def status_error(error_class, status_code):
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://upstream/v1/chat/completions"))
+    return error_class(f"status {status_code}", response=response, body=None)
+
+
+def half_open_breaker(**kwargs):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05, **kwargs)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    return breaker
+
+
+class FakeCompletions:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        if kwargs.get("stream"):
+            return iter(self.outcome)
+        return self.outcome
+
+
+def client_with_half_open_breaker(outcome, **kwargs):
+    client = LLMClient(api_key="test", base_url="http://upstream/v1", max_retries=0,
+                       circuit_failure_threshold=1, circuit_reset_seconds=0.05, **kwargs)
+    client._client.chat = types.SimpleNamespace(completions=FakeCompletions(outcome))
+    breaker = client.breaker_for(MODEL)
+    breaker.record_failure()
+    time.sleep(0.06)
+    return client, breaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_trial_success_closes(self):
+        breaker = half_open_breaker()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_trial_failure_reopens(self):
+        breaker = half_open_breaker()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_only_one_trial_at_a_time(self):
+        breaker = half_open_breaker()
+        self.assertFalse(breaker.allow())
+
+    def test_released_trial_allows_next_call_as_trial(self):
+        breaker = half_open_breaker()
+        breaker.release_trial()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_abandoned_trial_times_out(self):
+        breaker = half_open_breaker(trial_timeout=0.05)
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+
+class LLMClientTrialTest(unittest.TestCase):
+    def test_successful_trial_closes(self):
+        response = types.SimpleNamespace(usage=None)
+        client, breaker = client_with_half_open_breaker(response)
+        self.assertIs(client.create(MODEL, []), response)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_upstream_error_status_reopens(self):
+        client, breaker = client_with_half_open_breaker(status_error(InternalServerError, 503))
+        with self.assertRaises(InternalServerError):
+            client.create(MODEL, [])
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_non_retryable_error_closes(self):
+        # e.g. the endpoint rejecting a response_format: the upstream is up and answering
+        client, breaker = client_with_half_open_breaker(status_error(BadRequestError, 400))
+        with self.assertRaises(BadRequestError):
+            client.create(MODEL, [])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_local_error_releases_trial(self):
+        client, breaker = client_with_half_open_breaker(TypeError("bad argument"))
+        with self.assertRaises(TypeError):
+            client.create(MODEL, [])
+        self.assertTrue(breaker.allow())
+
+    def test_stream_cancelled_by_consumer_closes(self):
+        chunk = types.SimpleNamespace(usage=None)
+        client, breaker = client_with_half_open_breaker([chunk, chunk])
+        stream = client.stream(MODEL, [])
+        next(stream)
+        # The client disconnects mid-stream (GeneratorExit inside LLMClient.stream)
+        stream.close()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stream_non_retryable_error_closes(self):
+        client, breaker = client_with_half_open_breaker(status_error(BadRequestError, 422))
+        with self.assertRaises(BadRequestError):
+            list(client.stream(MODEL, []))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rate_limit_timeout_releases_trial(self):
+        client, breaker = client_with_half_open_breaker(
+            types.SimpleNamespace(usage=None), rate_limits={MODEL: "0.001:1"}, rate_limit_timeout=0,
+        )
+        client._buckets[MODEL]._tokens = 0
+        with self.assertRaises(LLMUnavailableError):
+            client.create(MODEL, [])
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+
+class BreakerFailureKindTest(unittest.TestCase):
+    def client_failing_with(self, error):
+        client = LLMClient(api_key="test", base_url="http://upstream/v1", max_retries=0,
+                           circuit_failure_threshold=5, circuit_reset_seconds=30)
+        completions = FakeCompletions(error)
+        client._client.chat = types.SimpleNamespace(completions=completions)
+        return client, completions
+
+    def call_repeatedly(self, client, error_class, times):
+        for _ in range(times):
+            with self.assertRaises(error_class):
+                client.create(MODEL, [])
+
+    def test_throttling_never_opens_the_circuit(self):
+        client, completions = self.client_failing_with(status_error(RateLimitError, 429))
+        self.call_repeatedly(client, RateLimitError, 8)
+        self.assertEqual(completions.calls, 8)
+        self.assertEqual(client.breaker_for(MODEL).state, CircuitBreaker.CLOSED)
+
+    def test_server_errors_open_the_circuit(self):
+        client, completions = self.client_failing_with(status_error(InternalServerError, 503))
+        self.call_repeatedly(client, InternalServerError, 5)
+        with self.assertRaises(LLMUnavailableError):
+            client.create(MODEL, [])
+        self.assertEqual(completions.calls, 5)
+
+    def test_timeouts_open_the_circuit(self):
+        client, _ = self.client_failing_with(APITimeoutError(httpx.Request("POST", "http://upstream/v1/chat/completions")))
+        self.call_repeatedly(client, APITimeoutError, 5)
+        self.assertEqual(client.breaker_for(MODEL).state, CircuitBreaker.OPEN)
+
+    def test_throttled_trial_closes(self):
+        client, breaker = client_with_half_open_breaker(status_error(RateLimitError, 429))
+        with self.assertRaises(RateLimitError):
+            client.create(MODEL, [])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
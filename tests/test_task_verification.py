@@ -0,0 +1,123 @@
+# tests/test_task_verification.py
+"""Verdict parsing and payment decisions. Run with ``python -m unittest discover tests``."""
+import json
+import unittest
+
+from batch_inspection import DECISION_FAILS, DECISION_UNDETERMINED, extract_payment_decision
+from task_verification import (
+    DECISION_FAILS_TEXT, DECISION_MEETS_TEXT, DECISION_PARTIAL_TEXT, DECISION_UNDETERMINED_TEXT, STATUS_COMPLETED,
+    STATUS_NOT_COMPLETED, STATUS_PARTIAL, STATUS_UNVERIFIED, VerdictStreamParser, assemble_final_report,
+    parse_verdicts, payment_decision_text,
+)
+
+TASKS = ["Mow lawn", "Mulch beds"]
+
+
+def verdict(task, status, claimed=True):
+    return {"task": task, "claimed": claimed, "status": status, "evidence": "", "material_substitution": None}
+
+
+class ParseVerdictsTest(unittest.TestCase):
+    def test_schema_reply(self):
+        content = json.dumps({"tasks": [
+            {"task_number": 1, "status": STATUS_COMPLETED, "evidence": "Lawn is short.", "material_substitution": None},
+            {"task_number": 2, "status": STATUS_PARTIAL, "evidence": "One bed mulched.", "material_substitution": "bark"},
+        ]})
+        verdicts = parse_verdicts(content, TASKS)
+        self.assertEqual(verdicts[1]["status"], STATUS_COMPLETED)
+        self.assertEqual(verdicts[2]["material_substitution"], "bark")
+
+    def test_json_wrapped_in_prose(self):
+        content = 'Here you go: {"tasks": [{"task_number": 2, "status": "not_completed", "evidence": "Bare soil."}]} Done.'
+        self.assertEqual(parse_verdicts(content, TASKS), {
+            2: {"status": STATUS_NOT_COMPLETED, "evidence": "Bare soil.", "material_substitution": None},
+        })
+
+    def test_unusable_replies_give_no_verdicts(self):
+        for content in (None, "", "not json", '{"tasks": [{"task_number": 1, "status": "compl', "[1, 2]", '{"tasks": "x"}'):
+            self.assertEqual(parse_verdicts(content, TASKS), {}, content)
+
+    def test_invalid_entries_are_dropped(self):
+        content = json.dumps({"tasks": [
+            {"task_number": 0, "status": STATUS_COMPLETED},
+            {"task_number": 3, "status": STATUS_COMPLETED},
+            {"task_number": "1", "status": STATUS_COMPLETED},
+            {"task_number": 1, "status": "done"},
+            {"task_number": 2, "status": STATUS_UNVERIFIED},
+            "junk",
+        ]})
+        self.assertEqual(parse_verdicts(content, TASKS), {})
+
+
+class VerdictStreamParserTest(unittest.TestCase):
+    REPLY = json.dumps({"tasks": [
+        {"task_number": 1, "status": STATUS_COMPLETED, "evidence": "Stripes {and} [edges].", "material_substitution": None},
+        {"task_number": 2, "status": STATUS_NOT_COMPLETED, "evidence": "Bare soil.", "material_substitution": None},
+    ]})
+
+    def feed_in_chunks(self, parser, text, size):
+        arrivals = []
+        for start in range(0, len(text), size):
+            arrivals.extend((start + size, number) for number, _ in parser.feed(text[start:start + size]))
+        return arrivals
+
+    def test_each_verdict_is_reported_once_it_closes(self):
+        parser = VerdictStreamParser(TASKS)
+        arrivals = self.feed_in_chunks(parser, self.REPLY, 7)
+        self.assertEqual([number for _, number in arrivals], [1, 2])
+        first_closes = self.REPLY.index("null}") + len("null}")
+        self.assertLess(arrivals[0][0], first_closes + 7)
+        self.assertEqual(parser.finish(), [])
+        self.assertEqual(parser.verdicts, parse_verdicts(self.REPLY, TASKS))
+
+    def test_truncated_reply_keeps_completed_entries(self):
+        parser = VerdictStreamParser(TASKS)
+        truncated = self.REPLY[:self.REPLY.index('"Bare')]
+        self.feed_in_chunks(parser, truncated, 5)
+        parser.finish()
+        self.assertEqual(list(parser.verdicts), [1])
+
+    def test_reply_wrapped_in_prose(self):
+        parser = VerdictStreamParser(TASKS)
+        self.feed_in_chunks(parser, "Here is the JSON:\n" + self.REPLY + "\nThanks.", 11)
+        self.assertEqual(sorted(parser.verdicts), [1, 2])
+
+
+class PaymentDecisionTest(unittest.TestCase):
+    def test_all_completed_meets(self):
+        verdicts = [verdict(task, STATUS_COMPLETED) for task in TASKS]
+        self.assertEqual(payment_decision_text(verdicts), DECISION_MEETS_TEXT)
+
+    def test_some_completed_is_partial(self):
+        verdicts = [verdict("Mow lawn", STATUS_COMPLETED), verdict("Mulch beds", STATUS_NOT_COMPLETED)]
+        self.assertEqual(payment_decision_text(verdicts), DECISION_PARTIAL_TEXT)
+
+    def test_nothing_completed_fails(self):
+        verdicts = [verdict(task, STATUS_NOT_COMPLETED) for task in TASKS]
+        self.assertEqual(payment_decision_text(verdicts), DECISION_FAILS_TEXT)
+
+    def test_unverified_task_leaves_the_decision_undetermined(self):
+        self.assertEqual(payment_decision_text([verdict("Mow lawn", STATUS_UNVERIFIED)]), DECISION_UNDETERMINED_TEXT)
+        verdicts = [verdict("Mow lawn", STATUS_NOT_COMPLETED), verdict("Mulch beds", STATUS_UNVERIFIED)]
+        self.assertEqual(payment_decision_text(verdicts), DECISION_UNDETERMINED_TEXT)
+
+    def test_report_with_unverified_task_withholds_no_payment(self):
+        report = assemble_final_report([verdict("Mow lawn", STATUS_UNVERIFIED)], "Mowed it.")
+        self.assertEqual(extract_payment_decision(report), DECISION_UNDETERMINED)
+        self.assertNotIn("Outstanding tasks", report)
+        self.assertNotIn("Claimed as completed but not verified", report)
+
+    def test_unverified_tasks_are_not_listed_as_outstanding(self):
+        report = assemble_final_report(
+            [verdict("Mow lawn", STATUS_NOT_COMPLETED), verdict("Mulch beds", STATUS_UNVERIFIED)], "",
+        )
+        self.assertIn("Outstanding tasks: Mow lawn.", report)
+        self.assertIn("No usable verdict for: Mulch beds.", report)
+
+    def test_report_decision_round_trips(self):
+        report = assemble_final_report([verdict(task, STATUS_NOT_COMPLETED) for task in TASKS], "")
+        self.assertEqual(extract_payment_decision(report), DECISION_FAILS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,11 @@
+# wsgi.py
+"""WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module only builds the Flask app; the LLM client, thread pools
+and stores are created in each worker on first use (or by a /readyz probe).
+"""
+from app import create_app
+
+app = create_app()